@@ -1,7 +1,7 @@
 import argparse
 import sys
 import os
-from utils.etc import camel_code
+from putils.etc import camel_code
 
 def generate_template(name):
     fname = "algorithms/{}.py".format(name)
@@ -1,15 +1,69 @@
-import os, sys, logging, argparse, math
-from flask import Flask, json, jsonify, abort, make_response, request
+import os, sys, glob, logging, argparse, math, atexit, threading, time, itertools
+from collections import deque, OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import Flask, json, jsonify, abort, make_response, request, g
 from flask_restful import Api, Resource, reqparse
+from werkzeug.serving import make_server
 from modules.data_manager import DataManager
+from modules.dataset_log import SYNC_EVERY
+from modules.dataset_loader import load_dataset
 from modules.model_manager import ModelManager
 from modules.evaluator import ModelEvaluator
+from modules.rolling import RollingMetrics, check_windows
+from modules.drift import make_detector
+from modules.retention import History, Retainer, make_policy
 from putils.autils import init_algorithms
+from putils.response import negotiate, encode, FORMATS, ENCODINGS
+from putils.prefork import serve
+from putils import tracing
+from putils.logutil import setup_logging, file_logger, stop_logging
 
 THRESHOLD = 0.20
+RETRAIN_WINDOW = 1000   # number of the recent instances used for retraining on drift
+RETRAIN_COOLDOWN = 300  # minimum seconds between two retrainings on drift
+MAX_HORIZON = 10000     # maximum number of steps of a forecast
+SHADOW_WORKERS = 4      # threads evaluating the shadow models
+SHADOW_BACKLOG = 10000  # maximum number of instances waiting for a shadow model
+KEEP_VERSIONS = 3       # previous trained versions of a model kept for rollback
+
+# The response bodies cached per model: the encoded representations (<kind>.<format>.<encoding>)
+# of the parameter-free kinds; the kinds made from the query string are built on every request
+CACHED_KINDS = ["result", "detailed_evaluation"]
+CACHED_VARIANTS = {"{}.{}.{}".format(kind, fmt, encoding) for kind in CACHED_KINDS
+                   for fmt in FORMATS for encoding in ENCODINGS + ["identity"]}
+
+# Per-request logs (sampled with --log-sample); their arguments are formatted only when a record is emitted
+request_log = logging.getLogger("ai.request")
+SAMPLED_LOGGERS = ["ai.request", "werkzeug"]
+
+# The per-model state of AIModule (attribute names), released when a model is evicted or deleted
+MODEL_STATE = ["models", "training", "testing", "algorithms", "dimensions", "indexes", "results", "versions", "generations", "caches",
+               "pending", "rolling", "locks", "drift", "drift_configs", "retraining", "retrains", "retainers",
+               "retention_configs", "model_versions", "shadow_queues", "shadow_locks", "shadow_dropped"]
+
+# A shadow model (<primary>@<name>) is cached, evicted and loaded together with its primary model
+def get_unit(name):
+    return name.split("@", 1)[0]
 
 class AIModule:
-    def __init__(self):
+    # If datadir is given, the training/testing/result datasets of each model
+    # are persisted as dataset logs there and reloaded by restore_models()
+    # retention: default retention policy of the models ({"rows": N, "seconds": T, "spill": bool})
+    # max_models, max_memory: caps of the model cache (number of primary models, estimated bytes)
+    def __init__(self, datadir=None, sync_every=SYNC_EVERY, keep_versions=KEEP_VERSIONS, retention=None, max_models=None, max_memory=None,
+                 dataset_root=None):
+        self.datadir = datadir
+        # The directory of the dataset files the models can be trained from (no file is loaded if not given)
+        self.dataset_root = os.path.realpath(dataset_root) if dataset_root else None
+        self.sync_every = sync_every
+        self.keep_versions = keep_versions
+        self.retention = retention
+        self.max_models = max_models
+        self.max_memory = max_memory
+        if (max_models or max_memory) and not datadir:
+            logging.warning("The models cannot be evicted without a dataset directory; the model cache is not capped")
+            self.max_models, self.max_memory = None, None
         self.models = {}
         self.training = {}
         self.testing = {}
@@ -17,9 +71,51 @@ class AIModule:
         self.dimensions = {}
         self.indexes = {}
         self.results = {}
+        self.versions = {}
+        self.generations = {}
+        self.caches = {}
+        self.pending = {}
+        self.rolling = {}
+        self.locks = {}
+        self.drift = {}
+        self.drift_configs = {}
+        self.retraining = {}
+        self.retrains = {}
+        self.retainers = {}
+        self.retention_configs = {}
+
+        # Trained versions of each model: {"current": version, "next": version, "entries": {version: entry}}
+        #   entry: version, trained (time), source, model (the ModelManager, None if only kept on disk)
+        self.model_versions = {}
+
+        # Shadow models (primary -> {shadow name -> model name}) fed off the request path
+        self.shadows = {}
+        self.shadow_queues = {}
+        self.shadow_locks = {}
+        # Instances dropped (the oldest ones) because the backlog of a shadow model was full
+        self.shadow_dropped = {}
+        self.shadow_dropped_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=SHADOW_WORKERS, thread_name_prefix="shadow")
+
+        # Model cache: the resident primary models in the order of their last use with their estimated
+        # footprints (bytes, shadow models included), and the metadata of the models stored in datadir
+        # but not resident (evicted, or not used since the start), which has_model() loads again
+        self.resident = OrderedDict()
+        self.catalog = {}
+        self.pinned = Counter()     # models in use (requests, training), never evicted
+        self.cache_lock = threading.RLock()
         self.evaluator = ModelEvaluator(threshold=THRESHOLD)
 
-    def add_model(self, name, algorithm, dimension, index):
+        # Distinguishes the ETags of this process from the ones issued before a restart
+        self.instance = "{:x}".format(int(time.time() * 1000))
+        # Numbers every creation (or reload) of a model, whose version counter starts again from 0
+        self.created = itertools.count(1)
+
+    def add_model(self, name, algorithm, dimension, index, windows=None, time_windows=None, drift=None, retention=None):
+        check_windows(windows, time_windows)
+        detector = make_detector(drift)
+        retention = retention if retention is not None else self.retention
+        policy = make_policy(retention)
         model = ModelManager(algorithm)
 
         ret = None
@@ -28,18 +124,460 @@ class AIModule:
             self.algorithms[name] = algorithm
             self.dimensions[name] = dimension
             self.indexes[name] = index
-            self.training[name] = DataManager()
-            self.testing[name] = DataManager()
-            self.results[name] = DataManager()
-            self.results[name].add_data(-1)
+            self.training[name] = DataManager(self.get_dataset_path(name, "training"), dimension, self.sync_every, model.get_sequence_length() is not None)
+            # The testing values and the predictions keep their full precision in memory (/result)
+            self.testing[name] = DataManager(self.get_dataset_path(name, "testing"), dimension, self.sync_every, True, np.float64)
+            self.results[name] = DataManager(self.get_dataset_path(name, "results"), None, self.sync_every, True, np.float64)
+
+            # A re-created model starts with a new generation and without the cached bodies of the former one
+            self.versions[name] = 0
+            self.generations[name] = next(self.created)
+            self.caches[name] = {}
+
+            # The result of the n-th prediction is about the (n+1)-th testing instance
+            while len(self.results[name]) < len(self.testing[name]) + 1:
+                self.results[name].add_data(-1)
+            self.pending[name] = self.results[name].get_data()[len(self.testing[name])]
+
+            # The restored instances beyond the retention policy are evicted right away
+            self.retention_configs[name] = retention or {}
+            self.retainers[name] = self.make_retainer(name, policy, dimension)
+            if self.retainers[name]:
+                self.retainers[name].observe(len(self.testing[name]))
+                self.retainers[name].trim(self.testing[name], self.results[name], index)
+
+            self.rolling[name] = RollingMetrics(windows, time_windows)
+            self.replay_rolling(name)
+
+            # The preprocessing statistics follow the restored training dataset
+            if len(self.training[name]) > 0:
+                model.observe_bulk(self.training[name].get_data())
+            self.model_versions[name] = {"current": 0, "next": 1, "entries": {}}
+
+            self.locks[name] = threading.Lock()
+            self.drift[name] = detector
+            self.drift_configs[name] = drift or {}
+            self.retraining[name] = False
+            self.retrains[name] = {"num": 0, "last": 0.0}
+
+            self.update_meta(name, algorithm=algorithm, dimension=dimension, index=index, windows=windows, time_windows=time_windows, drift=drift, retention=retention)
             ret = self.models[name]
+
+            unit = get_unit(name)
+            with self.cache_lock:
+                self.catalog.pop(name, None)
+                self.resident.setdefault(unit, 0)
+                self.resident.move_to_end(unit)
+            self.update_footprint(unit)
+            self.enforce_cap(keep=unit)
         else:
             print ("\n\nThere is an error!!!\n\n")
 
         return ret
 
+    # The evicted instances are summarized in {datadir}/{name}.history.npz and, with spill,
+    # kept in the segments {datadir}/{name}.spill.<first instance>.log (in-memory: summary only)
+    def make_retainer(self, name, policy, dimension):
+        if policy is None:
+            return None
+        path, prefix = None, None
+        if self.datadir:
+            path = os.path.join(self.datadir, "{}.history.npz".format(name))
+            if policy.spill:
+                prefix = os.path.join(self.datadir, "{}.spill".format(name))
+        elif policy.spill:
+            logging.warning("The evicted instances of the model {} are not spilled without a dataset directory".format(name))
+        return Retainer(policy, History(path, prefix, dimension))
+
+    def get_history(self, name):
+        retainer = self.retainers.get(name)
+        return retainer.history if retainer else None
+
+    def get_dataset_path(self, name, dtype):
+        ret = None
+        if self.datadir:
+            ret = os.path.join(self.datadir, "{}.{}.log".format(name, dtype))
+        return ret
+
+    # Merge the keys into the metadata file of the model; other keys (e.g., the shadow link) are kept
+    def update_meta(self, name, **kwargs):
+        if not self.datadir:
+            return
+        meta = os.path.join(self.datadir, "{}.json".format(name))
+        info = {}
+        if os.path.exists(meta):
+            with open(meta) as f:
+                info = json.load(f)
+        info.update(kwargs)
+        with open(meta, "w") as f:
+            json.dump(info, f)
+        return info
+
+    def get_model_path(self, name, version):
+        ret = None
+        if self.datadir:
+            ret = os.path.join(self.datadir, "{}.v{}.model".format(name, version))
+        return ret
+
+    def get_saved_versions(self, name):
+        ret = {}
+        if self.datadir:
+            prefix = os.path.join(self.datadir, "{}.v".format(name))
+            for path in glob.glob(glob.escape(prefix) + "*.model.*"):
+                version = path[len(prefix):].split(".", 1)[0]
+                if version.isdigit():
+                    ret[int(version)] = os.path.getmtime(path)
+        return ret
+
+    # Store a trained version next to the datasets of the model (if the algorithm supports it)
+    def save_version(self, name, version, model):
+        prefix = self.get_model_path(name, version)
+        if not prefix:
+            return False
+        try:
+            if model.save(prefix):
+                logging.info("Saved the version {} of the model {} into {}.*".format(version, name, prefix))
+                return True
+        except Exception as e:
+            logging.error("Saving the version {} of the model {} failed: {}".format(version, name, e))
+        return False
+
+    def load_version(self, name, version, model):
+        prefix = self.get_model_path(name, version)
+        if not prefix or not model.load(prefix):
+            raise ValueError("the version {} of the model {} cannot be loaded".format(version, name))
+        logging.info("Loaded the version {} of the model {} from {}.*".format(version, name, prefix))
+
+    # Reload the versions saved on disk and serve the current one (the metadata's model_version)
+    def restore_versions(self, name, current):
+        saved = self.get_saved_versions(name)
+        if not saved:
+            return
+        info = self.model_versions[name]
+        for version, mtime in saved.items():
+            info["entries"][version] = {"version": version, "trained": mtime, "source": "disk", "model": None}
+        info["next"] = max(saved) + 1
+        if current in saved:
+            try:
+                self.load_version(name, current, self.models[name])
+                info["current"] = current
+                info["entries"][current]["model"] = self.models[name]
+            except Exception as e:
+                logging.error("Restoring the model {} failed: {}".format(name, e))
+
+    # Train a new version off to the side and swap it in; the serving version is untouched until then
+    #   dataset: None for the training dataset of the model
+    def train_version(self, name, dataset=None, source="training"):
+        model = ModelManager(self.algorithms[name])
+        if model.get_error_status():
+            return False
+
+        # The model is not evicted while it is trained
+        self.pin(name)
+        try:
+            # The running statistics of the training dataset carry over to the new version
+            model.set_statistics(self.models[name].get_statistics())
+            if dataset is None:
+                generated = model.learning(self.training[name], self.dimensions[name])
+            else:
+                generated = model.learning_dataset(dataset, self.dimensions[name])
+            if not generated:
+                logging.error("Training a new version of the model {} failed".format(name))
+                return False
+
+            model.warmup(self.models[name].get_window(), self.dimensions[name])
+            version = self.deploy(name, model, source)
+        finally:
+            self.unpin(name)
+        logging.info("The version {} of the model {} is serving ({})".format(version, name, source))
+        self.enforce_cap(keep=get_unit(name))
+        return True
+
+    # Swap the model in atomically for the predictions; it continues from the window of the previous version
+    def deploy(self, name, model, source):
+        info = self.model_versions[name]
+        with self.locks[name]:
+            version = info["next"]
+            info["next"] += 1
+            model.set_window(self.models[name].get_window())
+            self.models[name] = model
+            info["current"] = version
+            info["entries"][version] = {"version": version, "trained": time.time(), "source": source, "model": model}
+
+        self.save_version(name, version, model)
+        self.update_meta(name, model_version=version)
+        self.prune_versions(name)
+        return version
+
+    # Keep the current version and the previous keep_versions ones; with a datadir, only the
+    # latest previous version stays in memory and the older ones are reloaded from disk on rollback
+    def prune_versions(self, name):
+        info = self.model_versions[name]
+        saved = self.get_saved_versions(name)
+        with self.locks[name]:
+            previous = sorted((v for v in info["entries"] if v != info["current"]), reverse=True)
+            for i, version in enumerate(previous):
+                if i >= self.keep_versions:
+                    del info["entries"][version]
+                elif i > 0 and version in saved:
+                    info["entries"][version]["model"] = None
+        for version in saved:
+            if version not in info["entries"]:
+                for path in glob.glob(glob.escape(self.get_model_path(name, version)) + ".*"):
+                    os.remove(path)
+        self.update_footprint(get_unit(name))
+
+    # Serve a previous version again (by default the latest one before the current version)
+    def rollback(self, name, version=None):
+        info = self.model_versions[name]
+        if version is None:
+            previous = [v for v in info["entries"] if v < info["current"]]
+            if not previous:
+                raise ValueError("the model {} has no version before {}".format(name, info["current"]))
+            version = max(previous)
+        if version not in info["entries"]:
+            raise ValueError("the version {} of the model {} is not kept (kept: {})".format(version, name, sorted(info["entries"])))
+        if version == info["current"]:
+            raise ValueError("the version {} of the model {} is already serving".format(version, name))
+
+        entry = info["entries"][version]
+        model = entry["model"]
+        if model is None:
+            model = ModelManager(self.algorithms[name])
+            model.set_statistics(self.models[name].get_statistics())
+            self.load_version(name, version, model)
+            model.warmup(self.models[name].get_window(), self.dimensions[name])
+
+        with self.locks[name]:
+            model.set_window(self.models[name].get_window())
+            self.models[name] = model
+            entry["model"] = model
+            info["current"] = version
+        self.update_meta(name, model_version=version)
+        self.prune_versions(name)
+        logging.info("The model {} is rolled back to the version {}".format(name, version))
+        return version
+
+    def get_versions(self, name):
+        info = self.model_versions[name]
+        saved = self.get_saved_versions(name)
+        with self.locks[name]:
+            versions = [{
+                "version": e["version"],
+                "trained": e["trained"],
+                "source": e["source"],
+                "in_memory": e["model"] is not None,
+                "on_disk": e["version"] in saved,
+            } for _, e in sorted(info["entries"].items())]
+            return {"current": info["current"], "versions": versions}
+
+    # owns: restore only the models for which owns(name) is true (the models of a pre-forked worker)
+    # The models stored in datadir are cataloged; with a cap on the model cache, each of them is
+    # loaded on its first use instead of now
+    def restore_models(self, owns=None):
+        if not self.datadir:
+            return
+        for fname in sorted(os.listdir(self.datadir)):
+            if not fname.endswith(".json"):
+                continue
+            name = fname[:-len(".json")]
+            if owns and not owns(name):
+                continue
+            with open(os.path.join(self.datadir, fname)) as f:
+                self.catalog[name] = json.load(f)
+
+        if not self.max_models and not self.max_memory:
+            for name in sorted(self.catalog):
+                if name in self.catalog and "shadow_of" not in self.catalog[name]:
+                    self.load_unit(name)
+
+    # Load a cataloged model with its datasets, its trained versions and its window
+    def load_model(self, name, info):
+        try:
+            if not self.add_model(name, info["algorithm"], info["dimension"], info["index"], info.get("windows"), info.get("time_windows"), info.get("drift"), info.get("retention")):
+                return False
+            self.restore_versions(name, info.get("model_version"))
+            if info.get("window"):
+                self.models[name].set_window(info["window"])
+                self.update_meta(name, window=None)
+            if "data_version" in info:
+                self.versions[name] = info["data_version"]
+        except Exception as e:
+            logging.error("Loading the model {} failed: {}".format(name, e))
+            return False
+        logging.info("Restored the model {} (training: {}, testing: {}, version: {})".format(name, len(self.training[name]), len(self.testing[name]), self.model_versions[name]["current"]))
+        return True
+
+    # Load a cataloged primary model and its shadow models
+    def load_unit(self, unit):
+        with self.cache_lock:
+            info = self.catalog.pop(unit)
+            if not self.load_model(unit, info):
+                self.catalog[unit] = info
+                return False
+            for name in sorted(n for n, i in self.catalog.items() if i.get("shadow_of") == unit):
+                info = self.catalog.pop(name)
+                if self.load_model(name, info):
+                    self.register_shadow(unit, info["shadow_name"], name)
+                else:
+                    self.catalog[name] = info
+            self.update_footprint(unit)
+            return True
+
+    # Estimated bytes of a resident primary model and its shadow models: the serving and
+    # in-memory previous versions, and the instances not mapped from the dataset logs
+    def get_footprint(self, unit):
+        ret = 0
+        for name in [unit] + list(self.shadows.get(unit, {}).values()):
+            models = {id(e["model"]): e["model"] for e in self.model_versions[name]["entries"].values() if e["model"] is not None}
+            models[id(self.models[name])] = self.models[name]
+            ret += sum(model.get_footprint() for model in models.values())
+            ret += self.training[name].get_footprint() + self.testing[name].get_footprint() + self.results[name].get_footprint()
+        return ret
+
+    # A model is not evicted while it is pinned (e.g., for the whole of a request on it)
+    def pin(self, name):
+        with self.cache_lock:
+            self.pinned[get_unit(name)] += 1
+
+    def unpin(self, name):
+        unit = get_unit(name)
+        with self.cache_lock:
+            self.pinned[unit] -= 1
+            if self.pinned[unit] <= 0:
+                del self.pinned[unit]
+
+    def update_footprint(self, unit):
+        with self.cache_lock:
+            if unit in self.resident and unit in self.models:
+                self.resident[unit] = self.get_footprint(unit)
+
+    def is_over_cap(self):
+        return bool((self.max_models and len(self.resident) > self.max_models) or
+                    (self.max_memory and sum(self.resident.values()) > self.max_memory))
+
+    # A model predicting, being trained or evaluating its shadow models is not evicted
+    def is_busy(self, unit):
+        if self.pinned[unit] > 0:
+            return True
+        for name in [unit] + list(self.shadows.get(unit, {}).values()):
+            if self.locks[name].locked() or self.retraining[name]:
+                return True
+            if name in self.shadow_queues and (self.shadow_queues[name] or self.shadow_locks[name].locked()):
+                return True
+        return False
+
+    # Evict the least recently used models (except keep) until the cache is within its caps
+    def enforce_cap(self, keep=None):
+        if not self.max_models and not self.max_memory:
+            return
+        with self.cache_lock:
+            for unit in list(self.resident):
+                if not self.is_over_cap():
+                    break
+                if unit != keep and not self.is_busy(unit):
+                    self.evict(unit)
+
+    # The serving version is on disk (or there is none); otherwise it is saved now
+    def is_stored(self, name):
+        current = self.model_versions[name]["current"]
+        if current == 0 or current in self.get_saved_versions(name):
+            return True
+        return self.save_version(name, current, self.models[name])
+
+    # Move a primary model and its shadow models to datadir: the datasets are already in their logs and
+    # the trained versions in their files, so only the windows are written (into the metadata)
+    def evict(self, unit):
+        names = [unit] + sorted(self.shadows.get(unit, {}).values())
+        if not all(self.is_stored(name) for name in names):
+            logging.warning("The model {} stays in memory since its serving version cannot be saved".format(unit))
+            return False
+        for name in names:
+            window = np.asarray(self.models[name].get_window(), dtype=np.float64).tolist()
+            info = self.update_meta(name, window=window)
+            self.catalog[name] = dict(info, data_version=self.versions[name])
+            self.release(name)
+        del self.resident[unit]
+        logging.info("Evicted the model {} from the memory ({} models resident)".format(unit, len(self.resident)))
+        return True
+
+    # Drop the state of a model from memory after closing its datasets
+    def release(self, name):
+        self.training[name].close()
+        self.testing[name].close()
+        self.results[name].close()
+        if self.retainers[name]:
+            self.retainers[name].history.close()
+        for attr in MODEL_STATE:
+            getattr(self, attr).pop(name, None)
+        self.shadows.pop(name, None)
+        shadow_names = self.shadows.get(get_unit(name), {})
+        for sname in [s for s, n in shadow_names.items() if n == name]:
+            del shadow_names[sname]
+
+    # Remove a model from memory and from datadir; a primary model goes with its shadow models.
+    # False if there is no such model; ValueError while the model is in use (requests, training,
+    # retraining or shadow evaluation), since those would find the model gone halfway
+    def delete_model(self, name):
+        unit = get_unit(name)
+        with self.cache_lock:
+            if name == unit:
+                names = [unit] + list(self.shadows.get(unit, {}).values()) + [n for n, i in self.catalog.items() if i.get("shadow_of") == unit]
+            else:
+                names = [name]
+            if not any(n in self.models or n in self.catalog for n in names):
+                return False
+            if unit in self.resident and self.is_busy(unit):
+                raise ValueError("the model {} is in use; try again later".format(name))
+            for n in names:
+                if n in self.models:
+                    self.release(n)
+                self.catalog.pop(n, None)
+                self.remove_files(n)
+            if name == unit:
+                self.resident.pop(unit, None)
+            else:
+                self.update_footprint(unit)
+        logging.info("Deleted the model {}".format(name))
+        return True
+
+    # The datasets, retention history and spill segments, trained versions and metadata of a model
+    def remove_files(self, name):
+        if not self.datadir:
+            return
+        paths = [self.get_dataset_path(name, dtype) for dtype in ("training", "testing", "results")]
+        paths += [os.path.join(self.datadir, "{}.history.npz".format(name)), os.path.join(self.datadir, "{}.json".format(name))]
+        prefix = os.path.join(self.datadir, "{}.spill".format(name))
+        paths += [p for p in glob.glob(glob.escape(prefix) + ".*.log") if p[len(prefix) + 1:-len(".log")].isdigit()]
+        for version in self.get_saved_versions(name):
+            paths += glob.glob(glob.escape(self.get_model_path(name, version)) + ".*")
+        for path in paths:
+            for p in (path, path + ".tmp"):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    # The windows are kept in the metadata, so a restart continues from them
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for name in list(self.models):
+            self.update_meta(name, window=np.asarray(self.models[name].get_window(), dtype=np.float64).tolist())
+            self.training[name].close()
+            self.testing[name].close()
+            self.results[name].close()
+            if self.retainers[name]:
+                self.retainers[name].history.close()
+
+    # Also marks the model as used: a model evicted from the memory (or not loaded yet) is loaded again
     def has_model(self, name):
-        return name in self.models
+        unit = get_unit(name)
+        with self.cache_lock:
+            if unit in self.resident:
+                self.resident.move_to_end(unit)
+            elif unit not in self.catalog or not self.load_unit(unit):
+                return False
+            else:
+                self.enforce_cap(keep=unit)
+            return name in self.models
 
     def get_model(self, name):
         ret = None
@@ -49,7 +587,7 @@ class AIModule:
 
     def get_model_info(self, name):
         ret = {}
-        if name in self.models:
+        if self.has_model(name):
             ret["name"] = name
         else:
             ret["name"] = "{} is not a generated model".format(name)
@@ -66,11 +604,18 @@ class AIModule:
             ret["dimension"] = "no dimension is specified"
             ret["index"] = "no index is specified"
 
+        if name in self.drift_configs:
+            ret["drift"] = self.drift_configs[name]
+            ret["retraining"] = self.retraining[name]
+            ret["retrains"] = self.retrains[name]["num"]
+            ret["version"] = self.model_versions[name]["current"]
+            ret["retention"] = self.retention_configs[name]
+
         return ret
 
     def get_data_info(self, name, dtype):
         ret = {}
-        if name in self.models:
+        if self.has_model(name):
             ret["name"] = name
         else:
             ret["name"] = "{} is not a generated model".format(name)
@@ -92,6 +637,9 @@ class AIModule:
         elif dtype == "testing":
             if name in self.testing:
                 ret["num"] = len(self.testing[name])
+                history = self.get_history(name)
+                if history:
+                    ret["evicted"] = history.evicted
             else:
                 ret["num"] = "the testing dataset for {} is not generated".format(name)
                 ret["opcode"] = "failure"
@@ -103,8 +651,10 @@ class AIModule:
 
         return ret
 
+    # The resident models and the ones evicted to datadir
     def get_model_names(self):
-        return list(self.models.keys())
+        with self.cache_lock:
+            return list(self.models.keys()) + sorted(self.catalog)
 
     def get_model_algorithm(self, name):
         ret = None
@@ -125,49 +675,161 @@ class AIModule:
         return ret
 
     def add_training_data(self, name, value):
-        logging.debug("before: {}".format(self.training[name].get_data()))
         self.training[name].add_data(value)
-        logging.debug("after: {}".format(self.training[name].get_data()))
+        self.models[name].observe(value)
+        request_log.debug("Added a training instance to the model %s (%d instances)", name, len(self.training[name]))
 
     def add_testing_data(self, name, value):
         self.testing[name].add_data(value)
+        self.versions[name] += 1
+        if self.retainers[name]:
+            self.retainers[name].observe()
+            self.retainers[name].trim(self.testing[name], self.results[name], self.indexes[name])
+
+        # The pending prediction was about this instance
+        if self.pending[name] != -1:
+            self.resolve(name, value[self.indexes[name]], self.pending[name])
 
-    def get_result(self, name):
+    # Called whenever a prediction is resolved against the actual value
+    def resolve(self, name, actual, predicted):
+        self.rolling[name].add(actual, predicted, THRESHOLD, time.time())
+
+        # The detector is updated by the request threads under the lock of the model
+        detector = self.drift[name]
+        if detector and actual != 0:
+            with self.locks[name]:
+                drifted = detector.update(abs((predicted - actual) / actual))
+                if drifted:
+                    detector.reset()
+            if drifted:
+                logging.info("Drift is detected on the model {}".format(name))
+                self.schedule_retraining(name)
+
+    # Retrain the model on the recent instances in a background thread and
+    # swap it in when done; predictions keep using the current model meanwhile
+    # The retraining state is checked and set under the lock of the model, so two concurrent
+    # drift detections start one retraining
+    def schedule_retraining(self, name):
+        config = self.drift_configs[name]
+        cooldown = config.get("cooldown", RETRAIN_COOLDOWN)
+        with self.locks[name]:
+            skipped = self.retraining[name] or time.time() - self.retrains[name]["last"] < cooldown
+            if not skipped:
+                self.retraining[name] = True
+        if skipped:
+            logging.info("Retraining of the model {} is skipped (in progress or in the cooldown)".format(name))
+            return
+        thread = threading.Thread(target=self.retrain, args=(name, config.get("retrain_window", RETRAIN_WINDOW)), daemon=True)
+        thread.start()
+
+    def get_recent_dataset(self, name, num):
+        testing = self.testing[name].get_data()
+        recent = np.asarray(testing[max(0, len(testing) - num):], dtype=np.float32)
+        if len(recent) < num:
+            training = self.training[name].get_data()
+            older = np.asarray(training[max(0, len(training) - (num - len(recent))):], dtype=np.float32)
+            if len(older) > 0:
+                recent = np.concatenate([older.reshape(-1, self.dimensions[name]), recent.reshape(-1, self.dimensions[name])])
+        return recent
+
+    def retrain(self, name, num):
+        try:
+            dataset = self.get_recent_dataset(name, num)
+            logging.info("Retraining the model {} with the recent {} instances".format(name, len(dataset)))
+            if not self.train_version(name, dataset, "drift"):
+                logging.error("Retraining the model {} failed".format(name))
+                return
+            with self.locks[name]:
+                self.retrains[name]["num"] += 1
+        except Exception as e:
+            logging.error("Retraining the model {} failed: {}".format(name, e))
+        finally:
+            with self.locks[name]:
+                self.retrains[name]["last"] = time.time()
+                self.retraining[name] = False
+
+    # Rebuild the count windows from the restored datasets (time windows start empty)
+    def replay_rolling(self, name):
+        num = len(self.testing[name])
+        start = max(0, num - self.rolling[name].get_max_count())
+        if start == num:
+            return
+        sequence = self.testing[name].get_data()
+        prediction = self.results[name].get_data()
+        index = self.indexes[name]
+        for i in range(start, num):
+            if prediction[i] != -1:
+                self.rolling[name].add(sequence[i][index], prediction[i], THRESHOLD)
+
+    def get_rolling_evaluation(self, name):
+        return self.rolling[name].report()
+
+    # The ETag changes whenever the model is (re-)created, its data changes or the threshold changes
+    def get_etag(self, name, kind):
+        return "{}-{}-{}-{}-{}-{}".format(self.instance, name, self.generations[name], kind, self.versions[name], THRESHOLD)
+
+    # Return the cached response body of the kind for the current version of the model
+    # (builder() makes the body if the cache is missing or stale, or if the kind is not a cached one,
+    # which bounds the cache of a model to CACHED_VARIANTS entries)
+    def get_cached(self, name, kind, builder):
+        if kind not in CACHED_VARIANTS:
+            return builder()
+        etag = self.get_etag(name, kind)
+        entry = self.caches[name].get(kind)
+        if entry and entry[0] == etag:
+            return entry[1]
+        body = builder()
+        self.caches[name][kind] = (etag, body)
+        return body
+
+    def get_result(self, name, threshold=None):
+        threshold = THRESHOLD if threshold is None else threshold
         sequence = self.testing[name].get_data()
         prediction = self.results[name].get_data()
         index = self.get_model_power_index(name)
         
-        logging.debug("sequence> len: {}, sequence: {}".format(len(sequence), sequence))
-        logging.debug("prediction> len: {}, prediction: {}".format(len(prediction), prediction))
-
-        num = 0     # number of instances
-        sidx = 0    # start index
-        cp = 0      # correct prediction
-        ip = 0      # incorrect prediction
-        for i in range(len(sequence)):
-            if prediction[i] == -1:
-                sidx += 1
-                continue
-            num += 1
-            if math.fabs((prediction[i] - sequence[i][index]) / sequence[i][index]) <= THRESHOLD:
-                cp += 1
-            else:
-                ip += 1
+        request_log.debug("Evaluating the model %s (sequence: %d, prediction: %d)", name, len(sequence), len(prediction))
+
+        sequence = np.asarray(sequence)
+        prediction = np.asarray(prediction)
+        num = len(sequence)
+
+        valid = prediction[:num] != -1
+        sidx = num - int(np.count_nonzero(valid))    # start index
+        actual = sequence[:, index][valid] if num > 0 else np.empty(0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            errors = np.abs((prediction[:num][valid] - actual) / actual)
+
+        cp = int(np.count_nonzero(errors <= threshold))     # correct prediction
+        num = len(errors)                                   # number of instances
+        # The instances evicted by the retention policy still count
+        history = self.get_history(name)
+        if history:
+            cp += history.correct(threshold)
+            num += int(history.sums.n)
+        ip = num - cp                                       # incorrect prediction
         accuracy = round(cp / num * 100, 2)
-        return num, sequence[sidx:], prediction[sidx:], index, THRESHOLD, cp, ip, accuracy
+        return num, sequence[sidx:], prediction[sidx:], index, threshold, cp, ip, accuracy
     
-    def get_detailed_evaluation(self, name):
+    def get_detailed_evaluation(self, name, threshold=None):
         """상세한 평가 지표를 계산하여 반환"""
         sequence = self.testing[name].get_data()
         prediction = self.results[name].get_data()
         index = self.get_model_power_index(name)
         
-        if not sequence or not prediction:
+        history = self.get_history(name)
+        if (len(sequence) == 0 or len(prediction) == 0) and not (history and history.sums.n):
             return {"error": "평가할 데이터가 없습니다"}
         
-        # 새로운 평가 모듈 사용
-        metrics = self.evaluator.calculate_metrics(sequence, prediction, index)
+        # 새로운 평가 모듈 사용 (보존 정책으로 제거된 데이터의 누적 요약 포함)
+        metrics = self.evaluator.calculate_metrics(sequence, prediction, index, threshold, history)
         return metrics
+
+    def get_accuracy_curve(self, name, thresholds=None, points=1000):
+        """임계값별 정확도 (thresholds가 없으면 정확도 CDF)"""
+        sequence = self.testing[name].get_data()
+        prediction = self.results[name].get_data()
+        return self.evaluator.accuracy_curve(sequence, prediction, self.get_model_power_index(name), thresholds, points, self.get_history(name))
     
     def set_evaluation_threshold(self, threshold):
         """평가 임계값 변경"""
@@ -180,13 +842,171 @@ class AIModule:
         self.models[name]
         self.training[name]
         self.dimensions[name]
-        return self.models[name].learning(self.training[name], self.dimensions[name])
+        ret = self.train_version(name)
+        self.train_shadows(name)
+        return ret
+
+    # The dataset file of path (relative to the dataset root) if it is a file inside the root; a missing
+    # file and a file outside the root get the same error, which tells nothing about the files of the host
+    def resolve_dataset(self, path):
+        if not self.dataset_root:
+            raise ValueError("loading the datasets from files is disabled (see --dataset-root)")
+        real = os.path.realpath(os.path.join(self.dataset_root, str(path)))
+        if os.path.commonpath([real, self.dataset_root]) != self.dataset_root or not os.path.isfile(real):
+            raise ValueError("the dataset {} is not available".format(path))
+        return real
+
+    # Train the model directly from a dataset file under the dataset root
+    # (append: also keep the instances in the training dataset of the model)
+    def learning_from_file(self, name, path, fmt=None, append=False):
+        dataset = load_dataset(self.resolve_dataset(path), self.dimensions[name], fmt)
+        if append:
+            self.training[name].add_bulk(dataset)
+            self.models[name].observe_bulk(dataset)
+        ret = self.train_version(name, dataset, "file")
+        self.train_shadows(name, dataset)
+        return ret
+
+    # Attach a shadow model: it is trained with the training data of the primary model and
+    # gets every testing instance of the primary model, but its predictions are only evaluated
+    def add_shadow(self, primary, sname, algorithm):
+        if "@" in primary:
+            raise ValueError("the model {} is a shadow model".format(primary))
+        if "@" in str(sname):
+            raise ValueError("the shadow name should not contain '@'")
+        name = "{}@{}".format(primary, sname)
+        if name in self.models:
+            raise ValueError("the shadow {} of the model {} already exists".format(sname, primary))
+        if not self.add_model(name, algorithm, self.dimensions[primary], self.indexes[primary], retention=self.retention_configs[primary]):
+            raise ValueError("internal issue of the model manager for the algorithm {}".format(algorithm))
+
+        self.update_meta(name, shadow_of=primary, shadow_name=sname)
+
+        self.register_shadow(primary, sname, name)
+        if self.models[primary].is_trained():
+            self.train_shadows(primary, names=[name])
+        return name
+
+    def register_shadow(self, primary, sname, name):
+        self.shadow_queues[name] = deque(maxlen=SHADOW_BACKLOG)
+        self.shadow_locks[name] = threading.Lock()
+        self.shadow_dropped[name] = 0
+        self.shadows.setdefault(primary, {})[sname] = name
+
+    def train_shadows(self, primary, dataset=None, names=None):
+        if names is None:
+            names = list(self.shadows.get(primary, {}).values())
+        for name in names:
+            self.pin(name)
+            self.executor.submit(self.train_shadow, primary, name, dataset)
+
+    def train_shadow(self, primary, name, dataset):
+        try:
+            if dataset is None:
+                dataset = self.training[primary].get_data()
+            generated = self.train_version(name, dataset, "shadow")
+            logging.info("The shadow model {} is {}".format(name, "trained" if generated else "not trained"))
+        except Exception as e:
+            logging.error("Training the shadow model {} failed: {}".format(name, e))
+        finally:
+            self.unpin(name)
+
+    def feed_shadows(self, primary, value):
+        for name in self.shadows.get(primary, {}).values():
+            queue = self.shadow_queues[name]
+            if len(queue) == queue.maxlen:
+                with self.shadow_dropped_lock:
+                    self.shadow_dropped[name] += 1
+                    dropped = self.shadow_dropped[name]
+                request_log.warning("The backlog of the shadow model %s is full; dropped its oldest instance (%d so far)",
+                                    name, dropped)
+            queue.append(value)
+            self.executor.submit(self.drain_shadow, name)
+
+    # Process the waiting instances of a shadow model in order; only one worker drains a shadow at a time
+    def drain_shadow(self, name):
+        queue = self.shadow_queues[name]
+        lock = self.shadow_locks[name]
+        while queue:
+            if not lock.acquire(blocking=False):
+                return
+            try:
+                while queue:
+                    value = queue.popleft()
+                    if not self.models[name].is_trained():
+                        continue
+                    self.add_testing_data(name, value)
+                    self.prediction(name, value)
+            except Exception as e:
+                logging.error("Evaluating the shadow model {} failed: {}".format(name, e))
+            finally:
+                lock.release()
+
+    # The scalar metrics of the primary model and its shadow models side by side
+    def get_shadow_report(self, primary):
+        ret = {}
+        names = [("primary", primary)] + sorted(self.shadows.get(primary, {}).items())
+        for sname, name in names:
+            metrics = self.get_detailed_evaluation(name)
+            report = {
+                "model": name,
+                "algorithm": self.algorithms[name],
+                "metrics": {k: v for k, v in metrics.items() if np.ndim(v) == 0},
+                "rolling": self.get_rolling_evaluation(name),
+            }
+            if name in self.shadow_queues:
+                report["trained"] = self.models[name].is_trained()
+                report["backlog"] = len(self.shadow_queues[name])
+                report["dropped"] = self.shadow_dropped[name]
+            ret[sname] = report
+        return ret
         
+    # Forecast for a batch of requests [{"model": <name>, "horizon": <steps>, "window": <instances (optional)>}]
+    # The window is the current one of the model if not given; the state of the model is not changed.
+    # The requests on the same model are rolled forward together, one forward pass per step
+    def forecast(self, requests):
+        groups = {}
+        try:
+            for i, req in enumerate(requests):
+                name = req.get("model")
+                horizon = req.get("horizon")
+                if not isinstance(name, str) or not self.has_model(name):
+                    raise ValueError("the model {} is unavailable".format(name))
+                if name not in groups:
+                    self.pin(name)
+                    groups[name] = []
+                if not isinstance(horizon, int) or horizon <= 0 or horizon > MAX_HORIZON:
+                    raise ValueError("the horizon should be an integer between 1 and {}".format(MAX_HORIZON))
+                window = req.get("window")
+                if window is not None and any(len(v) != self.dimensions[name] for v in window):
+                    raise ValueError("the instances of the window should have the dimension {}".format(self.dimensions[name]))
+                groups[name].append(i)
+
+            ret = [None] * len(requests)
+            for name, idxs in groups.items():
+                horizon = max(requests[i]["horizon"] for i in idxs)
+                # Only the snapshot of the model and its window is taken under the lock; the rollout
+                # does not change the model, so predictions and training PUTs are not blocked by it
+                with self.locks[name]:
+                    model = self.models[name]
+                    windows = [requests[i].get("window") or model.get_window() for i in idxs]
+                preds = model.forecast(windows, horizon, self.dimensions[name])
+                for k, i in enumerate(idxs):
+                    ret[i] = preds[k, :requests[i]["horizon"]]
+            return ret
+        finally:
+            for name in groups:
+                self.unpin(name)
+
     def prediction(self, name, value):
-        pred = self.models[name].prediction(value, self.dimensions[name])
+        with tracing.stage("predict"), self.locks[name]:
+            pred = self.models[name].prediction(value, self.dimensions[name])
         index = self.indexes[name]
-        logging.debug("pred in prediction(): {}".format(pred))
-        self.results[name].add_data(pred[index])
+        request_log.debug("pred in prediction(): %s", pred)
+        with tracing.stage("record"):
+            self.results[name].add_data(pred[index])
+        self.pending[name] = pred[index]
+        self.versions[name] += 1
         return pred
 
 # URI: /
@@ -208,9 +1028,12 @@ class Main(Resource):
         return make_response(jsonify(model_list))
 
 # URI: /<string: model_id>
-# HTTP behavior: GET, POST
+# HTTP behavior: GET, POST, DELETE
 # GET: Get the information (algorithm, dimension) about the model
-# POST: Make the model with the parameters (name, algorithm, dimension)
+# POST: Make the model with the parameters (name, algorithm, dimension, index, and optionally windows, time_windows, drift)
+#       drift: {"method": "page_hinkley" or "error_ratio", <detector parameters>, "retrain_window": N, "cooldown": seconds}
+#       retention: {"rows": N, "seconds": T, "spill": true/false} (the default of the module if not given)
+# DELETE: Remove the model (with its shadow models) and its datasets, history and trained versions
 class ModelGenerator(Resource):
     def __init__(self):
         super(ModelGenerator, self).__init__()
@@ -221,6 +1044,12 @@ class ModelGenerator(Resource):
 
     def post(self, model_id):
         ret = {}
+        # "@" separates a shadow model from its primary model (<primary>@<name>)
+        if "@" in model_id:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model name should not contain '@' (reserved for the shadow models)"
+            return make_response(jsonify(ret))
+
         args =request.get_json(force=True)
         if "algorithm" not in args:
             ret["opcode"] = "failure"
@@ -244,7 +1073,14 @@ class ModelGenerator(Resource):
                 index = args["index"]
                 dimension = args["dimension"]
 
-        model = ai.add_model(model_id, algorithm, dimension, index)
+        # An evicted model is loaded first, so that its shadow models stay attached
+        ai.has_model(model_id)
+        try:
+            model = ai.add_model(model_id, algorithm, dimension, index, args.get("windows"), args.get("time_windows"), args.get("drift"), args.get("retention"))
+        except ValueError as e:
+            ret["opcode"] = "failure"
+            ret["reason"] = str(e)
+            return make_response(jsonify(ret))
 
         if not model:
             ret["opcode"] = "failure"
@@ -253,10 +1089,27 @@ class ModelGenerator(Resource):
             ret["opcode"] = "success"
         return make_response(jsonify(ret))
 
+    def delete(self, model_id):
+        ret = {}
+        try:
+            deleted = ai.delete_model(model_id)
+        except ValueError as e:
+            ret["opcode"] = "failure"
+            ret["reason"] = str(e)
+            return make_response(jsonify(ret))
+
+        if deleted:
+            ret["opcode"] = "success"
+        else:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+        return make_response(jsonify(ret))
+
 # URI: /<string: model_id>/training
 # HTTP behavior: GET, POST, PUT
 # GET: Get the information about the training data
 # POST: Train the model with the training dataset
+#       (or with a local dataset file if the parameters (path, format, append) are given)
 # PUT: Add the training data
 class Trainer(Resource):
     def __init__(self):
@@ -268,7 +1121,22 @@ class Trainer(Resource):
 
     def post(self, model_id):
         ret = {}
-        generated = ai.learning(model_id)
+        if not ai.has_model(model_id):
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+            return make_response(jsonify(ret))
+
+        args = request.get_json(force=True, silent=True) or {}
+        if "path" in args:
+            try:
+                generated = ai.learning_from_file(model_id, args["path"], args.get("format"), args.get("append", False))
+            except ValueError as e:
+                ret["opcode"] = "failure"
+                ret["reason"] = str(e)
+                return make_response(jsonify(ret))
+        else:
+            generated = ai.learning(model_id)
+
         if generated == True:
             ret["opcode"] = "success"
         else:
@@ -285,7 +1153,7 @@ class Trainer(Resource):
                 ret["reason"] = "the necessary attribute 'value' is not included"
             else:
                 value = args["value"]
-                logging.debug("value: {}".format(value))
+                request_log.debug("value: %s", value)
 
                 if len(value) != ai.get_model_dimension(model_id):
                     ret["opcode"] = "failure"
@@ -296,7 +1164,7 @@ class Trainer(Resource):
         else:
             ret["opcode"] = "failure"
             ret["reason"] = "the model {} is unavailable".format(model_id)
-        logging.debug("ret: {}".format(ret))
+        request_log.debug("ret: %s", ret)
         return make_response(jsonify(ret))
         
 # URI: /<string: model_id>/testing
@@ -314,30 +1182,76 @@ class Tester(Resource):
     def put(self, model_id):
         ret = {}
         if ai.has_model(model_id):
-            args = request.get_json(force=True)
+            with tracing.stage("parse"):
+                args = request.get_json(force=True)
             if "value" not in args:
                 ret["opcode"] = "failure"
                 ret["reason"] = "the necessary attribute 'value' is not included"
             else:
                 value = args["value"]
-                logging.debug("value: {}".format(value))
+                request_log.debug("value: %s", value)
 
                 if len(value) != ai.get_model_dimension(model_id):
                     ret["opcode"] = "failure"
                     ret["reason"] = "not enough features. the dimension of the instance should be {} (the dimension of {} is given).".format(ai.get_model_dimension(model_id, len(value)))
                 else:
-                    ai.add_testing_data(model_id, value)
+                    with tracing.stage("record"):
+                        ai.add_testing_data(model_id, value)
                     result = ai.prediction(model_id, value)
-                    logging.debug("result: {}".format(result))
+                    with tracing.stage("shadow"):
+                        ai.feed_shadows(model_id, value)
+                    request_log.debug("result: %s", result)
                     ret["opcode"] = "success"
-                    ret["prediction"] = result[ai.get_model_power_index(model_id)]
+                    ret["prediction"] = float(result[ai.get_model_power_index(model_id)])
         else:
             ret["opcode"] = "failure"
             ret["reason"] = "the model {} is unavailable".format(model_id)
-        return make_response(jsonify(ret))
+        with tracing.stage("serialize"):
+            return make_response(jsonify(ret))
+
+# Serve the body made by builder() from the per-version cache of the model,
+# or 304 (Not Modified) if the client already has the current version.
+# The body is JSON (compressed if the client accepts gzip/deflate), or an npz
+# archive of arrays(payload) if the client asks for it and arrays is given.
+# Only the encoded bodies of the parameter-free kinds are kept (see CACHED_KINDS)
+def make_cached_response(model_id, kind, builder, arrays=None):
+    fmt, encoding = negotiate(arrays is not None)
+    variant = "{}.{}.{}".format(kind, fmt, encoding or "identity")
+    etag = ai.get_etag(model_id, variant)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        def make_body():
+            payload = builder()
+            if fmt == "npz" and payload.get("opcode") == "success":
+                return encode(fmt, encoding, payload, arrays(payload))
+            return encode("json", encoding, payload)
+
+        body, mimetype, content_encoding = ai.get_cached(model_id, variant, make_body)
+        response = make_response(body)
+        response.mimetype = mimetype
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
+    response.set_etag(etag)
+    response.vary.add("Accept")
+    response.vary.add("Accept-Encoding")
+    return response
+
+# The thresholds given in the query string for this request only (None if not given)
+def get_request_thresholds(key):
+    if key not in request.args:
+        return None
+    try:
+        thresholds = [float(t) for t in request.args[key].split(",")]
+    except ValueError:
+        raise ValueError("{}는 숫자(또는 쉼표로 구분된 숫자 목록)여야 합니다".format(key))
+    if any(t <= 0 for t in thresholds):
+        raise ValueError("threshold는 0보다 큰 숫자여야 합니다")
+    return thresholds
 
 # URI: /<string: model_id>/result
 # HTTP behavior: GET
+# GET: Get the prediction results (?threshold=<value> to evaluate with the threshold for this request only)
 class Evaluator(Resource):
     def __init__(self):
         super(Evaluator, self).__init__()
@@ -345,23 +1259,40 @@ class Evaluator(Resource):
     def get(self, model_id):
         ret = {}
         if ai.has_model(model_id):
-            num, seq, pred, index, threshold, correct, incorrect, accuracy = ai.get_result(model_id)
-            ret["opcode"] = "success"
-            ret["num"] = num
-            ret["sequence"] = seq
-            ret["prediction"] = pred
-            ret["index"] = index
-            ret["threshold"] = str(threshold)
-            ret["correct"] = correct
-            ret["incorrect"] = incorrect
-            ret["accuracy"] = str(accuracy)
+            try:
+                threshold = get_request_thresholds("threshold")
+            except ValueError as e:
+                ret["opcode"] = "failure"
+                ret["reason"] = str(e)
+                return make_response(jsonify(ret))
+            threshold = threshold[0] if threshold else None
+            kind = "result" if threshold is None else "result@{}".format(threshold)
+            return make_cached_response(model_id, kind, lambda: self.make_result(model_id, threshold), self.make_arrays)
         else:
             ret["opcode"] = "failure"
             ret["reason"] = "the model {} is unavailable".format(model_id)
         return make_response(jsonify(ret))
 
+    def make_result(self, model_id, threshold=None):
+        ret = {}
+        num, seq, pred, index, threshold, correct, incorrect, accuracy = ai.get_result(model_id, threshold)
+        ret["opcode"] = "success"
+        ret["num"] = num
+        ret["sequence"] = seq
+        ret["prediction"] = pred
+        ret["index"] = index
+        ret["threshold"] = str(threshold)
+        ret["correct"] = correct
+        ret["incorrect"] = incorrect
+        ret["accuracy"] = str(accuracy)
+        return ret
+
+    def make_arrays(self, ret):
+        return {k: v for k, v in ret.items() if k != "opcode"}
+
 # URI: /<string: model_id>/detailed_evaluation
 # HTTP behavior: GET
+# GET: Get the detailed metrics (?threshold=<value> to evaluate with the threshold for this request only)
 class DetailedEvaluator(Resource):
     def __init__(self):
         super(DetailedEvaluator, self).__init__()
@@ -369,14 +1300,258 @@ class DetailedEvaluator(Resource):
     def get(self, model_id):
         ret = {}
         if ai.has_model(model_id):
-            metrics = ai.get_detailed_evaluation(model_id)
-            if "error" in metrics:
+            try:
+                threshold = get_request_thresholds("threshold")
+            except ValueError as e:
                 ret["opcode"] = "failure"
-                ret["reason"] = metrics["error"]
-            else:
-                ret["opcode"] = "success"
-                ret["metrics"] = metrics
-                ret["summary"] = ai.evaluator.get_performance_summary(metrics)
+                ret["reason"] = str(e)
+                return make_response(jsonify(ret))
+            threshold = threshold[0] if threshold else None
+            kind = "detailed_evaluation" if threshold is None else "detailed_evaluation@{}".format(threshold)
+            return make_cached_response(model_id, kind, lambda: self.make_evaluation(model_id, threshold), self.make_arrays)
+        else:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+        return make_response(jsonify(ret))
+
+    def make_evaluation(self, model_id, threshold=None):
+        ret = {}
+        metrics = ai.get_detailed_evaluation(model_id, threshold)
+        if "error" in metrics:
+            ret["opcode"] = "failure"
+            ret["reason"] = metrics["error"]
+        else:
+            ret["opcode"] = "success"
+            ret["metrics"] = metrics
+            ret["summary"] = ai.evaluator.get_performance_summary(metrics)
+        return ret
+
+    def make_arrays(self, ret):
+        return ret["metrics"]
+
+# URI: /<string: model_id>/accuracy_curve
+# HTTP behavior: GET
+# GET: Get the accuracy for each of ?thresholds=<t1>,<t2>,... in one pass,
+#      or the accuracy CDF (at most ?points=<N> points, 1000 by default) if no threshold is given
+class AccuracyCurve(Resource):
+    def __init__(self):
+        super(AccuracyCurve, self).__init__()
+
+    def get(self, model_id):
+        ret = {}
+        if ai.has_model(model_id):
+            try:
+                thresholds = get_request_thresholds("thresholds")
+                points = int(request.args.get("points", 1000))
+            except ValueError as e:
+                ret["opcode"] = "failure"
+                ret["reason"] = str(e)
+                return make_response(jsonify(ret))
+            kind = "accuracy_curve?{}&{}".format(thresholds, points)
+            return make_cached_response(model_id, kind, lambda: self.make_curve(model_id, thresholds, points), self.make_arrays)
+        else:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+        return make_response(jsonify(ret))
+
+    def make_curve(self, model_id, thresholds, points):
+        ret = {}
+        curve = ai.get_accuracy_curve(model_id, thresholds, max(points, 1))
+        if "error" in curve:
+            ret["opcode"] = "failure"
+            ret["reason"] = curve["error"]
+        else:
+            ret["opcode"] = "success"
+            ret.update(curve)
+        return ret
+
+    def make_arrays(self, ret):
+        return {k: v for k, v in ret.items() if k != "opcode"}
+
+# URI: /<string: model_id>/forecast
+# HTTP behavior: GET
+# GET: Forecast the next ?horizon=<steps> power values from the current window without changing the model
+#      (?full=1 to get all the features of the forecast instances)
+class Forecaster(Resource):
+    def __init__(self):
+        super(Forecaster, self).__init__()
+
+    def get(self, model_id):
+        ret = {}
+        try:
+            horizon = int(request.args.get("horizon", 1))
+            forecast = ai.forecast([{"model": model_id, "horizon": horizon}])[0]
+        except (ValueError, NotImplementedError) as e:
+            ret["opcode"] = "failure"
+            ret["reason"] = str(e)
+            return make_response(jsonify(ret))
+
+        ret["opcode"] = "success"
+        ret["horizon"] = horizon
+        ret["prediction"] = forecast[:, ai.get_model_power_index(model_id)]
+        if request.args.get("full"):
+            ret["values"] = forecast
+        body, mimetype, _ = encode("json", None, ret)
+        response = make_response(body)
+        response.mimetype = mimetype
+        return response
+
+# URI: /forecast
+# HTTP behavior: POST
+# POST: Forecast for many models/horizons in one call
+#       {"requests": [{"model": <name>, "horizon": <steps>, "window": <instances (optional)>}, ...], "full": false}
+class BatchForecaster(Resource):
+    def __init__(self):
+        super(BatchForecaster, self).__init__()
+
+    def post(self):
+        ret = {}
+        args = request.get_json(force=True)
+        requests = args.get("requests") if isinstance(args, dict) else None
+        if not isinstance(requests, list):
+            ret["opcode"] = "failure"
+            ret["reason"] = "the necessary attribute 'requests' is not included"
+            return make_response(jsonify(ret))
+
+        try:
+            forecasts = ai.forecast(requests)
+        except (ValueError, NotImplementedError) as e:
+            ret["opcode"] = "failure"
+            ret["reason"] = str(e)
+            return make_response(jsonify(ret))
+
+        ret["opcode"] = "success"
+        ret["forecasts"] = []
+        for req, forecast in zip(requests, forecasts):
+            result = {"model": req["model"], "horizon": req["horizon"]}
+            result["prediction"] = forecast[:, ai.get_model_power_index(req["model"])]
+            if args.get("full"):
+                result["values"] = forecast
+            ret["forecasts"].append(result)
+        body, mimetype, _ = encode("json", None, ret)
+        response = make_response(body)
+        response.mimetype = mimetype
+        return response
+
+# URI: /<string: model_id>/shadows
+# HTTP behavior: GET, POST
+# GET: Get the metrics of the model and its shadow models side by side
+# POST: Attach a shadow model with the parameters (name, algorithm); the shadow model gets the
+#       testing instances of the model in the background and its predictions are not returned
+class ShadowManager(Resource):
+    def __init__(self):
+        super(ShadowManager, self).__init__()
+
+    def get(self, model_id):
+        ret = {}
+        if ai.has_model(model_id):
+            ret["opcode"] = "success"
+            ret["models"] = ai.get_shadow_report(model_id)
+        else:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+        body, mimetype, _ = encode("json", None, ret)
+        response = make_response(body)
+        response.mimetype = mimetype
+        return response
+
+    def post(self, model_id):
+        ret = {}
+        if not ai.has_model(model_id):
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+            return make_response(jsonify(ret))
+
+        args = request.get_json(force=True)
+        if "name" not in args or "algorithm" not in args:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the parameters 'name' and 'algorithm' are necessary"
+            return make_response(jsonify(ret))
+
+        try:
+            ret["model"] = ai.add_shadow(model_id, args["name"], args["algorithm"])
+            ret["opcode"] = "success"
+        except ValueError as e:
+            ret["opcode"] = "failure"
+            ret["reason"] = str(e)
+        return make_response(jsonify(ret))
+
+# URI: /<string: model_id>/versions
+# HTTP behavior: GET
+# GET: Get the trained versions of the model kept for rollback and the serving one
+class VersionManager(Resource):
+    def __init__(self):
+        super(VersionManager, self).__init__()
+
+    def get(self, model_id):
+        ret = {}
+        if ai.has_model(model_id):
+            ret["opcode"] = "success"
+            ret.update(ai.get_versions(model_id))
+        else:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+        return make_response(jsonify(ret))
+
+# URI: /<string: model_id>/history
+# HTTP behavior: GET
+# GET: Get the retention policy of the model and the summary of the evicted testing instances
+#      (number, spill segments, downsampled aggregates: time range, mean actual/predicted value, MAE)
+class HistoryReport(Resource):
+    def __init__(self):
+        super(HistoryReport, self).__init__()
+
+    def get(self, model_id):
+        ret = {}
+        if ai.has_model(model_id):
+            ret["opcode"] = "success"
+            ret["retention"] = ai.retention_configs[model_id]
+            ret["retained"] = len(ai.testing[model_id])
+            history = ai.get_history(model_id)
+            if history:
+                ret.update(history.report())
+        else:
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+        return make_response(jsonify(ret))
+
+# URI: /<string: model_id>/rollback
+# HTTP behavior: POST
+# POST: Serve a previous version again with the optional parameter (version); the latest previous one by default
+class Rollback(Resource):
+    def __init__(self):
+        super(Rollback, self).__init__()
+
+    def post(self, model_id):
+        ret = {}
+        if not ai.has_model(model_id):
+            ret["opcode"] = "failure"
+            ret["reason"] = "the model {} is unavailable".format(model_id)
+            return make_response(jsonify(ret))
+
+        args = request.get_json(force=True, silent=True) or {}
+        try:
+            ret["version"] = ai.rollback(model_id, args.get("version"))
+            ret["opcode"] = "success"
+        except ValueError as e:
+            ret["opcode"] = "failure"
+            ret["reason"] = str(e)
+        return make_response(jsonify(ret))
+
+# URI: /<string: model_id>/rolling_evaluation
+# HTTP behavior: GET
+# GET: Get the accuracy, MAE, RMSE, MAPE and bias over the recent windows
+#      (the last N predictions and the last T seconds, set with "windows" and "time_windows" at POST /<model_id>)
+class RollingEvaluator(Resource):
+    def __init__(self):
+        super(RollingEvaluator, self).__init__()
+
+    def get(self, model_id):
+        ret = {}
+        if ai.has_model(model_id):
+            ret["opcode"] = "success"
+            ret["threshold"] = THRESHOLD
+            ret["windows"] = ai.get_rolling_evaluation(model_id)
         else:
             ret["opcode"] = "failure"
             ret["reason"] = "the model {} is unavailable".format(model_id)
@@ -419,17 +1594,89 @@ def command_line_args():
     parser.add_argument("-a", "--addr", metavar="<IP address>", help="IP address", type=str, default="0.0.0.0")
     parser.add_argument("-p", "--port", required=True, metavar="<port number>", help="Port number", type=int)
     parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", type=str, default="INFO")
+    parser.add_argument("-d", "--datadir", metavar="<dataset directory>", help="Directory to persist the datasets of the models (in-memory only if not given)", type=str, default=None)
+    parser.add_argument("-s", "--sync-every", metavar="<number of rows>", help="Number of appended rows between two fsync calls on the dataset logs", type=int, default=SYNC_EVERY)
+    parser.add_argument("-k", "--keep-versions", metavar="<number of versions>", help="Number of previous trained versions of a model kept for rollback", type=int, default=KEEP_VERSIONS)
+    parser.add_argument("-m", "--log-sample", metavar="<N>", help="Emit one out of every N per-request log records (werkzeug access log, ai.request)", type=int, default=1)
+    parser.add_argument("-t", "--trace-log", metavar="<trace log file>", help="Append the stage timings of every request to the file as JSON lines", type=str, default=None)
+    parser.add_argument("-r", "--retain-rows", metavar="<number of rows>", help="Default number of the latest testing instances kept in memory per model (all if not given)", type=int, default=None)
+    parser.add_argument("-e", "--retain-seconds", metavar="<seconds>", help="Default age of the oldest testing instance kept in memory per model (all if not given)", type=float, default=None)
+    parser.add_argument("-x", "--spill", help="Spill the evicted testing instances into segments in the dataset directory instead of discarding them", action="store_true")
+    parser.add_argument("-w", "--workers", metavar="<number of workers>", help="Number of pre-forked worker processes; each model lives in one worker chosen by its name", type=int, default=1)
+    parser.add_argument("-c", "--max-models", metavar="<number of models>", help="Number of models kept in memory (per worker); the least recently used ones are evicted to the dataset directory", type=int, default=None)
+    parser.add_argument("-f", "--dataset-root", metavar="<directory>", help="Directory of the dataset files POST /<model>/training can load (the path parameter is refused if not given)", type=str, default=None)
+    parser.add_argument("-b", "--max-memory", metavar="<megabytes>", help="Estimated memory of the models kept in memory (per worker); the least recently used ones are evicted to the dataset directory", type=float, default=None)
     args = parser.parse_args()
     return args
 
-def main():
-    args = command_line_args()
-    logging.basicConfig(level=args.log)
+# Serialized by the logging thread when the record is written
+class JsonLine:
+    def __init__(self, entry):
+        self.entry = entry
+
+    def __str__(self):
+        entry = dict(self.entry, stages={k: round(v * 1000, 3) for k, v in self.entry["stages"].items()})
+        return json.dumps(entry)
+
+# Per-request stage timings: every response carries the request id (X-Request-ID, taken from the caller
+# or generated) and a Server-Timing header with the time spent in each stage (milliseconds):
+#   routing (WSGI entry to the resource: request context, URL matching), parse, record, predict, shadow,
+#   serialize, and total; with trace_log, the same is appended to that file as one JSON object per line
+def enable_tracing(app, trace_log=None):
+    trace_logger = file_logger("ai.trace", trace_log) if trace_log else None
+
+    wsgi_app = app.wsgi_app
+    def timed_wsgi_app(environ, start_response):
+        environ["ai.received"] = time.perf_counter()
+        return wsgi_app(environ, start_response)
+    app.wsgi_app = timed_wsgi_app
+
+    @app.before_request
+    def begin_trace():
+        received = request.environ.get("ai.received")
+        trace = tracing.begin(request.headers.get(tracing.REQUEST_ID_HEADER), received)
+        trace.add("routing", time.perf_counter() - trace.start)
+
+    @app.after_request
+    def end_trace(response):
+        trace = tracing.end()
+        if trace is None:
+            return response
+        trace.add("total", time.perf_counter() - trace.start)
+        response.headers[tracing.REQUEST_ID_HEADER] = trace.request_id
+        response.headers["Server-Timing"] = trace.server_timing()
+        if trace_logger:
+            trace_logger.info("%s", JsonLine({"id": trace.request_id, "time": time.time(), "method": request.method, "path": request.path,
+                                              "status": response.status_code, "stages": trace.stages}))
+        return response
+
+def create_app(datadir=None, sync_every=SYNC_EVERY, keep_versions=KEEP_VERSIONS, owns=None, trace_log=None, retention=None, max_models=None, max_memory=None,
+               dataset_root=None):
+    if datadir and not os.path.exists(datadir):
+        os.makedirs(datadir)
 
     global ai
-    ai = AIModule()
+    ai = AIModule(datadir, sync_every, keep_versions, retention, max_models, max_memory, dataset_root)
+    ai.restore_models(owns)
 
     app = Flask(__name__)
+    enable_tracing(app, trace_log)
+
+    # The model of a request stays in memory until the request is over (a DELETE is not pinned:
+    # it is refused while the model is in use)
+    @app.before_request
+    def pin_model():
+        model_id = (request.view_args or {}).get("model_id")
+        if model_id and request.method != "DELETE":
+            ai.pin(model_id)
+            g.pinned = model_id
+
+    @app.teardown_request
+    def unpin_model(exc):
+        model_id = g.pop("pinned", None)
+        if model_id:
+            ai.unpin(model_id)
+
     api = Api(app)
     api.add_resource(Main, '/')
     api.add_resource(ModelGenerator, '/<string:model_id>')
@@ -437,7 +1684,61 @@ def main():
     api.add_resource(Tester, '/<string:model_id>/testing')
     api.add_resource(Evaluator, '/<string:model_id>/result')
     api.add_resource(DetailedEvaluator, '/<string:model_id>/detailed_evaluation')
+    api.add_resource(RollingEvaluator, '/<string:model_id>/rolling_evaluation')
+    api.add_resource(AccuracyCurve, '/<string:model_id>/accuracy_curve')
+    api.add_resource(Forecaster, '/<string:model_id>/forecast')
+    api.add_resource(BatchForecaster, '/forecast')
+    api.add_resource(ShadowManager, '/<string:model_id>/shadows')
+    api.add_resource(VersionManager, '/<string:model_id>/versions')
+    api.add_resource(Rollback, '/<string:model_id>/rollback')
+    api.add_resource(HistoryReport, '/<string:model_id>/history')
     api.add_resource(ThresholdConfig, '/config/threshold')
+    return app
+
+# Serve the app from a background thread of the current process (e.g., for tests and benchmarks)
+# The port 0 picks a free port; the actual one is server.server_port. Stop it with server.shutdown()
+def run_in_background(app, addr="127.0.0.1", port=0):
+    server = make_server(addr, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logging.info("The AI module is serving in-process on {}:{}".format(addr, server.server_port))
+    return server
+
+def main():
+    args = command_line_args()
+
+    if args.workers < 1:
+        logging.error("The number of workers should be larger than 0")
+        sys.exit(1)
+
+    retention = None
+    if args.retain_rows or args.retain_seconds:
+        retention = {"rows": args.retain_rows, "seconds": args.retain_seconds, "spill": args.spill}
+
+    if (args.max_models is not None and args.max_models < 1) or (args.max_memory is not None and args.max_memory <= 0):
+        logging.error("The caps of the model cache should be larger than 0")
+        sys.exit(1)
+    max_memory = int(args.max_memory * 1024 * 1024) if args.max_memory else None
+
+    if args.workers > 1:
+        # The algorithm modules are already imported (putils.autils), so the forked workers share
+        # their code pages copy-on-write; the models and their datasets are created in the workers.
+        # The logging threads are started after forking, in the master and in each worker
+        def make_app(owns):
+            setup_logging(args.log, args.log_sample, SAMPLED_LOGGERS)
+            app = create_app(args.datadir, args.sync_every, args.keep_versions, owns, args.trace_log, retention, args.max_models, max_memory,
+                             args.dataset_root)
+            def close():
+                ai.close()
+                stop_logging()
+            return app, close
+        serve(args.addr, args.port, args.workers, make_app, lambda: setup_logging(args.log, args.log_sample, SAMPLED_LOGGERS))
+        return
+
+    setup_logging(args.log, args.log_sample, SAMPLED_LOGGERS)
+    app = create_app(args.datadir, args.sync_every, args.keep_versions, trace_log=args.trace_log, retention=retention,
+                     max_models=args.max_models, max_memory=max_memory, dataset_root=args.dataset_root)
+    atexit.register(ai.close)
 
     app.run(host=args.addr, port=args.port)
 
@@ -3,6 +3,9 @@ class Algorithm:
         self.name = name
         self.predictor = None
         self.queue = []
+        self.scaler = None
+        # Number of past instances the algorithm learns from (None if it does not use windows)
+        self.sequence_length = None
 
     def get_name(self):
         return self.name
@@ -12,3 +15,27 @@ class Algorithm:
 
     def prediction(self, value):
         pass
+
+    # Learning with the training dataset of the model, whose rows were all given to observe()
+    def learning_observed(self, dataset, dimension=1):
+        return self.learning(dataset, dimension)
+
+    # Roll the model forward horizon steps from each of the windows (lists of instances)
+    # without changing its state; returns an array of the shape (len(windows), horizon, dimension)
+    def forecast(self, windows, horizon, dimension=1):
+        raise NotImplementedError("{} does not support forecasting".format(self.name))
+
+    # Update the running statistics of the preprocessing with training rows as they arrive
+    def observe(self, rows):
+        pass
+
+    # Store/restore the trained state under the path prefix; False if the algorithm does not support it
+    def save(self, prefix):
+        return False
+
+    def load(self, prefix):
+        return False
+
+    # Approximate number of bytes held by the trained state (for the memory cap of the model cache)
+    def get_footprint(self):
+        return 0
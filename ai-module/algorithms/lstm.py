@@ -1,39 +1,95 @@
 import sys
 import copy
+import math
 import logging
 import numpy as np
 from algorithms.algorithm import Algorithm
 from keras.models import Sequential
+from keras.models import load_model
 from keras.layers import Dense
 from keras.layers import LSTM
 from keras.layers import Activation
 from keras.layers import Dropout
 from keras.layers import Input
+from keras.utils import Sequence
 from sklearn.metrics import mean_squared_error
-from sklearn.preprocessing import StandardScaler
+from modules.scaler import IncrementalScaler
+from modules.data_manager import window_view
 
 SEQUENCE_LENGTH = 5
 THRESHOLD = 0.5
+BATCH_SIZE = 32
+
+class WindowBatches(Sequence):
+    """Training batches of normalized windows over the raw rows
+
+    The windows and labels are strided views of the rows (e.g., the memory-mapped training
+    dataset), so only one batch at a time is normalized into a new array. The order of the
+    batches is shuffled at every epoch.
+    """
+
+    def __init__(self, rows, length, normalize, batch_size=BATCH_SIZE):
+        super().__init__()
+        self.windows, self.labels = window_view(rows, length)
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self.order = np.arange(len(self))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return math.ceil(len(self.labels) / self.batch_size)
+
+    def __getitem__(self, i):
+        start = self.order[i] * self.batch_size
+        end = start + self.batch_size
+        return self.normalize(self.windows[start:end]), self.normalize(self.labels[start:end])[:, np.newaxis]
+
+    def on_epoch_end(self):
+        np.random.shuffle(self.order)
 
 class Lstm(Algorithm):
     def __init__(self, name):
         super().__init__(name)
+        # Standardization: running statistics of the training rows, and the (mean, scale)
+        # frozen when the predictor is trained
+        self.scaler = IncrementalScaler()
+        self.sequence_length = SEQUENCE_LENGTH
+        self.mean = None
+        self.scale = None
+
+    def observe(self, rows):
+        self.scaler.add_batch(rows)
+
+    # Every row of the training dataset of the model was observed: no pass for the statistics
+    def learning_observed(self, dataset, dimension=1):
+        stats = None
+        if self.scaler.count == len(dataset):
+            stats = self.scaler.snapshot()
+        return self.learning(dataset, dimension, stats)
+
+    def normalize(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        if self.mean is None:
+            return x
+        return (x - self.mean) / self.scale
+
+    def denormalize(self, x):
+        if self.mean is None:
+            return x
+        return x * self.scale + self.mean
 
     # Please implement the following functions
     # Concerning dataset, refer to the class TrainingSet
-    def learning(self, dataset, dimension=1):
-        training_set = []
-        labels = []
-        for i in range(len(dataset)-SEQUENCE_LENGTH-1):
-            training_set.append(dataset[i:i+SEQUENCE_LENGTH])
-            labels.append([dataset[i+SEQUENCE_LENGTH+1]])
-
-        training_set = np.array(training_set)
-        labels = np.array(labels)
+    # stats: the (mean, scale) of the dataset if already known, computed from the dataset otherwise
+    def learning(self, dataset, dimension=1, stats=None):
+        if stats is None:
+            stats = IncrementalScaler.of(dataset).snapshot()
+        self.mean, self.scale = stats if stats else (None, None)
+        # The rows are normalized batch by batch while fitting, never as a whole copy of the dataset
+        batches = WindowBatches(dataset, SEQUENCE_LENGTH, self.normalize)
+        training_set = batches.windows
 
-        logging.debug("training_set: {}".format(training_set))
-        logging.debug("training_set.shape: {}".format(training_set.shape))
-        logging.debug("labels.shape: {}".format(labels.shape))
+        logging.debug("training_set.shape: %s, batches: %d", training_set.shape, len(batches))
 
         self.predictor = Sequential()
         self.predictor.add(LSTM(128, return_sequences=True, activation='relu', input_shape=(training_set.shape[1], training_set.shape[2])))
@@ -44,7 +100,7 @@ class Lstm(Algorithm):
         self.predictor.compile(loss='mean_squared_error', optimizer='adam')
 
         try:
-            self.predictor.fit(training_set, labels, epochs=50, verbose=1)
+            self.predictor.fit(batches, epochs=50, verbose=1)
             logging.info("The {} predictor is well generated".format(self.get_name()))
         except:
             self.predictor = None
@@ -61,10 +117,49 @@ class Lstm(Algorithm):
             for _ in range(dimension):
                 ret.append(-1)
             return ret
-        sequence = np.array([self.queue])
+        sequence = self.normalize([self.queue])
         #sequence = sequence.reshape((sequence.shape[0], 1, sequence.shape[1]))
         #pred = list(self.predictor.predict(sequence))[0][0][0]
-        pred = list(self.predictor.predict(sequence))[0][0]
-        logging.debug("pred in algorithm: {}".format(pred))
+        pred = self.denormalize(np.asarray(self.predictor.predict(sequence))[0][0])
+        logging.debug("pred in algorithm: %s", pred)
 
         return pred
+
+    def forecast(self, windows, horizon, dimension=1):
+        if self.predictor is None:
+            raise ValueError("the {} predictor is not generated".format(self.get_name()))
+        for window in windows:
+            if len(window) < SEQUENCE_LENGTH:
+                raise ValueError("a window needs at least {} instances ({} given)".format(SEQUENCE_LENGTH, len(window)))
+
+        # One forward pass per step for the whole batch of windows
+        sequence = self.normalize([window[-SEQUENCE_LENGTH:] for window in windows])
+        ret = np.empty((len(windows), horizon, dimension), dtype=np.float32)
+        for step in range(horizon):
+            pred = np.asarray(self.predictor.predict_on_batch(sequence))[:, 0]
+            ret[:, step] = pred
+            sequence = np.concatenate([sequence[:, 1:], pred[:, np.newaxis, :]], axis=1)
+        return self.denormalize(ret)
+
+    def save(self, prefix):
+        if self.predictor is None:
+            return False
+        self.predictor.save("{}.keras".format(prefix))
+        if self.mean is not None:
+            np.savez("{}.scaler.npz".format(prefix), mean=self.mean, scale=self.scale)
+        return True
+
+    def load(self, prefix):
+        self.predictor = load_model("{}.keras".format(prefix))
+        try:
+            with np.load("{}.scaler.npz".format(prefix)) as stats:
+                self.mean, self.scale = stats["mean"], stats["scale"]
+        except FileNotFoundError:
+            self.mean, self.scale = None, None
+        return True
+
+    # The float32 weights of the network
+    def get_footprint(self):
+        if self.predictor is None:
+            return 0
+        return self.predictor.count_params() * 4
@@ -0,0 +1,60 @@
+import os
+import time
+import logging
+import numpy as np
+from algorithms.algorithm import Algorithm
+
+# Deterministic algorithm to benchmark the serving stack without an ML library
+# The behaviour is set with environment variables since the plugin loader
+# instantiates every algorithm with its name only
+#   STUB_MODE: echo (the next value is the current instance) or constant
+#   STUB_CONSTANT: the value predicted in the constant mode
+#   STUB_LATENCY_MS: artificial latency of a prediction in milliseconds
+class Stub(Algorithm):
+    def __init__(self, name):
+        super().__init__(name)
+        self.mode = os.environ.get("STUB_MODE", "echo")
+        self.constant = float(os.environ.get("STUB_CONSTANT", "0.0"))
+        self.latency = float(os.environ.get("STUB_LATENCY_MS", "0")) / 1000.0
+
+        if self.mode not in ("echo", "constant"):
+            logging.warning("Unknown STUB_MODE {}; echo is used instead".format(self.mode))
+            self.mode = "echo"
+
+    def learning(self, dataset, dimension=1):
+        self.predictor = self.mode
+        logging.info("The {} predictor is well generated (mode: {}, latency: {} s)".format(self.get_name(), self.mode, self.latency))
+        return True
+
+    def prediction(self, value, dimension=1):
+        self.queue = [value]
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if self.mode == "constant":
+            return [self.constant] * dimension
+        return list(value)
+
+    def forecast(self, windows, horizon, dimension=1):
+        if any(len(window) == 0 for window in windows):
+            raise ValueError("a window needs at least 1 instance")
+        if self.latency > 0:
+            time.sleep(self.latency * horizon)
+
+        if self.mode == "constant":
+            return np.full((len(windows), horizon, dimension), self.constant)
+        last = np.array([window[-1] for window in windows], dtype=np.float64)
+        return np.repeat(last[:, np.newaxis, :], horizon, axis=1)
+
+    # The trained state is the mode only
+    def save(self, prefix):
+        if self.predictor is None:
+            return False
+        with open("{}.stub".format(prefix), "w") as f:
+            f.write(self.predictor)
+        return True
+
+    def load(self, prefix):
+        with open("{}.stub".format(prefix)) as f:
+            self.predictor = f.read().strip()
+        return True
@@ -1,25 +1,164 @@
 import argparse
 import logging
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from modules.dataset_log import DatasetLog, SYNC_EVERY
+
+INITIAL_CAPACITY = 1024
+
+class RowBuffer:
+    """Growable contiguous array of rows (float32 by default; capacity doubles when full)
+
+    rows() is a view of the filled part; a view taken before a reallocation keeps
+    pointing to the old array, which already holds all of its rows.
+    """
+
+    def __init__(self, width, capacity=INITIAL_CAPACITY, dtype=np.float32):
+        self.buf = np.empty((capacity, width), dtype=dtype)
+        self.num = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.num
+
+    def _reserve(self, num):
+        if num <= len(self.buf):
+            return
+        capacity = len(self.buf)
+        while capacity < num:
+            capacity *= 2
+        buf = np.empty((capacity, self.buf.shape[1]), dtype=self.buf.dtype)
+        buf[:self.num] = self.buf[:self.num]
+        self.buf = buf
+
+    def append(self, row):
+        with self.lock:
+            self._reserve(self.num + 1)
+            self.buf[self.num] = row
+            self.num += 1
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=self.buf.dtype).reshape(-1, self.buf.shape[1])
+        with self.lock:
+            self._reserve(self.num + len(rows))
+            self.buf[self.num:self.num + len(rows)] = rows
+            self.num += len(rows)
+
+    def rows(self):
+        with self.lock:
+            return self.buf[:self.num]
+
+    # Drop the num oldest rows and return them; the remaining rows move to a new array,
+    # so the views handed out before stay valid
+    def trim(self, num):
+        with self.lock:
+            num = min(num, self.num)
+            capacity = INITIAL_CAPACITY
+            while capacity < self.num - num:
+                capacity *= 2
+            buf = np.empty((capacity, self.buf.shape[1]), dtype=self.buf.dtype)
+            buf[:self.num - num] = self.buf[num:self.num]
+            dropped = self.buf[:num]
+            self.buf = buf
+            self.num -= num
+            return dropped
+
+# The training windows of a sequence model over the rows, as strided views (no copy):
+#   windows[i] = rows[i:i+length], labels[i] = rows[i+length+1]
+def window_view(rows, length):
+    rows = np.asarray(rows)
+    num = max(len(rows) - length - 1, 0)
+    if num == 0:
+        return np.empty((0, length) + rows.shape[1:], dtype=rows.dtype), np.empty((0,) + rows.shape[1:], dtype=rows.dtype)
+    windows = sliding_window_view(rows, (length,) + rows.shape[1:])
+    windows = windows.reshape((windows.shape[0], length) + rows.shape[1:])[:num]
+    return windows, rows[length + 1:length + 1 + num]
 
 class DataManager:
-    def __init__(self):
+    # If path is given, the data is persisted in an append-only dataset log
+    # and get_data() returns a memory-mapped array instead of a list.
+    # width is the number of values per instance (None for scalar values).
+    # If contiguous is set (window-based algorithms), the rows are kept in memory in a growable
+    # array of dtype so get_data() is an up-to-date array view instead of a list to convert.
+    # (The dataset log stores float32 rows whatever the dtype.)
+    def __init__(self, path=None, width=None, sync_every=SYNC_EVERY, contiguous=False, dtype=np.float32):
         logging.info("Initializing the data manager")
         self.data = []
+        self.width = width
+        self.log = None
+        self.buffer = None
+        if path:
+            self.log = DatasetLog(path, width or 1, sync_every)
+        elif contiguous:
+            self.buffer = RowBuffer(width or 1, dtype=dtype)
+
     def __len__(self):
+        if self.log is not None:
+            return len(self.log)
+        if self.buffer is not None:
+            return len(self.buffer)
         return len(self.data)
 
     def add_data(self, value):
-        self.data.append(value)
+        if self.log is not None:
+            self.log.append(value if self.width else [value])
+        elif self.buffer is not None:
+            self.buffer.append(value)
+        else:
+            self.data.append(value)
+
+    def add_bulk(self, values):
+        if self.log is not None:
+            self.log.extend(values)
+        elif self.buffer is not None:
+            self.buffer.extend(values)
+        else:
+            self.data.extend(values.tolist() if hasattr(values, "tolist") else values)
 
     def get_num_of_training_data(self):
-        return len(self.data)
+        return len(self)
 
     def get_data(self):
+        if self.log is not None:
+            rows = self.log.rows()
+            return rows if self.width else rows[:, 0]
+        if self.buffer is not None:
+            rows = self.buffer.rows()
+            return rows if self.width else rows[:, 0]
         return self.data
 
+    # Drop the num oldest instances (retention) and return them as an array
+    def trim(self, num):
+        if self.log is not None:
+            rows = self.log.trim(num)
+        elif self.buffer is not None:
+            rows = self.buffer.trim(num)
+        else:
+            rows = np.asarray(self.data[:num], dtype=np.float32)
+            del self.data[:num]
+            return rows
+        return rows if self.width else rows[:, 0]
+
+    # Bytes of the instances held in memory (the rows of a dataset log are mapped from the file)
+    def get_footprint(self):
+        if self.log is not None:
+            return 0
+        if self.buffer is not None:
+            return self.buffer.buf.nbytes
+        return len(self.data) * (self.width or 1) * 8
+
     def pop_data(self):
+        if self.log is not None:
+            raise NotImplementedError("the dataset log {} is append-only".format(self.log.path))
+        if self.buffer is not None:
+            raise NotImplementedError("the contiguous dataset is append-only")
         return self.data.pop(0)
 
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
 def command_line_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", default="INFO", type=str)
@@ -0,0 +1,112 @@
+import os
+import argparse
+import logging
+import itertools
+import numpy as np
+
+# The 45-byte record produced by ProcessManager::processData on the edge (big-endian)
+#   temperature (avg, min, max) || humidity (avg, min, max) || power (avg, min, max, p25, p75) || month (1 byte)
+RECORD_DTYPE = np.dtype([("temperature", ">f4", (3,)), ("humidity", ">f4", (3,)), ("power", ">f4", (5,)), ("month", "u1")])
+RECORD_DIMENSION = 12
+CHUNK_ROWS = 1 << 16
+
+FORMATS = {
+    ".npy": "npy",
+    ".csv": "csv",
+    ".bin": "raw",
+    ".raw": "raw",
+    ".rec": "raw",
+}
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError("cannot infer the format of {} (use one of {})".format(path, sorted(set(FORMATS.values()))))
+    return FORMATS[ext]
+
+def load_npy(path, dimension):
+    # mmap_mode keeps the file out of the heap; only the touched pages are read
+    dataset = np.load(path, mmap_mode="r")
+    if dataset.ndim == 1 and dimension == 1:
+        dataset = dataset.reshape(-1, 1)
+    if dataset.ndim != 2 or dataset.shape[1] != dimension:
+        raise ValueError("{} has the shape {}, but (n, {}) is expected".format(path, dataset.shape, dimension))
+    return dataset
+
+def load_csv(path, dimension):
+    chunks = []
+    with open(path) as f:
+        first = f.readline()
+        try:
+            [float(v) for v in first.split(",")]
+            lines = itertools.chain([first], f)
+        except ValueError:
+            logging.debug("Skipping the header of {}: {}".format(path, first.strip()))
+            lines = f
+
+        while True:
+            block = list(itertools.islice(lines, CHUNK_ROWS))
+            if not block:
+                break
+            chunk = np.loadtxt(block, delimiter=",", dtype=np.float32, ndmin=2)
+            if chunk.shape[1] != dimension:
+                raise ValueError("{} has {} columns, but {} are expected".format(path, chunk.shape[1], dimension))
+            chunks.append(chunk)
+
+    if not chunks:
+        return np.empty((0, dimension), dtype=np.float32)
+    return np.concatenate(chunks)
+
+def load_raw(path, dimension):
+    if dimension != RECORD_DIMENSION:
+        raise ValueError("raw edge records have {} features, but the dimension is {}".format(RECORD_DIMENSION, dimension))
+    if os.path.getsize(path) % RECORD_DTYPE.itemsize:
+        raise ValueError("the size of {} is not a multiple of {} bytes".format(path, RECORD_DTYPE.itemsize))
+
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+    dataset = np.empty((len(records), dimension), dtype=np.float32)
+    for s in range(0, len(records), CHUNK_ROWS):
+        chunk = records[s:s+CHUNK_ROWS]
+        out = dataset[s:s+CHUNK_ROWS]
+        out[:, 0:3] = chunk["temperature"]
+        out[:, 3:6] = chunk["humidity"]
+        out[:, 6:11] = chunk["power"]
+        out[:, 11] = chunk["month"]
+    return dataset
+
+LOADERS = {
+    "npy": load_npy,
+    "csv": load_csv,
+    "raw": load_raw,
+}
+
+def load_dataset(path, dimension, fmt=None):
+    if not os.path.isfile(path):
+        raise ValueError("{} does not exist".format(path))
+    if fmt is None:
+        fmt = detect_format(path)
+    if fmt not in LOADERS:
+        raise ValueError("unsupported format {} (use one of {})".format(fmt, sorted(LOADERS.keys())))
+
+    dataset = LOADERS[fmt](path, dimension)
+    logging.info("Loaded {} instances from {} ({})".format(len(dataset), path, fmt))
+    return dataset
+
+def command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", required=True, metavar="<dataset file>", help="Dataset file (.npy, .csv or raw 45-byte edge records)", type=str)
+    parser.add_argument("-d", "--dimension", metavar="<dimension>", help="Number of features of an instance", type=int, default=RECORD_DIMENSION)
+    parser.add_argument("-t", "--format", metavar="<npy/csv/raw>", help="Dataset format (inferred from the extension if not given)", type=str, default=None)
+    parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", default="INFO", type=str)
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = command_line_args()
+    logging.basicConfig(level=args.log)
+
+    dataset = load_dataset(args.file, args.dimension, args.format)
+    logging.info("shape: {}".format(dataset.shape))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import struct
+import argparse
+import logging
+import threading
+import numpy as np
+
+# File layout: 16-byte header followed by fixed-width little-endian float32 rows
+#   magic (4 bytes) || version (2 bytes) || reserved (2 bytes) || width (4 bytes) || reserved (4 bytes)
+MAGIC = b"CDSL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+HEADER_SIZE = HEADER.size
+DTYPE = np.dtype("<f4")
+SYNC_EVERY = 64
+
+class DatasetLog:
+    """Append-only on-disk log of fixed-width float32 rows
+
+    Rows are appended through a buffered file handle and made durable with
+    fsync once every `sync_every` rows (and on flush/close). Readers get a
+    read-only memory-mapped (n, width) view, so replaying a large history on
+    startup costs neither parsing nor heap memory.
+    """
+
+    def __init__(self, path, width, sync_every=SYNC_EVERY):
+        self.path = path
+        self.width = width
+        self.sync_every = max(1, sync_every)
+        self.row_bytes = DTYPE.itemsize * width
+        self.pending = 0
+        self.mapped = None
+        # Appends and trims (which replace the file) exclude each other
+        self.lock = threading.RLock()
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, width, 0))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            self._check_header()
+
+        # A crash in the middle of a write can leave a partial trailing row
+        size = os.path.getsize(path)
+        extra = (size - HEADER_SIZE) % self.row_bytes
+        if extra:
+            logging.warning("Truncating {} bytes of a partial row in {}".format(extra, path))
+            os.truncate(path, size - extra)
+            size -= extra
+        self.num = (size - HEADER_SIZE) // self.row_bytes
+
+        self.fp = open(path, "ab")
+        logging.info("Opened the dataset log {} (width: {}, rows: {})".format(path, width, self.num))
+
+    def _check_header(self):
+        with open(self.path, "rb") as f:
+            buf = f.read(HEADER_SIZE)
+        if len(buf) != HEADER_SIZE:
+            raise ValueError("{} is not a dataset log (header too short)".format(self.path))
+        magic, version, _, width, _ = HEADER.unpack(buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a dataset log (magic: {}, version: {})".format(self.path, magic, version))
+        if width != self.width:
+            raise ValueError("{} stores rows of width {}, not {}".format(self.path, width, self.width))
+
+    def __len__(self):
+        return self.num
+
+    def append(self, row):
+        buf = np.asarray(row, dtype=DTYPE).reshape(self.width).tobytes()
+        with self.lock:
+            self.fp.write(buf)
+            self.num += 1
+            self.pending += 1
+            if self.pending >= self.sync_every:
+                self.sync()
+
+    def extend(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=DTYPE).reshape(-1, self.width)
+        with self.lock:
+            self.fp.write(rows.tobytes())
+            self.num += len(rows)
+            self.pending += len(rows)
+            if self.pending >= self.sync_every:
+                self.sync()
+
+    def sync(self):
+        with self.lock:
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+            self.pending = 0
+
+    def rows(self):
+        with self.lock:
+            if self.num == 0:
+                return np.empty((0, self.width), dtype=DTYPE)
+
+            # Rows still in the Python buffer should be visible to the mapping
+            if self.pending:
+                self.fp.flush()
+            if self.mapped is None or len(self.mapped) != self.num:
+                self.mapped = np.memmap(self.path, dtype=DTYPE, mode="r", offset=HEADER_SIZE, shape=(self.num, self.width))
+            return self.mapped
+
+    # Drop the num oldest rows and return a copy of them: the remaining rows are written to a new
+    # file that replaces the log, so mappings taken before keep reading the old file
+    def trim(self, num):
+        with self.lock:
+            num = min(num, self.num)
+            rows = self.rows()
+            dropped = np.array(rows[:num])
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, self.width, 0))
+                f.write(np.ascontiguousarray(rows[num:], dtype=DTYPE).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.fp.close()
+            os.replace(tmp, self.path)
+            self.fp = open(self.path, "ab")
+            self.num -= num
+            self.pending = 0
+            self.mapped = None
+            return dropped
+
+    def close(self):
+        if not self.fp.closed:
+            self.sync()
+            self.fp.close()
+        self.mapped = None
+
+def command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", required=True, metavar="<dataset log>", help="Dataset log to inspect", type=str)
+    parser.add_argument("-w", "--width", required=True, metavar="<row width>", help="Number of values in a row", type=int)
+    parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", default="INFO", type=str)
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = command_line_args()
+    logging.basicConfig(level=args.log)
+
+    dl = DatasetLog(args.file, args.width)
+    rows = dl.rows()
+    logging.info("rows: {}, shape: {}".format(len(dl), rows.shape))
+    if len(rows) > 0:
+        logging.info("last row: {}".format(rows[-1].tolist()))
+    dl.close()
+
+if __name__ == "__main__":
+    main()
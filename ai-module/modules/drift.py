@@ -0,0 +1,80 @@
+import inspect
+import logging
+from collections import deque
+
+class PageHinkley:
+    """Page-Hinkley test for an increase of the mean of the error
+
+    delta: tolerated change of the mean, threshold: alarm level of the
+    cumulative deviation, alpha: forgetting factor of the cumulative sum
+    """
+
+    def __init__(self, delta=0.01, threshold=1.0, alpha=0.9999, min_samples=30):
+        self.delta = delta
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.num = 0
+        self.mean = 0.0
+        self.cumulative = 0.0
+        self.minimum = 0.0
+
+    def update(self, error):
+        self.num += 1
+        self.mean += (error - self.mean) / self.num
+        self.cumulative = self.alpha * self.cumulative + (error - self.mean - self.delta)
+        self.minimum = min(self.minimum, self.cumulative)
+        return self.num >= self.min_samples and self.cumulative - self.minimum > self.threshold
+
+class ErrorRatio:
+    """Drift if the mean error of the last `window` errors exceeds `ratio` times
+    the mean error of the first `window` errors after the last reset
+    """
+
+    def __init__(self, window=100, ratio=2.0):
+        self.window = window
+        self.ratio = ratio
+        self.reset()
+
+    def reset(self):
+        self.reference = 0.0
+        self.num_reference = 0
+        self.recent = deque()
+        self.recent_sum = 0.0
+
+    def update(self, error):
+        if self.num_reference < self.window:
+            self.reference += error
+            self.num_reference += 1
+            return False
+
+        self.recent.append(error)
+        self.recent_sum += error
+        if len(self.recent) > self.window:
+            self.recent_sum -= self.recent.popleft()
+        if len(self.recent) < self.window:
+            return False
+        return self.recent_sum > self.ratio * self.reference
+
+DETECTORS = {
+    "page_hinkley": PageHinkley,
+    "error_ratio": ErrorRatio,
+}
+
+# Make a detector from the configuration {"method": <name>, <parameter>: <value>, ...}
+# The keys that are not the parameters of the detector (e.g., retraining options) are ignored
+def make_detector(config):
+    if not config or config.get("method", "none") == "none":
+        return None
+    method = config["method"]
+    if method not in DETECTORS:
+        raise ValueError("unknown drift detection method {} (use one of {})".format(method, sorted(DETECTORS.keys())))
+
+    cls = DETECTORS[method]
+    params = list(inspect.signature(cls).parameters)
+    detector = cls(**{k: v for k, v in config.items() if k in params})
+    logging.info("Drift detection with {} ({})".format(method, {k: getattr(detector, k) for k in params}))
+    return detector
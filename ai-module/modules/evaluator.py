@@ -1,7 +1,8 @@
 import math
 import numpy as np
 import logging
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
+from modules.retention import ErrorSums
 
 class ModelEvaluator:
     """모델 예측 성능을 다양한 지표로 평가하는 클래스"""
@@ -16,7 +17,9 @@ class ModelEvaluator:
     
     def calculate_metrics(self, actual_values: List[float], 
                          predicted_values: List[float], 
-                         power_index: int) -> Dict[str, Any]:
+                         power_index: int,
+                         threshold: Optional[float] = None,
+                         history: Optional[Any] = None) -> Dict[str, Any]:
         """
         예측값과 실제값을 비교하여 다양한 평가 지표를 계산
         
@@ -24,29 +27,37 @@ class ModelEvaluator:
             actual_values: 실제 데이터 시퀀스 (다차원 배열)
             predicted_values: 예측값 리스트
             power_index: 전력값이 위치한 인덱스
+            threshold: 이 계산에만 사용할 임계값 (None이면 설정된 임계값)
+            history: 보존 정책으로 메모리에서 제거된 데이터의 누적 요약 (modules.retention.History)
             
         Returns:
-            평가 지표들을 담은 딕셔너리
+            평가 지표들을 담은 딕셔너리 (history가 있으면 스칼라 지표는 전체 기간 기준,
+            배열은 메모리에 남은 데이터 기준)
         """
-        if not actual_values or not predicted_values:
+        evicted = history.sums.n if history is not None else 0
+        if (len(actual_values) == 0 or len(predicted_values) == 0) and not evicted:
             return {"error": "데이터가 비어있습니다"}
         
         # 유효한 데이터만 추출 (-1이 아닌 예측값)
-        valid_data = self._extract_valid_data(actual_values, predicted_values, power_index)
+        threshold = self.threshold if threshold is None else threshold
+        valid_data = self._extract_valid_data(actual_values, predicted_values, power_index, threshold)
         
-        if not valid_data['actual'] or not valid_data['predicted']:
+        if len(valid_data['actual']) == 0 and not evicted:
             return {"error": "유효한 데이터가 없습니다"}
         
-        actual = np.array(valid_data['actual'])
-        predicted = np.array(valid_data['predicted'])
+        if evicted:
+            return self._merge_history(valid_data, threshold, history)
+        
+        actual = valid_data['actual']
+        predicted = valid_data['predicted']
         
         # 다양한 평가 지표 계산
         metrics = {
             "num_samples": len(actual),
-            "threshold": self.threshold,
+            "threshold": threshold,
             
             # 기본 정확도 (기존 방식)
-            "accuracy": self._calculate_accuracy(actual, predicted),
+            "accuracy": round(valid_data['correct'] / len(actual) * 100, 2),
             
             # 회귀 평가 지표들
             "mae": self._calculate_mae(actual, predicted),
@@ -59,56 +70,118 @@ class ModelEvaluator:
             "mean_error": self._calculate_mean_error(actual, predicted),
             "std_error": self._calculate_std_error(actual, predicted),
             
-            # 상세 결과
+            # 상세 결과 (NumPy 배열 그대로 반환, 직렬화는 응답 계층에서 처리)
             "correct_predictions": valid_data['correct'],
             "incorrect_predictions": valid_data['incorrect'],
-            "actual_values": actual.tolist(),
-            "predicted_values": predicted.tolist(),
-            "errors": (predicted - actual).tolist(),
-            "relative_errors": ((predicted - actual) / actual).tolist()
+            "actual_values": actual,
+            "predicted_values": predicted,
+            "errors": predicted - actual,
+            "relative_errors": valid_data['relative_errors']
         }
         
         return metrics
     
+    def _merge_history(self, valid_data: Dict[str, Any], threshold: float, history: Any) -> Dict[str, Any]:
+        """메모리에 남은 데이터와 제거된 데이터의 누적 합을 합쳐 전체 기간의 지표를 계산"""
+        actual = valid_data['actual']
+        predicted = valid_data['predicted']
+        sums = ErrorSums.of(actual, predicted)
+        sums.add(history.sums)
+        num = int(sums.n)
+        correct = valid_data['correct'] + history.correct(threshold)
+        
+        metrics = {"num_samples": num, "threshold": threshold, "accuracy": round(correct / num * 100, 2)}
+        metrics.update(sums.metrics())
+        metrics.update({
+            "correct_predictions": correct,
+            "incorrect_predictions": num - correct,
+            "retained_samples": len(actual),
+            "actual_values": actual,
+            "predicted_values": predicted,
+            "errors": predicted - actual,
+            "relative_errors": valid_data['relative_errors']
+        })
+        return metrics
+    
     def _extract_valid_data(self, actual_values: List, predicted_values: List, 
-                           power_index: int) -> Dict[str, List]:
-        """유효한 데이터만 추출하고 정확/부정확 분류"""
-        actual = []
-        predicted = []
-        correct = 0
-        incorrect = 0
-        
-        for i, pred in enumerate(predicted_values):
-            if pred == -1:  # 유효하지 않은 예측값 제외
-                continue
-                
-            if i < len(actual_values):
-                actual_val = actual_values[i][power_index]
-                actual.append(actual_val)
-                predicted.append(pred)
-                
-                # 정확도 판정 (상대 오차 기준)
-                relative_error = abs((pred - actual_val) / actual_val)
-                if relative_error <= self.threshold:
-                    correct += 1
-                else:
-                    incorrect += 1
+                           power_index: int, threshold: float) -> Dict[str, Any]:
+        """유효한 데이터만 추출하고 정확/부정확 분류 (벡터화)"""
+        predicted = np.asarray(predicted_values, dtype=np.float64)
+        actual = np.asarray(actual_values, dtype=np.float64)
+        num = min(len(predicted), len(actual))
+        
+        predicted = predicted[:num]
+        actual = actual[:num, power_index] if num > 0 else np.empty(0)
+        
+        # 유효하지 않은 예측값(-1) 제외
+        mask = predicted != -1
+        actual = actual[mask]
+        predicted = predicted[mask]
+        
+        # 정확도 판정 (상대 오차 기준)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative_errors = (predicted - actual) / actual
+        correct = int(np.count_nonzero(np.abs(relative_errors) <= threshold))
         
         return {
             'actual': actual,
             'predicted': predicted,
+            'relative_errors': relative_errors,
             'correct': correct,
-            'incorrect': incorrect
+            'incorrect': len(actual) - correct
         }
     
-    def _calculate_accuracy(self, actual: np.ndarray, predicted: np.ndarray) -> float:
-        """기존 방식의 정확도 계산 (상대 오차 기준)"""
-        correct = 0
-        for i in range(len(actual)):
-            relative_error = abs((predicted[i] - actual[i]) / actual[i])
-            if relative_error <= self.threshold:
-                correct += 1
-        return round((correct / len(actual)) * 100, 2)
+    def accuracy_curve(self, actual_values: List, predicted_values: List,
+                       power_index: int, thresholds: Optional[List[float]] = None,
+                       points: int = 1000, history: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        여러 임계값에 대한 정확도를 한 번에 계산
+        
+        상대 오차를 한 번 정렬한 뒤 searchsorted로 각 임계값 이하의 개수를 구함
+        
+        Args:
+            actual_values: 실제 데이터 시퀀스 (다차원 배열)
+            predicted_values: 예측값 리스트
+            power_index: 전력값이 위치한 인덱스
+            thresholds: 정확도를 계산할 임계값 목록 (None이면 정확도 CDF 반환)
+            points: CDF로 반환할 최대 점의 개수
+            history: 보존 정책으로 제거된 데이터의 누적 요약 (있으면 전체 기간의 정확도)
+            
+        Returns:
+            임계값별 정확도(%)를 담은 딕셔너리
+        """
+        evicted = int(history.sums.n) if history is not None else 0
+        if (len(actual_values) == 0 or len(predicted_values) == 0) and not evicted:
+            return {"error": "데이터가 비어있습니다"}
+        
+        valid_data = self._extract_valid_data(actual_values, predicted_values, power_index, self.threshold)
+        num = len(valid_data['actual'])
+        if num == 0 and not evicted:
+            return {"error": "유효한 데이터가 없습니다"}
+        
+        # 0으로 나눈 상대 오차(nan)는 어떤 임계값에서도 부정확으로 처리
+        errors = np.abs(valid_data['relative_errors'])
+        errors = np.sort(np.where(np.isnan(errors), np.inf, errors))
+        
+        if thresholds is not None:
+            thresholds = np.asarray(thresholds, dtype=np.float64)
+        elif num > 0:
+            # 정확도 CDF: 정렬된 오차에서 최대 points개를 고르게 선택
+            idx = np.unique(np.linspace(0, num - 1, min(points, num)).astype(np.int64))
+            thresholds = errors[idx]
+        else:
+            # 남은 데이터가 없으면 누적 히스토그램의 격자에서 선택
+            thresholds = np.linspace(0, 2, min(points, 2001))
+        
+        correct = np.searchsorted(errors, thresholds, side='right')
+        if evicted:
+            correct = correct + history.correct_many(thresholds)
+            num += evicted
+        return {
+            "num_samples": num,
+            "thresholds": thresholds,
+            "accuracy": np.round(correct / num * 100, 2)
+        }
     
     def _calculate_mae(self, actual: np.ndarray, predicted: np.ndarray) -> float:
         """평균 절대 오차 (Mean Absolute Error)"""
@@ -183,4 +256,4 @@ class ModelEvaluator:
     def set_threshold(self, new_threshold: float) -> None:
         """정확도 판정 임계값 변경"""
         self.threshold = new_threshold
-        logging.info(f"임계값 변경: {new_threshold}") 
\ No newline at end of file
+        logging.info(f"임계값 변경: {new_threshold}")
@@ -39,12 +39,65 @@ class ModelManager:
         return self.error
 
     def learning(self, dm, dimension=1):
-        return self.algorithms[self.algorithm].learning(dm.get_data(), dimension)
+        return self.algorithms[self.algorithm].learning_observed(dm.get_data(), dimension)
+
+    def learning_dataset(self, dataset, dimension=1):
+        return self.algorithms[self.algorithm].learning(dataset, dimension)
+
+    def get_sequence_length(self):
+        return self.algorithms[self.algorithm].sequence_length
+
+    def is_trained(self):
+        return self.algorithms[self.algorithm].predictor is not None
+
+    def observe(self, value):
+        self.algorithms[self.algorithm].observe([value])
+
+    def observe_bulk(self, values):
+        self.algorithms[self.algorithm].observe(values)
+
+    # The running statistics of the training rows (None if the algorithm has no preprocessing)
+    def get_statistics(self):
+        return self.algorithms[self.algorithm].scaler
+
+    def set_statistics(self, scaler):
+        if scaler is not None and self.algorithms[self.algorithm].scaler is not None:
+            self.algorithms[self.algorithm].scaler = scaler
+
+    def save(self, prefix):
+        return self.algorithms[self.algorithm].save(prefix)
+
+    def load(self, prefix):
+        return self.algorithms[self.algorithm].load(prefix)
+
+    def get_footprint(self):
+        return self.algorithms[self.algorithm].get_footprint()
+
+    # The recent instances kept by the algorithm to make the next prediction
+    def get_window(self):
+        return list(self.algorithms[self.algorithm].queue)
+
+    def set_window(self, window):
+        self.algorithms[self.algorithm].queue = list(window)
 
     def prediction(self, value, dimension=1):
         pred = self.algorithms[self.algorithm].prediction(value, dimension)
         return pred
 
+    def forecast(self, windows, horizon, dimension=1):
+        return self.algorithms[self.algorithm].forecast(windows, horizon, dimension)
+
+    # Run the predictor once (on the window, or zeros if it is too short) so that the first
+    # served prediction does not pay for the setup of a freshly trained predictor
+    def warmup(self, window, dimension=1):
+        length = self.get_sequence_length() or 1
+        if len(window) < length:
+            window = [[0.0] * dimension] * length
+        try:
+            self.forecast([window], 1, dimension)
+        except (NotImplementedError, ValueError):
+            pass
+
 def command_line_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-a", "--algorithm", required=True, metavar="<ml algorithm for prediction>", help="ML algorithm for prediction", type=str)
@@ -0,0 +1,316 @@
+import os
+import glob
+import math
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+from modules.dataset_log import DatasetLog
+
+SLACK = 0.125            # rows beyond the limit (ratio of the limit) before trimming, so trims are amortized
+MIN_SLACK = 64
+TIME_RESOLUTION = 1.0    # seconds between two marks of the arrival times
+SEGMENT_ROWS = 1 << 20   # rows per spill segment
+MAX_BUCKETS = 512        # downsampled aggregates kept per model (adjacent pairs merge when full)
+BUCKET_ROWS = 1024       # rows per aggregate before any merge
+HIST_STEP = 0.001        # resolution of the relative error histogram
+HIST_BINS = 2002         # |relative error| in [0, 2] by HIST_STEP, plus one bin above
+
+class RetentionPolicy:
+    """Keep the last `rows` testing instances and/or the ones of the last `seconds` in memory
+
+    Older instances are dropped from the testing/result datasets; with spill they are
+    first appended to on-disk segments. Either way they are folded into a History.
+    """
+
+    def __init__(self, rows=None, seconds=None, spill=False):
+        self.rows = int(rows) if rows else None
+        self.seconds = float(seconds) if seconds else None
+        self.spill = bool(spill)
+
+    def to_dict(self):
+        return {"rows": self.rows, "seconds": self.seconds, "spill": self.spill}
+
+# Make a policy from the configuration {"rows": N, "seconds": T, "spill": bool}; None keeps everything
+def make_policy(config):
+    if not config or not (config.get("rows") or config.get("seconds")):
+        return None
+    unknown = set(config) - {"rows", "seconds", "spill"}
+    if unknown:
+        raise ValueError("unknown retention options {} (use rows, seconds, spill)".format(sorted(unknown)))
+    if (config.get("rows") or 0) < 0 or (config.get("seconds") or 0) < 0:
+        raise ValueError("the retention rows and seconds should not be negative")
+    policy = RetentionPolicy(config.get("rows"), config.get("seconds"), config.get("spill", False))
+    logging.info("Retention policy: {}".format(policy.to_dict()))
+    return policy
+
+class ErrorSums:
+    """Sums over (actual, predicted) pairs from which the regression metrics are derived exactly"""
+
+    FIELDS = ["n", "sum_e", "sum_e2", "sum_abs", "n_rel", "sum_rel", "sum_a", "sum_a2"]
+
+    def __init__(self):
+        for f in self.FIELDS:
+            setattr(self, f, 0.0)
+
+    @classmethod
+    def of(cls, actual, predicted):
+        sums = cls()
+        sums.add_pairs(actual, predicted)
+        return sums
+
+    def add_pairs(self, actual, predicted):
+        actual = np.asarray(actual, dtype=np.float64)
+        errors = np.asarray(predicted, dtype=np.float64) - actual
+        nonzero = actual != 0
+        self.n += len(actual)
+        self.sum_e += float(errors.sum())
+        self.sum_e2 += float((errors ** 2).sum())
+        self.sum_abs += float(np.abs(errors).sum())
+        self.n_rel += int(np.count_nonzero(nonzero))
+        self.sum_rel += float(np.abs(errors[nonzero] / actual[nonzero]).sum())
+        self.sum_a += float(actual.sum())
+        self.sum_a2 += float((actual ** 2).sum())
+
+    def add(self, other):
+        for f in self.FIELDS:
+            setattr(self, f, getattr(self, f) + getattr(other, f))
+
+    # The metrics of ModelEvaluator.calculate_metrics over the pairs
+    def metrics(self):
+        n = self.n
+        mse = self.sum_e2 / n
+        mean_error = self.sum_e / n
+        ss_tot = self.sum_a2 - self.sum_a ** 2 / n
+        if ss_tot <= 0:
+            r_squared = 1.0 if self.sum_e2 == 0 else 0.0
+        else:
+            r_squared = 1 - self.sum_e2 / ss_tot
+        return {
+            "mae": self.sum_abs / n,
+            "mse": mse,
+            "rmse": math.sqrt(mse),
+            "mape": self.sum_rel / self.n_rel * 100 if self.n_rel else float("inf"),
+            "r_squared": r_squared,
+            "mean_error": mean_error,
+            "std_error": math.sqrt(max(mse - mean_error ** 2, 0.0)),
+        }
+
+    def to_array(self):
+        return np.array([getattr(self, f) for f in self.FIELDS], dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, values):
+        sums = cls()
+        for f, v in zip(cls.FIELDS, values):
+            setattr(sums, f, float(v))
+        return sums
+
+# Histogram bin of |relative error|: bin k holds the errors in ((k-1) * HIST_STEP, k * HIST_STEP]
+def error_bins(actual, predicted):
+    actual = np.asarray(actual, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.abs((np.asarray(predicted, dtype=np.float64) - actual) / actual)
+    # nan (actual 0) is never correct, like ModelEvaluator
+    errors = np.where(np.isnan(errors), np.inf, errors)
+    bins = np.ceil(np.round(errors / HIST_STEP, 6))
+    return np.minimum(bins, HIST_BINS - 1).astype(np.int64)
+
+class History:
+    """Summary of the testing instances (and their predictions) evicted by the retention policy
+
+    The counts and error sums are exact; the number of correct predictions is exact for every
+    threshold that is a multiple of HIST_STEP up to 2 (other thresholds round down to that grid).
+    The aggregates are downsampled: a bucket covers BUCKET_ROWS evicted rows, and adjacent
+    buckets merge whenever there are more than MAX_BUCKETS of them.
+    """
+
+    def __init__(self, path=None, segment_prefix=None, dimension=1):
+        self.path = path
+        self.segment_prefix = segment_prefix
+        self.dimension = dimension
+        self.evicted = 0
+        self.invalid = 0
+        self.sums = ErrorSums()
+        self.hist = np.zeros(HIST_BINS, dtype=np.int64)
+        self.bucket_rows = BUCKET_ROWS
+        # [start time, end time, rows, valid, sum actual, sum predicted, sum |error|]
+        self.buckets = []
+        self.segment = None
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def add(self, rows, predictions, index, start, end):
+        predictions = np.asarray(predictions, dtype=np.float64)
+        rows = np.asarray(rows)
+        with self.lock:
+            if self.segment_prefix:
+                self.spill(rows, predictions)
+            valid = predictions != -1
+            actual = rows[:, index].astype(np.float64)
+            self.sums.add_pairs(actual[valid], predictions[valid])
+            self.hist += np.bincount(error_bins(actual[valid], predictions[valid]), minlength=HIST_BINS)
+            self.aggregate(actual, predictions, valid, start, end)
+            self.evicted += len(rows)
+            self.invalid += int(len(rows) - np.count_nonzero(valid))
+
+    def aggregate(self, actual, predictions, valid, start, end):
+        num = len(actual)
+        # The arrival times are only known as a range; they are spread evenly over the rows
+        times = np.linspace(start, end, num) if num > 1 else np.full(num, start)
+        pos = 0
+        while pos < num:
+            if not self.buckets or self.buckets[-1][2] >= self.bucket_rows:
+                self.buckets.append([times[pos], times[pos], 0, 0, 0.0, 0.0, 0.0])
+            bucket = self.buckets[-1]
+            take = min(self.bucket_rows - int(bucket[2]), num - pos)
+            part = slice(pos, pos + take)
+            v = valid[part]
+            bucket[1] = times[pos + take - 1]
+            bucket[2] += take
+            bucket[3] += int(np.count_nonzero(v))
+            bucket[4] += float(actual[part][v].sum())
+            bucket[5] += float(predictions[part][v].sum())
+            bucket[6] += float(np.abs(predictions[part][v] - actual[part][v]).sum())
+            pos += take
+            if len(self.buckets) > MAX_BUCKETS:
+                self.merge_buckets()
+
+    def merge_buckets(self):
+        merged = []
+        for i in range(0, len(self.buckets) - 1, 2):
+            a, b = self.buckets[i], self.buckets[i + 1]
+            merged.append([a[0], b[1]] + [x + y for x, y in zip(a[2:], b[2:])])
+        if len(self.buckets) % 2:
+            merged.append(self.buckets[-1])
+        self.buckets = merged
+        self.bucket_rows *= 2
+
+    # Evicted rows are appended to segments of SEGMENT_ROWS rows: <prefix>.<n>.log, each row being
+    # the testing instance followed by its prediction
+    def spill(self, rows, predictions):
+        pos = 0
+        while pos < len(rows):
+            if self.segment is None or len(self.segment) >= SEGMENT_ROWS:
+                if self.segment is not None:
+                    self.segment.close()
+                self.segment = DatasetLog("{}.{}.log".format(self.segment_prefix, self.evicted + pos), self.dimension + 1)
+            take = min(SEGMENT_ROWS - len(self.segment), len(rows) - pos)
+            self.segment.extend(np.column_stack([rows[pos:pos + take], predictions[pos:pos + take]]))
+            pos += take
+
+    def get_segments(self):
+        if not self.segment_prefix:
+            return []
+        paths = glob.glob("{}.*.log".format(glob.escape(self.segment_prefix)))
+        return sorted(paths, key=lambda p: int(p[len(self.segment_prefix) + 1:-len(".log")]))
+
+    # Number of evicted predictions whose |relative error| <= each threshold
+    def correct_many(self, thresholds):
+        cumulative = np.cumsum(self.hist[:HIST_BINS - 1])
+        k = np.floor(np.round(np.asarray(thresholds, dtype=np.float64) / HIST_STEP, 6))
+        k = np.clip(k, -1, HIST_BINS - 2).astype(np.int64)
+        return np.where(k < 0, 0, cumulative[np.maximum(k, 0)])
+
+    def correct(self, threshold):
+        return int(self.correct_many([threshold])[0])
+
+    def report(self):
+        with self.lock:
+            buckets = [{"start": float(b[0]), "end": float(b[1]), "num": int(b[2]), "valid": int(b[3]),
+                        "actual": b[4] / b[3] if b[3] else None, "predicted": b[5] / b[3] if b[3] else None,
+                        "mae": b[6] / b[3] if b[3] else None} for b in self.buckets]
+            return {"evicted": self.evicted, "invalid": self.invalid, "bucket_rows": self.bucket_rows,
+                    "segments": [os.path.basename(p) for p in self.get_segments()], "aggregates": buckets}
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, counts=np.array([self.evicted, self.invalid, self.bucket_rows], dtype=np.int64),
+                         sums=self.sums.to_array(), hist=self.hist,
+                         buckets=np.array(self.buckets, dtype=np.float64).reshape(-1, 7))
+            os.replace(tmp, self.path)
+
+    def load(self):
+        with np.load(self.path) as data:
+            self.evicted, self.invalid, self.bucket_rows = (int(x) for x in data["counts"])
+            self.sums = ErrorSums.from_array(data["sums"])
+            self.hist = data["hist"].astype(np.int64)
+            self.buckets = [list(b) for b in data["buckets"].tolist()]
+        logging.info("Loaded the history of {} evicted instances from {}".format(self.evicted, self.path))
+
+    def close(self):
+        self.save()
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+
+class Retainer:
+    """Applies a retention policy to the testing/result datasets of a model
+
+    The i-th result is the prediction about the i-th testing instance, so both datasets
+    drop the same number of oldest rows. Trims happen once the datasets exceed the limit by
+    a slack, which bounds the memory by (1 + SLACK) * limit rows and amortizes the copies.
+    """
+
+    def __init__(self, policy, history):
+        self.policy = policy
+        self.history = history
+        self.marks = deque()   # (arrival time, number of instances added before it)
+        self.added = 0
+        self.lock = threading.Lock()
+
+    # Called after each testing instance; restored instances count as arriving now
+    def observe(self, num=1, now=None):
+        now = time.time() if now is None else now
+        if not self.marks or now - self.marks[-1][0] >= TIME_RESOLUTION:
+            self.marks.append((now, self.added))
+        self.added += num
+
+    # Number of the oldest instances to evict out of the num retained ones
+    def excess(self, num, now):
+        drop = 0
+        if self.policy.rows is not None:
+            limit = self.policy.rows
+            if num > limit + max(int(limit * SLACK), MIN_SLACK):
+                drop = num - limit
+        if self.policy.seconds is not None and self.marks and self.marks[0][0] < now - self.policy.seconds:
+            # The instances before the first mark within the retention time are older than it
+            cutoff = now - self.policy.seconds
+            first_kept = next((added for t, added in self.marks if t >= cutoff), self.added)
+            evictable = first_kept - (self.added - num)
+            if evictable >= max(int(num * SLACK), MIN_SLACK):
+                drop = max(drop, evictable)
+        return min(drop, num)
+
+    # Trim testing/results if needed; returns the number of evicted instances (0 if another thread trims)
+    def trim(self, testing, results, index, now=None):
+        now = time.time() if now is None else now
+        if not self.lock.acquire(blocking=False):
+            return 0
+        try:
+            drop = self.excess(len(testing), now)
+            if drop <= 0:
+                return 0
+            base = self.added - len(testing)
+            start = self.marks[0][0] if self.marks else now
+            end = start
+            for t, added in self.marks:
+                if added >= base + drop:
+                    break
+                end = t
+            rows = testing.trim(drop)
+            predictions = results.trim(drop)
+            self.history.add(rows, predictions, index, start, end)
+            while len(self.marks) > 1 and self.marks[1][1] <= base + drop:
+                self.marks.popleft()
+            self.history.save()
+            return drop
+        finally:
+            self.lock.release()
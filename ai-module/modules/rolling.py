@@ -0,0 +1,131 @@
+import math
+import time
+import threading
+from collections import deque
+
+DEFAULT_WINDOWS = [100, 1000]           # last N resolved predictions
+DEFAULT_TIME_WINDOWS = [3600, 86400]    # last T seconds
+
+# Fields of an entry (one resolved prediction) and of the running sums
+ERROR, ABS_ERROR, SQ_ERROR, ABS_PCT_ERROR, PCT_COUNT, CORRECT = range(6)
+NUM_FIELDS = 6
+
+def make_entry(actual, predicted, threshold):
+    error = predicted - actual
+    if actual != 0:
+        ape = abs(error / actual)
+        return (error, abs(error), error * error, ape, 1.0, 1.0 if ape <= threshold else 0.0)
+    return (error, abs(error), error * error, 0.0, 0.0, 0.0)
+
+def summarize(count, sums):
+    if count == 0:
+        return {"num_samples": 0}
+    return {
+        "num_samples": count,
+        "accuracy": round(sums[CORRECT] / count * 100, 2),
+        "mae": sums[ABS_ERROR] / count,
+        "rmse": math.sqrt(max(sums[SQ_ERROR], 0.0) / count),
+        "mape": sums[ABS_PCT_ERROR] / sums[PCT_COUNT] * 100 if sums[PCT_COUNT] > 0 else None,
+        "bias": sums[ERROR] / count,
+    }
+
+class CountWindow:
+    """Running sums over the last `size` entries, kept in a ring buffer"""
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = [None] * size
+        self.pos = 0
+        self.count = 0
+        self.sums = [0.0] * NUM_FIELDS
+
+    def add(self, entry, ts):
+        old = self.buf[self.pos]
+        self.buf[self.pos] = entry
+        sums = self.sums
+        if old is None:
+            self.count += 1
+            for i in range(NUM_FIELDS):
+                sums[i] += entry[i]
+        else:
+            for i in range(NUM_FIELDS):
+                sums[i] += entry[i] - old[i]
+        self.pos += 1
+
+        # Recompute the sums once per lap so rounding errors do not accumulate (amortized O(1))
+        if self.pos == self.size:
+            self.pos = 0
+            self.sums = [math.fsum(e[i] for e in self.buf) for i in range(NUM_FIELDS)]
+
+    def report(self, now):
+        return summarize(self.count, self.sums)
+
+    def get_name(self):
+        return "last_{}".format(self.size)
+
+class TimeWindow:
+    """Running sums over the entries of the last `seconds` seconds"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.entries = deque()
+        self.sums = [0.0] * NUM_FIELDS
+
+    def add(self, entry, ts):
+        self.entries.append((ts, entry))
+        for i in range(NUM_FIELDS):
+            self.sums[i] += entry[i]
+        self.evict(ts)
+
+    def evict(self, now):
+        limit = now - self.seconds
+        while self.entries and self.entries[0][0] <= limit:
+            _, old = self.entries.popleft()
+            for i in range(NUM_FIELDS):
+                self.sums[i] -= old[i]
+        if not self.entries:
+            self.sums = [0.0] * NUM_FIELDS
+
+    def report(self, now):
+        self.evict(now)
+        return summarize(len(self.entries), self.sums)
+
+    def get_name(self):
+        return "last_{}s".format(self.seconds)
+
+# The window sizes of a model (None for the defaults) should be lists of positive integers
+def check_windows(windows, time_windows):
+    for key, sizes in (("windows", windows), ("time_windows", time_windows)):
+        if sizes is None:
+            continue
+        if not isinstance(sizes, list) or not all(isinstance(n, int) and not isinstance(n, bool) and n > 0 for n in sizes):
+            raise ValueError("the {} should be a list of positive integers".format(key))
+
+class RollingMetrics:
+    """Accuracy, MAE, RMSE, MAPE and bias over sliding windows with O(1) updates
+
+    Accuracy uses the threshold in effect when each prediction is resolved.
+    """
+
+    def __init__(self, windows=None, time_windows=None):
+        self.windows = [CountWindow(n) for n in (windows if windows is not None else DEFAULT_WINDOWS)]
+        self.windows += [TimeWindow(t) for t in (time_windows if time_windows is not None else DEFAULT_TIME_WINDOWS)]
+        self.lock = threading.Lock()
+
+    def add(self, actual, predicted, threshold, ts=None):
+        entry = make_entry(float(actual), float(predicted), threshold)
+        with self.lock:
+            for w in self.windows:
+                # Entries replayed without a timestamp only go to the count windows
+                if ts is None and isinstance(w, TimeWindow):
+                    continue
+                w.add(entry, ts)
+
+    def get_max_count(self):
+        sizes = [w.size for w in self.windows if isinstance(w, CountWindow)]
+        return max(sizes) if sizes else 0
+
+    def report(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            return {w.get_name(): w.report(now) for w in self.windows}
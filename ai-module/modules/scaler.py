@@ -0,0 +1,62 @@
+import threading
+import numpy as np
+
+CHUNK_ROWS = 1 << 16
+
+class IncrementalScaler:
+    """Running mean and standard deviation of the rows (per column), updated as the rows arrive
+
+    Single rows use Welford's update and batches are merged with Chan's parallel update,
+    so the statistics never need another pass over the rows seen before.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.lock = threading.Lock()
+
+    def add(self, row):
+        x = np.asarray(row, dtype=np.float64)
+        with self.lock:
+            if self.count == 0:
+                self.mean = np.zeros_like(x)
+                self.m2 = np.zeros_like(x)
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+
+    def add_batch(self, rows):
+        for start in range(0, len(rows), CHUNK_ROWS):
+            chunk = np.asarray(rows[start:start + CHUNK_ROWS], dtype=np.float64)
+            if len(chunk) == 0:
+                continue
+            num = len(chunk)
+            mean = chunk.mean(axis=0)
+            m2 = ((chunk - mean) ** 2).sum(axis=0)
+            with self.lock:
+                if self.count == 0:
+                    self.count, self.mean, self.m2 = num, mean, m2
+                    continue
+                total = self.count + num
+                delta = mean - self.mean
+                self.mean = self.mean + delta * num / total
+                self.m2 = self.m2 + m2 + delta ** 2 * self.count * num / total
+                self.count = total
+
+    # (mean, scale) as float32 arrays, frozen at the time of the call; None before any row
+    # A constant column gets the scale 1 so it is only centered
+    def snapshot(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            scale = np.sqrt(self.m2 / self.count)
+            scale[scale == 0] = 1.0
+            return self.mean.astype(np.float32), scale.astype(np.float32)
+
+    @classmethod
+    def of(cls, rows):
+        scaler = cls()
+        scaler.add_batch(rows)
+        return scaler
@@ -2,14 +2,14 @@ import os
 import sys
 import argparse
 import logging
-from utils.etc import camel_code
+from putils.etc import camel_code
 
 def prepare_algorithms(dname):
     edir = "{}".format(dname)
 
     anames = []
 
-    algorithms = [f for f in os.listdir(edir) if f.endswith(".py") and f != "algorithm.py"]
+    algorithms = sorted(f for f in os.listdir(edir) if f.endswith(".py") and f != "algorithm.py")
 
     for a in algorithms:
         anames.append(a.split(".")[0])
@@ -17,18 +17,25 @@ def prepare_algorithms(dname):
     return anames
 
 def make_initializer(anames):
-    with open("utils/autils.py", "w") as of:
+    with open("putils/autils.py", "w") as of:
         of.write("import sys\n")
+        of.write("import logging\n")
         of.write("sys.path.append(\"..\")\n")
-        
+
+        # An algorithm whose dependencies are not installed is skipped, not fatal
         for f in anames:
-            of.write("from algorithms.{} import {}\n".format(f, camel_code(f)))
+            of.write("try:\n")
+            of.write("    from algorithms.{} import {}\n".format(f, camel_code(f)))
+            of.write("except ImportError as e:\n")
+            of.write("    {} = None\n".format(camel_code(f)))
+            of.write("    logging.warning(\"Algorithm {} is unavailable: {{}}\".format(e))\n".format(f))
 
         of.write("\n")
         of.write("def init_algorithms(model_manager):\n")
 
         for f in anames:
-            of.write("    model_manager.add_algorithm({}(\"{}\"))\n".format(camel_code(f), f))
+            of.write("    if {}:\n".format(camel_code(f)))
+            of.write("        model_manager.add_algorithm({}(\"{}\"))\n".format(camel_code(f), f))
 
 def command_line_args():
     parser = argparse.ArgumentParser()
@@ -0,0 +1,108 @@
+import os
+import queue
+import atexit
+import logging
+import itertools
+import logging.handlers
+
+QUEUE_SIZE = 10000
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Hands the records to the listener thread without formatting them in the caller
+
+    The message is formatted by the listener, so the arguments of a log call should not be
+    mutated afterwards. When the queue is full the record is dropped instead of blocking.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The traceback refers to the caller's frames, so it is rendered here
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class SampleFilter(logging.Filter):
+    """Lets one record out of every n through, counted per message template"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(int(every), 1)
+        self.counters = {}
+
+    def filter(self, record):
+        if self.every == 1:
+            return True
+        counter = self.counters.get(record.msg)
+        if counter is None:
+            counter = self.counters.setdefault(record.msg, itertools.count())
+        return next(counter) % self.every == 0
+
+# (queue handler, target handlers, listener) of every queue started by queued()
+_channels = []
+
+def _start(channel):
+    q = queue.Queue(QUEUE_SIZE)
+    channel[0].queue = q
+    channel[2] = logging.handlers.QueueListener(q, *channel[1], respect_handler_level=True)
+    channel[2].start()
+
+# A handler putting the records on a queue drained into the handlers by a background thread
+def queued(*handlers):
+    channel = [DeferredQueueHandler(None), handlers, None]
+    _start(channel)
+    if not _channels:
+        atexit.register(stop_logging)
+    _channels.append(channel)
+    return channel[0]
+
+# Log through a queue, so the request threads never wait on the console or the disk;
+# the records of the loggers in sampled are kept one in sample_every
+def setup_logging(level, sample_every=1, sampled=()):
+    root = logging.getLogger()
+    root.setLevel(level)
+    if not any(isinstance(h, DeferredQueueHandler) for h in root.handlers):
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(queued(console))
+
+    for name in sampled:
+        logger = logging.getLogger(name)
+        for f in [f for f in logger.filters if isinstance(f, SampleFilter)]:
+            logger.removeFilter(f)
+        logger.addFilter(SampleFilter(sample_every))
+
+# A logger writing the bare messages into path through its own queue (e.g., structured logs)
+def file_logger(name, path):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(queued(handler))
+    return logger
+
+def stop_logging():
+    for channel in _channels:
+        if channel[2]:
+            try:
+                channel[2].stop()
+            except queue.Full:
+                pass
+            channel[2] = None
+
+# The listener threads do not survive fork(); a pre-forked worker starts its own
+def _restart_in_child():
+    for channel in _channels:
+        _start(channel)
+
+os.register_at_fork(after_in_child=_restart_in_child)
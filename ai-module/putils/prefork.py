@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import zlib
+import queue
+import select
+import signal
+import time
+import logging
+import threading
+import http.client
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+# Paths handled by every worker rather than by the owner of a model
+FANOUT_PATHS = ["", "forecast", "config"]
+HOP_BY_HOP = ["connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "proxy-authorization", "proxy-authenticate"]
+POOL_SIZE = 32
+TIMEOUT = 600
+MONITOR_INTERVAL = 1.0   # seconds between two checks of the fork server for exited workers
+
+# The fork server logs through a logger without handlers (printed by the last-resort handler):
+# logging.error() would configure the root logger, and the workers forked afterwards would inherit it
+spawner_log = logging.getLogger("prefork.spawner")
+
+# The worker owning the model: a shadow model (<primary>@<name>) lives with its primary model
+def affinity(name, workers):
+    return zlib.crc32(name.split("@", 1)[0].encode("utf-8")) % workers
+
+class Router:
+    """WSGI app of the master process: proxies each request to the worker owning the model
+
+    "/" merges the model lists of all workers, "/forecast" splits a batch by worker and
+    merges the forecasts back in order, and "/config/..." is applied to every worker.
+    "/workers" publishes the ports of the workers (and, with ?model=<name>, the owner of the
+    model), so that a client sending many requests on the same models (e.g., the gateway) talks
+    to the owning worker directly: the requests proxied here are bounded by this single process.
+    """
+
+    def __init__(self, ports, host="127.0.0.1"):
+        self.ports = ports
+        self.host = host
+        self.pools = [queue.LifoQueue(maxsize=POOL_SIZE) for _ in ports]
+
+    # Drop the pooled connections of a restarted worker
+    def reset(self, index, port):
+        self.ports[index] = port
+        pool = self.pools[index]
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    # Forward one request to the worker over a pooled keep-alive connection; returns (status, headers, body)
+    def forward(self, index, method, path, body=None, headers=None):
+        pool = self.pools[index]
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = http.client.HTTPConnection(self.host, self.ports[index], timeout=TIMEOUT)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return resp.status, resp.getheaders(), data
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        first = request.path.strip("/").split("/", 1)[0]
+        try:
+            if first == "workers" and request.method == "GET":
+                response = self.workers(request)
+            elif first in FANOUT_PATHS:
+                response = self.fanout(request, first)
+            else:
+                response = self.proxy(request, affinity(first, len(self.ports)))
+        except (OSError, http.client.HTTPException) as e:
+            logging.error("Forwarding {} {} failed: {}".format(request.method, request.full_path, e))
+            response = Response(json.dumps({"opcode": "failure", "reason": "the worker is unavailable"}), status=502, mimetype="application/json")
+        return response(environ, start_response)
+
+    # The worker of a model is crc32(<model name before "@">) % <number of workers>; the ports change
+    # when a worker is restarted, so a direct client asks again after a connection error
+    def workers(self, request):
+        ret = {"opcode": "success", "workers": list(self.ports), "affinity": "crc32"}
+        name = request.args.get("model")
+        if name:
+            ret["owner"] = affinity(name, len(self.ports))
+            ret["port"] = self.ports[ret["owner"]]
+        return Response(json.dumps(ret), mimetype="application/json")
+
+    def proxy(self, request, index):
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP and k.lower() != "host"}
+        path = request.full_path if request.query_string else request.path
+        start = time.perf_counter()
+        status, resp_headers, body = self.forward(index, request.method, path, request.get_data(), headers)
+        elapsed = time.perf_counter() - start
+        response = Response(body, status=status)
+        for k, v in resp_headers:
+            if k.lower() not in HOP_BY_HOP and k.lower() not in ("content-length", "date", "server"):
+                response.headers[k] = v
+        # The round trip to the worker, next to the stage timings of the worker
+        timing = "proxy;dur={:.3f}".format(elapsed * 1000)
+        response.headers["Server-Timing"] = ", ".join(filter(None, [timing, response.headers.get("Server-Timing")]))
+        return response
+
+    def fanout(self, request, first):
+        workers = range(len(self.ports))
+        if first == "":
+            merged = None
+            for index in workers:
+                _, _, body = self.forward(index, "GET", "/")
+                models = json.loads(body)
+                if merged is None:
+                    merged = models
+                else:
+                    merged["models"]["value"] += models["models"]["value"]
+            return Response(json.dumps(merged), mimetype="application/json")
+
+        if first == "forecast" and request.method == "POST":
+            return self.forecast(request)
+
+        # Configuration: every worker applies it, the answer of the first one is returned
+        responses = [self.proxy(request, index) for index in workers] if request.method != "GET" else [self.proxy(request, 0)]
+        return responses[0]
+
+    def forecast(self, request):
+        args = request.get_json(force=True, silent=True)
+        reqs = args.get("requests") if isinstance(args, dict) else None
+        if not isinstance(reqs, list):
+            return self.proxy(request, 0)
+
+        groups = {}
+        for i, req in enumerate(reqs):
+            name = req.get("model") if isinstance(req, dict) else None
+            groups.setdefault(affinity(str(name), len(self.ports)), []).append(i)
+
+        forecasts = [None] * len(reqs)
+        headers = {"Content-Type": "application/json"}
+        for index, idxs in groups.items():
+            body = json.dumps({"requests": [reqs[i] for i in idxs], "full": args.get("full", False)})
+            _, _, data = self.forward(index, "POST", "/forecast", body, headers)
+            result = json.loads(data)
+            if result.get("opcode") != "success":
+                return Response(data, mimetype="application/json")
+            for i, forecast in zip(idxs, result["forecasts"]):
+                forecasts[i] = forecast
+        return Response(json.dumps({"opcode": "success", "forecasts": forecasts}), mimetype="application/json")
+
+# Start the worker process of the index: make_app(owns) builds the app of the models it owns and returns
+# (app, close), close() being the cleanup run when the worker stops (e.g., closing the dataset logs).
+# The port of the worker is sent back through a pipe; inherited: file descriptors of the parent to close
+# addr: the address the worker listens on (the one of the router, for the clients connecting directly)
+def spawn(index, workers, make_app, inherited=(), addr="127.0.0.1"):
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        for fd in inherited:
+            os.close(fd)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        # Ctrl-C reaches the whole process group; the workers are stopped by the master instead
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        close = None
+        try:
+            app, close = make_app(lambda name: affinity(name, workers) == index)
+            server = make_server(addr, 0, app, threaded=True)
+            os.write(wfd, "{}\n".format(server.server_port).encode())
+            os.close(wfd)
+            logging.info("Worker {} (pid {}) is serving on {}:{}".format(index, os.getpid(), addr, server.server_port))
+            server.serve_forever()
+        except SystemExit:
+            pass
+        except Exception as e:
+            logging.error("Worker {} failed: {}".format(index, e))
+        finally:
+            # os._exit skips the exit handlers, so the worker cleans up explicitly
+            try:
+                if close:
+                    close()
+            finally:
+                os._exit(0)
+
+    os.close(wfd)
+    with os.fdopen(rfd) as f:
+        line = f.readline()
+    if not line:
+        raise RuntimeError("the worker {} failed to start".format(index))
+    return pid, int(line)
+
+# The fork server: forked by the master before the master starts any thread, it stays single-threaded,
+# so it forks the workers safely (no lock of another thread is copied in a locked state) and restarts
+# the ones that exit. Each (re)started worker is reported to the master as "<index> <pid> <port>" on
+# events; the workers are stopped once control is closed by the master (or on SIGTERM)
+def spawner(workers, make_app, control, events, addr="127.0.0.1"):
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pids = {}
+
+    def start(index):
+        pid, port = spawn(index, workers, make_app, [control, events], addr)
+        pids[pid] = index
+        os.write(events, "{} {} {}\n".format(index, pid, port).encode())
+
+    try:
+        for index in range(workers):
+            start(index)
+        while True:
+            ready, _, _ = select.select([control], [], [], MONITOR_INTERVAL)
+            if ready and not os.read(control, 64):
+                break
+            while pids:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                index = pids.pop(pid, None)
+                if index is not None:
+                    spawner_log.error("Worker {} (pid {}) exited with the status {}; restarting it".format(index, pid, status))
+                    start(index)
+    except SystemExit:
+        pass
+    except Exception as e:
+        spawner_log.error("The fork server failed: {}".format(e))
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        os._exit(0)
+
+# Serve with pre-forked workers behind the router on addr:port (the workers listen on addr as well)
+# The algorithm code is imported before forking, so its pages are shared copy-on-write;
+# the models are created in the workers only (the ML libraries are not fork-safe once used).
+# The fork server is forked first, while the master has a single thread; init() (e.g., starting
+# the logging threads) runs in the master afterwards
+def serve(addr, port, workers, make_app, init=None):
+    control_r, control_w = os.pipe()
+    events_r, events_w = os.pipe()
+    spawner_pid = os.fork()
+    if spawner_pid == 0:
+        os.close(control_w)
+        os.close(events_r)
+        spawner(workers, make_app, control_r, events_w, addr)
+    os.close(control_r)
+    os.close(events_w)
+
+    events = os.fdopen(events_r)
+    ports = [0] * workers
+    for _ in range(workers):
+        line = events.readline()
+        if not line:
+            os.waitpid(spawner_pid, 0)
+            raise RuntimeError("the workers failed to start")
+        index, _, worker_port = (int(x) for x in line.split())
+        ports[index] = worker_port
+
+    if init:
+        init()
+    router = Router(ports, "127.0.0.1" if addr in ("", "0.0.0.0") else addr)
+    server = make_server(addr, port, router, threaded=True)
+
+    # A worker restarted by the fork server reloads its models from the dataset directory
+    def monitor():
+        for line in events:
+            index, pid, port = (int(x) for x in line.split())
+            logging.info("Worker {} is restarted (pid {}, port {})".format(index, pid, port))
+            router.reset(index, port)
+
+    threading.Thread(target=monitor, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    logging.info("The router is serving on {}:{} with {} workers".format(addr, port, workers))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        # Closing control stops the fork server, which stops the workers
+        os.close(control_w)
+        os.waitpid(spawner_pid, 0)
@@ -0,0 +1,70 @@
+import io
+import gzip
+import json
+import zlib
+import logging
+import numpy as np
+from flask import request
+
+# orjson serializes NumPy arrays natively; the standard library is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logging.info("orjson is not installed; the standard json encoder is used")
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 1
+FORMATS = ["json", "npz"]
+ENCODINGS = ["gzip", "deflate"]
+NPZ_MIMETYPE = "application/x-npz"
+
+def _default(o):
+    # Non-contiguous arrays, memory maps and NumPy scalars end up here
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError("{} is not JSON serializable".format(type(o).__name__))
+
+def encode_json(payload):
+    if orjson:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+def encode_npz(arrays):
+    buf = io.BytesIO()
+    np.savez(buf, **{k: np.asarray(v) for k, v in arrays.items()})
+    return buf.getvalue()
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+    if encoding == "deflate":
+        return zlib.compress(body, COMPRESS_LEVEL)
+    return body
+
+# The representation requested by the client of the current request: (format, encoding)
+#   format: "npz" if asked with ?format=npz (or npy) or the Accept header, "json" otherwise
+#   encoding: the preferred of gzip/deflate in Accept-Encoding, or None
+def negotiate(binary=False):
+    fmt = "json"
+    if binary:
+        asked = request.args.get("format", "").lower()
+        if asked in ("npz", "npy") or request.accept_mimetypes.best == NPZ_MIMETYPE:
+            fmt = "npz"
+
+    encoding = None
+    if fmt == "json":
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+    return fmt, encoding
+
+# Make the response body of the representation; returns (body, mimetype, content encoding)
+def encode(fmt, encoding, payload, arrays=None):
+    if fmt == "npz":
+        return encode_npz(arrays), NPZ_MIMETYPE, None
+
+    body = encode_json(payload)
+    if encoding and len(body) >= COMPRESS_MIN_SIZE:
+        return compress(body, encoding), "application/json", encoding
+    return body, "application/json", None
@@ -0,0 +1,51 @@
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_local = threading.local()
+
+class Trace:
+    """Stage timings (seconds, summed per stage name) of the request served by the current thread"""
+
+    def __init__(self, request_id, start):
+        self.request_id = request_id
+        self.start = start
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    # Server-Timing header value, durations in milliseconds
+    def server_timing(self):
+        return ", ".join("{};dur={:.3f}".format(name, seconds * 1000) for name, seconds in self.stages.items())
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+def begin(request_id, start=None):
+    _local.trace = Trace(request_id or new_request_id(), start if start is not None else time.perf_counter())
+    return _local.trace
+
+def end():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace
+
+def current():
+    return getattr(_local, "trace", None)
+
+# Time the block as the stage of the current request; nothing is recorded outside a traced request
+@contextmanager
+def stage(name):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
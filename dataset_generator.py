@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai-module"))
+from modules.dataset_loader import RECORD_DTYPE, RECORD_DIMENSION, FORMATS
+
+CHUNK_ROWS = 1 << 20
+
+def seasonal(doy, peak):
+    return np.cos(2 * np.pi * (doy - peak) / 365.25).astype(np.float32)
+
+def percentile_index(q, size):
+    # Same rule as ProcessManager::processData: ceil(q * size) - 1, clamped
+    return min(max(int(np.ceil(q * size)) - 1, 0), size - 1)
+
+# Generate the rows [offset, offset + num) of the dataset as a (num, 12) float32 array
+#   the random numbers of a chunk only depend on (seed, offset), so the same seed and chunk size
+#   always produce the same rows
+def generate_chunk(offset, num, start, step, houses, scales, seed):
+    rng = np.random.default_rng([seed, offset])
+    ts = start + (offset + np.arange(num, dtype=np.int64)) * step
+    month = (ts.astype("datetime64[M]").astype(np.int64) % 12 + 1).astype(np.float32)
+    doy = (ts - ts.astype("datetime64[Y]")).astype("timedelta64[D]").astype(np.float32)
+    hour = (ts - ts.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.float32)
+    weekday = (ts.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+    rows = np.empty((num, RECORD_DIMENSION), dtype=np.float32)
+
+    # Temperature: warmest in late July, cooler at night; avg is the midpoint of min and max as on the edge
+    temp = 12.0 + 11.0 * seasonal(doy, 205) - 3.0 * np.cos(2 * np.pi * (hour - 4) / 24).astype(np.float32)
+    temp += rng.standard_normal(num, dtype=np.float32) * 2.0
+    spread = 2.0 + rng.random(num, dtype=np.float32) * 4.0
+    rows[:, 1] = temp - spread
+    rows[:, 2] = temp + spread
+    rows[:, 0] = (rows[:, 1] + rows[:, 2]) / 2
+
+    # Humidity: wetter in summer (monsoon), bounded to [10, 100]
+    humid = 60.0 + 15.0 * seasonal(doy, 200) + rng.standard_normal(num, dtype=np.float32) * 5.0
+    spread = 5.0 + rng.random(num, dtype=np.float32) * 10.0
+    rows[:, 4] = np.clip(humid - spread, 10.0, 100.0)
+    rows[:, 5] = np.clip(humid + spread, 10.0, 100.0)
+    rows[:, 3] = (rows[:, 4] + rows[:, 5]) / 2
+
+    # Power of each house: base load scaled per house, heating/cooling with the distance to 18 degrees,
+    # higher on weekends, multiplicative noise; aggregated like the edge (avg, min, max, p25, p75)
+    demand = 200.0 + 12.0 * np.abs(temp - 18.0) + np.where(weekday >= 5, 30.0, 0.0).astype(np.float32)
+    power = demand[:, None] * scales[None, :]
+    power *= 1.0 + rng.standard_normal((num, houses), dtype=np.float32) * 0.1
+    np.maximum(power, 0.0, out=power)
+    i25 = percentile_index(0.25, houses)
+    i75 = percentile_index(0.75, houses)
+    power.partition(sorted({0, i25, i75, houses - 1}), axis=1)
+    rows[:, 6] = power.mean(axis=1)
+    rows[:, 7] = power[:, 0]
+    rows[:, 8] = power[:, houses - 1]
+    rows[:, 9] = power[:, i25]
+    rows[:, 10] = power[:, i75]
+
+    rows[:, 11] = month
+    return rows
+
+def to_records(rows):
+    records = np.empty(len(rows), dtype=RECORD_DTYPE)
+    records["temperature"] = rows[:, 0:3]
+    records["humidity"] = rows[:, 3:6]
+    records["power"] = rows[:, 6:11]
+    records["month"] = rows[:, 11]
+    return records
+
+class NpyWriter:
+    def __init__(self, path, num):
+        self.out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(num, RECORD_DIMENSION))
+
+    def write(self, offset, rows):
+        self.out[offset:offset + len(rows)] = rows
+
+    def close(self):
+        self.out.flush()
+        del self.out
+
+class RawWriter:
+    """45-byte big-endian records, the payload layout of the edge device (modules/dataset_loader.load_raw)"""
+
+    def __init__(self, path, num):
+        self.f = open(path, "wb")
+
+    def write(self, offset, rows):
+        self.f.write(to_records(rows).tobytes())
+
+    def close(self):
+        self.f.close()
+
+WRITERS = {
+    "npy": NpyWriter,
+    "raw": RawWriter,
+}
+
+def generate(outputs, num, start, step_hours, houses, seed, chunk_rows=CHUNK_ROWS):
+    writers = []
+    for path in outputs:
+        fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+        if fmt not in WRITERS:
+            raise ValueError("cannot write {} (use .npy or one of the raw extensions .bin/.raw/.rec)".format(path))
+        writers.append(WRITERS[fmt](path, num))
+
+    # The per-house scales are fixed for the whole dataset
+    scales = np.random.default_rng(seed).lognormal(0.0, 0.3, houses).astype(np.float32)
+    start = np.datetime64(start, "h")
+    step = np.timedelta64(step_hours, "h")
+
+    try:
+        for offset in range(0, num, chunk_rows):
+            rows = generate_chunk(offset, min(chunk_rows, num - offset), start, step, houses, scales, seed)
+            for writer in writers:
+                writer.write(offset, rows)
+            logging.debug("Generated rows {}-{}".format(offset, offset + len(rows)))
+    finally:
+        for writer in writers:
+            writer.close()
+
+def command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", metavar="<output file>", help="Output file (.npy or raw 45-byte records .bin/.raw/.rec); repeat for several outputs", type=str, action="append", required=True)
+    parser.add_argument("-n", "--rows", metavar="<number of rows>", help="Number of rows to generate", type=float, default=1e6)
+    parser.add_argument("-s", "--start", metavar="<YYYY-MM-DD>", help="Timestamp of the first row", type=str, default="2024-01-01")
+    parser.add_argument("-t", "--step", metavar="<hours>", help="Hours between consecutive rows", type=int, default=24)
+    parser.add_argument("-u", "--houses", metavar="<number of houses>", help="Number of houses aggregated in a row", type=int, default=10)
+    parser.add_argument("-r", "--seed", metavar="<seed>", help="Random seed", type=int, default=0)
+    parser.add_argument("-c", "--chunk", metavar="<rows>", help="Rows generated and written at a time", type=int, default=CHUNK_ROWS)
+    parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", type=str, default="INFO")
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = command_line_args()
+    logging.basicConfig(level=args.log)
+
+    num = int(args.rows)
+    if num <= 0 or args.houses <= 0 or args.step <= 0 or args.chunk <= 0:
+        logging.error("The number of rows, houses, the step and the chunk size should be larger than 0")
+        sys.exit(1)
+
+    begin = time.perf_counter()
+    try:
+        generate(args.output, num, args.start, args.step, args.houses, args.seed, args.chunk)
+    except ValueError as e:
+        logging.error(e)
+        sys.exit(1)
+    logging.info("Generated {} rows into {} in {:.2f} s".format(num, ", ".join(args.output), time.perf_counter() - begin))
+
+if __name__ == "__main__":
+    main()
@@ -221,6 +221,9 @@ uint8_t NetworkManager::receiveCommand(int sock_fd)
         MEM_TO_VAR_4BYTES_BIG_ENDIAN(p, ai_result_bits);
         float ai_result = *(float*)&ai_result_bits;
         cout << "[*] AI Prediction: " << ai_result << endl;
+        // 5번째 바이트: 게이트웨이 대체 예측 여부 / 5th byte: answered by the gateway's fallback
+        if (payload_length >= 5 && payload[4])
+          cout << "[*] Degraded prediction from the gateway fallback" << endl;
       }
       break;
       
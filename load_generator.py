@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import math
+import socket
+import struct
+import random
+import argparse
+import logging
+import threading
+import subprocess
+import requests
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MSG_DATA = 0x01
+MSG_RESULT = 0x81
+MSG_ERROR = 0xFF
+PAYLOAD = struct.Struct('!fff fff fffff B')
+HEADER = struct.Struct('!BH')
+
+def make_features(device, seq):
+    """Deterministic, seasonally varying 12-feature instance of a device"""
+    day = seq % 365
+    season = math.sin(2 * math.pi * day / 365)
+    temp = 13.0 + 12.0 * season + (device % 7) * 0.3
+    humid = 65.0 - 10.0 * season + (device % 5) * 0.5
+    power = 250.0 + 80.0 * math.cos(2 * math.pi * day / 365) + (device % 11) * 3.0 + (seq % 7) * 2.0
+    month = day * 12 // 365 + 1
+    return [temp, temp - 5, temp + 5,
+            humid, humid - 10, humid + 15,
+            power, power - 50, power + 70, power - 30, power + 30,
+            month]
+
+def recv_exact(sock, n):
+    buf = b''
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed by the gateway")
+        buf += chunk
+    return buf
+
+class Device:
+    """Simulated edge device sending 45-byte 0x01 frames to the gateway at a fixed rate"""
+
+    def __init__(self, device, addr, port, rate, frames, deadline, timeout):
+        self.device = device
+        self.addr = addr
+        self.port = port
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.frames = frames
+        self.deadline = deadline
+        self.timeout = timeout
+        self.samples = []   # (send time, latency in seconds, outcome)
+
+    def run(self):
+        try:
+            sock = socket.create_connection((self.addr, self.port), timeout=self.timeout)
+        except OSError as e:
+            logging.error("[*] Device {} failed to connect: {}".format(self.device, e))
+            self.samples.append((time.time(), None, "connect_error"))
+            return
+
+        start = time.perf_counter()
+        seq = 0
+        try:
+            while seq < self.frames and time.time() < self.deadline:
+                # Open-loop pacing: the k-th frame is due at start + k * interval
+                due = start + seq * self.interval
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                payload = PAYLOAD.pack(*make_features(self.device, seq))
+                sent = time.perf_counter()
+                try:
+                    sock.sendall(HEADER.pack(MSG_DATA, len(payload)) + payload)
+                    msg_type, length = HEADER.unpack(recv_exact(sock, HEADER.size))
+                    body = recv_exact(sock, length) if length > 0 else b''
+                except socket.timeout:
+                    self.samples.append((time.time(), None, "timeout"))
+                    break
+                latency = time.perf_counter() - sent
+
+                if msg_type == MSG_RESULT and len(body) >= 4:
+                    prediction = struct.unpack('!f', body[:4])[0]
+                    if len(body) >= 5 and body[4]:
+                        outcome = "degraded"
+                    else:
+                        outcome = "default" if prediction == -1.0 else "prediction"
+                elif msg_type == MSG_ERROR:
+                    outcome = "error"
+                else:
+                    outcome = "unexpected"
+                self.samples.append((time.time(), latency, outcome))
+                seq += 1
+        except (OSError, ConnectionError) as e:
+            logging.error("[*] Device {} failed: {}".format(self.device, e))
+            self.samples.append((time.time(), None, "socket_error"))
+        finally:
+            sock.close()
+
+def ai_probe(caddr, cport, name, dimension, probes, timeout):
+    """Measure the AI module round trip with PUT /<name>/testing on a dedicated probe model"""
+    samples = []
+    url = "http://{}:{}/{}/testing".format(caddr, cport, name)
+    for seq in range(probes):
+        features = make_features(0, seq)[:dimension]
+        sent = time.perf_counter()
+        try:
+            response = requests.put(url, json={"value": features}, timeout=timeout)
+            ok = response.status_code == 200 and response.json().get("opcode") == "success"
+            samples.append((time.time(), time.perf_counter() - sent, "prediction" if ok else "error"))
+        except requests.RequestException:
+            samples.append((time.time(), None, "error"))
+    return samples
+
+def prepare_probe_model(caddr, cport, name, algorithm, dimension, index, ntrain, timeout):
+    base = "http://{}:{}/{}".format(caddr, cport, name)
+    requests.post(base, json={"algorithm": algorithm, "dimension": dimension, "index": index}, timeout=timeout)
+    for seq in range(ntrain):
+        requests.put(base + "/training", json={"value": make_features(0, seq)[:dimension]}, timeout=timeout)
+    result = requests.post(base + "/training", timeout=max(timeout, 600)).json()
+    return result.get("opcode") == "success"
+
+def latency_stats(latencies):
+    if not latencies:
+        return {"count": 0}
+    ms = np.array(latencies) * 1000.0
+    return {
+        "count": int(len(ms)),
+        "mean": round(float(np.mean(ms)), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(np.max(ms)), 3),
+    }
+
+def summarize(samples, elapsed, warmup_until):
+    measured = [s for s in samples if s[0] >= warmup_until]
+    outcomes = {}
+    for _, _, outcome in measured:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    answered = [s[1] for s in measured if s[1] is not None]
+    failed = sum(n for o, n in outcomes.items() if o not in ("prediction", "default", "degraded"))
+    return {
+        "frames": len(measured),
+        "throughput": round(len(answered) / elapsed, 3) if elapsed > 0 else 0.0,
+        "outcomes": outcomes,
+        "error_rate": round(failed / len(measured), 6) if measured else 0.0,
+        "latency_ms": latency_stats(answered),
+        "prediction_latency_ms": latency_stats([s[1] for s in measured if s[2] == "prediction"]),
+    }
+
+def wait_for_port(addr, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((addr, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def spawn_stack(args):
+    """Start ai.py and server.py locally; returns the child processes"""
+    procs = []
+    ai = subprocess.Popen([sys.executable, "ai.py", "--port", str(args.cport), "--log", args.child_log],
+                          cwd=os.path.join(ROOT, "ai-module"))
+    procs.append(ai)
+    if not wait_for_port(args.caddr, args.cport, args.startup_timeout):
+        raise RuntimeError("ai.py did not start listening on {}".format(args.cport))
+
+    server = subprocess.Popen([sys.executable, "server.py", "--algorithm", args.algorithm,
+                               "--dimension", str(args.dimension), "--index", str(args.index),
+                               "--caddr", args.caddr, "--cport", str(args.cport), "--lport", str(args.port),
+                               "--name", args.name, "--ntrain", str(args.ntrain), "--log", args.child_log],
+                              cwd=os.path.join(ROOT, "server"))
+    procs.append(server)
+    if not wait_for_port(args.addr, args.port, args.startup_timeout):
+        raise RuntimeError("server.py did not start listening on {}".format(args.port))
+    return procs
+
+def compare(report, baseline, tolerance):
+    """Print the relative change of the key metrics; returns False if one regressed beyond the tolerance"""
+    ok = True
+    checks = [
+        ("gateway", "throughput", None, False),
+        ("gateway", "latency_ms", "p50", True),
+        ("gateway", "latency_ms", "p95", True),
+        ("gateway", "latency_ms", "p99", True),
+        ("ai", "latency_ms", "p50", True),
+        ("ai", "latency_ms", "p99", True),
+    ]
+    for section, key, sub, lower_is_better in checks:
+        try:
+            old = baseline[section][key] if sub is None else baseline[section][key][sub]
+            new = report[section][key] if sub is None else report[section][key][sub]
+        except KeyError:
+            continue
+        if not old:
+            continue
+        change = (new - old) / old
+        regressed = change > tolerance if lower_is_better else change < -tolerance
+        ok = ok and not regressed
+        label = "{}.{}{}".format(section, key, "." + sub if sub else "")
+        print("{:<24} {:>12.3f} -> {:>12.3f} ({:+.1f}%){}".format(label, old, new, change * 100, "  REGRESSION" if regressed else ""))
+
+    old_errors = baseline.get("gateway", {}).get("error_rate", 0.0)
+    new_errors = report["gateway"]["error_rate"]
+    if new_errors > old_errors + tolerance / 10:
+        print("gateway.error_rate {:.4f} -> {:.4f}  REGRESSION".format(old_errors, new_errors))
+        ok = False
+    return ok
+
+def command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--addr", metavar="<gateway IP address>", help="Gateway (server.py) IP address", type=str, default="127.0.0.1")
+    parser.add_argument("-p", "--port", metavar="<gateway port>", help="Gateway (server.py) port", type=int, default=5555)
+    parser.add_argument("-b", "--caddr", metavar="<AI module IP address>", help="AI module IP address", type=str, default="127.0.0.1")
+    parser.add_argument("-c", "--cport", metavar="<AI module port>", help="AI module port", type=int, default=5556)
+    parser.add_argument("-n", "--devices", metavar="<number of devices>", help="Number of concurrent edge devices", type=int, default=10)
+    parser.add_argument("-r", "--rate", metavar="<frames per second>", help="Frames per second sent by each device (0: as fast as possible)", type=float, default=1.0)
+    parser.add_argument("-f", "--frames", metavar="<frames per device>", help="Maximum number of frames sent by each device", type=int, default=100)
+    parser.add_argument("-t", "--duration", metavar="<seconds>", help="Maximum duration of the run", type=float, default=60.0)
+    parser.add_argument("-w", "--warmup", metavar="<seconds>", help="Seconds at the beginning excluded from the statistics", type=float, default=0.0)
+    parser.add_argument("--timeout", metavar="<seconds>", help="Socket/HTTP timeout", type=float, default=30.0)
+    parser.add_argument("--probes", metavar="<number of requests>", help="Number of direct AI module round trips to measure (0: skip)", type=int, default=100)
+    parser.add_argument("--spawn", help="Start ai.py and server.py locally for the run", action="store_true")
+    parser.add_argument("--startup-timeout", metavar="<seconds>", help="Time to wait for spawned processes to listen", type=float, default=60.0)
+    parser.add_argument("--child-log", metavar="<log level>", help="Log level of the spawned processes", type=str, default="WARNING")
+    parser.add_argument("--algorithm", metavar="<algorithm>", help="Algorithm of the model", type=str, default="lstm")
+    parser.add_argument("--dimension", metavar="<dimension>", help="Dimension of the model", type=int, default=12)
+    parser.add_argument("--index", metavar="<index>", help="Index of the power value", type=int, default=6)
+    parser.add_argument("--name", metavar="<model name>", help="Model name used by the gateway", type=str, default="bench_model")
+    parser.add_argument("--ntrain", metavar="<number of instances>", help="Training instances before the gateway switches to prediction", type=int, default=50)
+    parser.add_argument("-o", "--output", metavar="<JSON file>", help="Write the report as JSON", type=str, default=None)
+    parser.add_argument("--baseline", metavar="<JSON file>", help="Compare the report with a previous report", type=str, default=None)
+    parser.add_argument("--tolerance", metavar="<ratio>", help="Allowed relative regression versus the baseline", type=float, default=0.10)
+    parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", type=str, default="INFO")
+    return parser.parse_args()
+
+def main():
+    args = command_line_args()
+    logging.basicConfig(level=args.log)
+    random.seed(0)
+
+    procs = []
+    try:
+        if args.spawn:
+            procs = spawn_stack(args)
+
+        ai_samples = []
+        if args.probes > 0:
+            probe = "{}_probe".format(args.name)
+            logging.info("[*] Preparing the probe model {}".format(probe))
+            if prepare_probe_model(args.caddr, args.cport, probe, args.algorithm, args.dimension, args.index, args.ntrain, args.timeout):
+                ai_samples = ai_probe(args.caddr, args.cport, probe, args.dimension, args.probes, args.timeout)
+            else:
+                logging.error("[*] Failed to train the probe model; skipping the AI round trip measurement")
+
+        logging.info("[*] Starting {} devices at {} frames/s each".format(args.devices, args.rate))
+        begin = time.time()
+        deadline = begin + args.duration
+        devices = [Device(i, args.addr, args.port, args.rate, args.frames, deadline, args.timeout) for i in range(args.devices)]
+        threads = [threading.Thread(target=d.run) for d in devices]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = max(time.time() - begin - args.warmup, 1e-9)
+
+        samples = [s for d in devices for s in d.samples]
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "log", "child_log")},
+            "gateway": summarize(samples, elapsed, begin + args.warmup),
+            "ai": summarize(ai_samples, sum(s[1] for s in ai_samples if s[1] is not None), 0),
+        }
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            p.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
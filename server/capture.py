@@ -0,0 +1,57 @@
+import struct
+import threading
+
+# Capture file of the frames received by the gateway
+#   header: magic (4 bytes) || version (2 bytes) || reserved (2 bytes)
+#   record: timestamp (8 bytes, seconds) || connection id (4 bytes) || msg_type (1 byte) || payload length (2 bytes) || payload
+MAGIC = b"CGWC"
+VERSION = 1
+HEADER = struct.Struct('!4sHH')
+RECORD = struct.Struct('!dIBH')
+BUFFER_SIZE = 1 << 20
+
+class CaptureWriter:
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self.f = open(path, "wb", buffering=buffer_size)
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0))
+        self.lock = threading.Lock()
+        self.num = 0
+
+    def write(self, ts, conn_id, msg_type, payload):
+        record = RECORD.pack(ts, conn_id, msg_type, len(payload)) + payload
+        with self.lock:
+            if self.f:
+                self.f.write(record)
+                self.num += 1
+
+    def flush(self):
+        with self.lock:
+            if self.f:
+                self.f.flush()
+
+    def close(self):
+        with self.lock:
+            if self.f:
+                self.f.close()
+                self.f = None
+
+# Yield (timestamp, connection id, msg_type, payload) of the records; a truncated last record is ignored
+def read_capture(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("{} is not a capture file (too short)".format(path))
+        magic, version, _ = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a capture file (magic {}, version {})".format(path, magic, version))
+
+        while True:
+            buf = f.read(RECORD.size)
+            if len(buf) != RECORD.size:
+                break
+            ts, conn_id, msg_type, length = RECORD.unpack(buf)
+            payload = f.read(length)
+            if len(payload) != length:
+                break
+            yield ts, conn_id, msg_type, payload
@@ -0,0 +1,67 @@
+import threading
+from collections import deque
+
+# Cheap predictors of the next power value, used by the gateway when the AI module cannot
+# answer within the latency budget; predict() returns None until a value has been seen
+
+class LastValue:
+    def __init__(self):
+        self.value = None
+        self.lock = threading.Lock()
+
+    def update(self, value):
+        with self.lock:
+            self.value = value
+
+    def predict(self):
+        return self.value
+
+class Ewma:
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+        self.lock = threading.Lock()
+
+    def update(self, value):
+        with self.lock:
+            if self.value is None:
+                self.value = value
+            else:
+                self.value += self.alpha * (value - self.value)
+
+    def predict(self):
+        return self.value
+
+class SeasonalNaive:
+    """The value one season (`season` frames) before the predicted one; the last value until a season is seen"""
+
+    def __init__(self, season=7):
+        self.history = deque(maxlen=season)
+        self.lock = threading.Lock()
+
+    def update(self, value):
+        with self.lock:
+            self.history.append(value)
+
+    def predict(self):
+        with self.lock:
+            if not self.history:
+                return None
+            if len(self.history) < self.history.maxlen:
+                return self.history[-1]
+            return self.history[0]
+
+FALLBACKS = {
+    "last": LastValue,
+    "ewma": Ewma,
+    "seasonal": SeasonalNaive,
+}
+
+def make_fallback(method, alpha=0.3, season=7):
+    if method not in FALLBACKS:
+        raise ValueError("unknown fallback method {} (use one of {})".format(method, sorted(FALLBACKS.keys())))
+    if method == "ewma":
+        return Ewma(alpha)
+    if method == "seasonal":
+        return SeasonalNaive(season)
+    return LastValue()
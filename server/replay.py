@@ -0,0 +1,200 @@
+import sys
+import json
+import time
+import socket
+import struct
+import logging
+import argparse
+import threading
+import requests
+from capture import read_capture
+from server import decode_features, recv_exact
+
+HEADER = struct.Struct('!BH')
+MSG_DATA = 0x01
+
+class Connection(threading.Thread):
+    """Re-sends the frames of one captured connection in order, keeping their spacing divided by speed"""
+
+    def __init__(self, conn_id, frames, target, start, t0, speed):
+        super(Connection, self).__init__(daemon=True)
+        self.conn_id = conn_id
+        self.frames = frames
+        self.target = target
+        self.start_time = start
+        self.t0 = t0
+        self.speed = speed
+        self.latencies = []
+        self.failures = 0
+
+    def wait(self, ts):
+        if self.speed <= 0:
+            return
+        delay = self.start_time + (ts - self.t0) / self.speed - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self):
+        try:
+            self.target.open()
+            for ts, msg_type, payload in self.frames:
+                self.wait(ts)
+                sent = time.perf_counter()
+                if self.target.send(msg_type, payload):
+                    self.latencies.append(time.perf_counter() - sent)
+                else:
+                    self.failures += 1
+        except (OSError, requests.RequestException) as e:
+            logging.error("[*] Connection {} failed: {}".format(self.conn_id, e))
+            self.failures += 1
+        finally:
+            self.target.close()
+
+class GatewayTarget:
+    """Sends the raw frames to the gateway (server.py) over TCP and waits for each response"""
+
+    def __init__(self, addr, port, timeout):
+        self.addr = addr
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.create_connection((self.addr, self.port), timeout=self.timeout)
+
+    def send(self, msg_type, payload):
+        self.sock.sendall(HEADER.pack(msg_type, len(payload)) + payload)
+        header = recv_exact(self.sock, HEADER.size)
+        if len(header) != HEADER.size:
+            raise ConnectionError("the gateway closed the connection")
+        resp_type, length = HEADER.unpack(header)
+        recv_exact(self.sock, length)
+        return resp_type != 0xFF
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+
+class AITarget:
+    """Sends the decoded data frames to the AI module as testing data (other frames are skipped)"""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.session = None
+
+    def open(self):
+        self.session = requests.Session()
+
+    def send(self, msg_type, payload):
+        if msg_type != MSG_DATA:
+            return True
+        response = self.session.put("{}/testing".format(self.url), json={"value": decode_features(payload)}, timeout=self.timeout)
+        return response.status_code == 200
+
+    def close(self):
+        if self.session:
+            self.session.close()
+
+def load(path):
+    connections = {}
+    for ts, conn_id, msg_type, payload in read_capture(path):
+        connections.setdefault(conn_id, []).append((ts, msg_type, payload))
+    return connections
+
+# Train the model of the AI module with the first ntrain data frames of the capture (in capture order)
+def train(url, connections, ntrain, args):
+    frames = sorted((f for frames in connections.values() for f in frames if f[1] == MSG_DATA), key=lambda f: f[0])
+    training = frames[:ntrain]
+    result = requests.post(url, json={"algorithm": args.algorithm, "dimension": args.dimension, "index": args.index}).json()
+    logging.info("[*] Model creation: {}".format(result))
+    session = requests.Session()
+    for _, _, payload in training:
+        session.put("{}/training".format(url), json={"value": decode_features(payload)}, timeout=args.timeout)
+    result = requests.post("{}/training".format(url), timeout=args.train_timeout).json()
+    logging.info("[*] Training with {} instances: {}".format(len(training), result))
+
+    # The training frames are not replayed again
+    skip = {id(f) for f in training}
+    return {cid: [f for f in frames if id(f) not in skip] for cid, frames in connections.items()}
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+def command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--capture", metavar="<capture file>", help="Capture file recorded with server.py --record", type=str, required=True)
+    parser.add_argument("-t", "--target", metavar="<gateway/ai>", help="Replay to the gateway (TCP) or to the AI module (HTTP)", type=str, choices=["gateway", "ai"], default="gateway")
+    parser.add_argument("-a", "--addr", metavar="<IP address>", help="IP address of the target", type=str, default="127.0.0.1")
+    parser.add_argument("-p", "--port", metavar="<port>", help="Port of the target", type=int, default=5555)
+    parser.add_argument("-s", "--speed", metavar="<speed>", help="Replay speed: 1 (as recorded), N (N times faster) or max", type=str, default="1")
+    parser.add_argument("-n", "--name", metavar="<model name>", help="Model name (AI target)", type=str, default="model")
+    parser.add_argument("-x", "--ntrain", metavar="<number of instances>", help="Create and train the model with the first N frames first (AI target, 0: use the existing model)", type=int, default=0)
+    parser.add_argument("--algorithm", metavar="<algorithm>", help="Algorithm of the model (AI target with --ntrain)", type=str, default="lstm")
+    parser.add_argument("--dimension", metavar="<dimension>", help="Dimension of the model (AI target with --ntrain)", type=int, default=12)
+    parser.add_argument("--index", metavar="<index>", help="Index of the power value (AI target with --ntrain)", type=int, default=6)
+    parser.add_argument("--timeout", metavar="<seconds>", help="Socket/HTTP timeout", type=float, default=30.0)
+    parser.add_argument("--train-timeout", metavar="<seconds>", help="Timeout of the training request", type=float, default=600.0)
+    parser.add_argument("-o", "--output", metavar="<JSON file>", help="Write the report as JSON", type=str, default=None)
+    parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", type=str, default="INFO")
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = command_line_args()
+    logging.basicConfig(level=args.log)
+
+    if args.speed == "max":
+        speed = 0
+    else:
+        speed = float(args.speed)
+        if speed <= 0:
+            logging.error("The speed should be larger than 0 or max")
+            sys.exit(1)
+
+    connections = load(args.capture)
+    if not connections:
+        logging.error("No frame in {}".format(args.capture))
+        sys.exit(1)
+    logging.info("[*] {} frames of {} connections loaded".format(sum(len(f) for f in connections.values()), len(connections)))
+
+    url = "http://{}:{}/{}".format(args.addr, args.port, args.name)
+    if args.target == "ai" and args.ntrain > 0:
+        connections = train(url, connections, args.ntrain, args)
+
+    def make_target():
+        if args.target == "gateway":
+            return GatewayTarget(args.addr, args.port, args.timeout)
+        return AITarget(url, args.timeout)
+
+    frames = [f for fs in connections.values() for f in fs]
+    t0 = min(f[0] for f in frames) if frames else 0.0
+    start = time.time()
+    threads = [Connection(cid, fs, make_target(), start, t0, speed) for cid, fs in sorted(connections.items()) if fs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    latencies = [l for t in threads for l in t.latencies]
+    report = {
+        "target": args.target,
+        "speed": args.speed,
+        "connections": len(threads),
+        "frames": len(frames),
+        "failures": sum(t.failures for t in threads),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {"p{}".format(q): round(percentile(latencies, q) * 1000, 3) if latencies else None for q in (50, 90, 99)},
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
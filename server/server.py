@@ -1,3 +1,4 @@
+import os
 import socket
 import requests
 import threading
@@ -6,14 +7,62 @@ import logging
 import json
 import sys
 import struct
+import queue
+import time
+import concurrent.futures
+from collections import deque
+import atexit
+from fallback import FALLBACKS, make_fallback
+from capture import CaptureWriter
+from tracing import REQUEST_ID_HEADER, RequestIds, StageStats, parse_server_timing
+
+# The logging helpers are shared with the AI module
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ai-module"))
+from putils.logutil import setup_logging
 
 OPCODE_DATA = 1
 OPCODE_WAIT = 2
 OPCODE_DONE = 3
 OPCODE_QUIT = 4
 
+# Aggregated data from the edge device (45 bytes, big-endian)
+#   temperature (avg, min, max) || humidity (avg, min, max) || power (avg, min, max, p25, p75) || month (1 byte)
+FEATURES = struct.Struct('!fff fff fffff B')
+
+# Result payload: prediction || degraded flag (1: answered by the gateway's fallback predictor)
+RESULT = struct.Struct('!fB')
+
+BUSY = b"busy"
+
+# Phases of the gateway: collecting training data, training the model, predicting
+PHASE_TRAINING = "training"
+PHASE_LEARNING = "learning"
+PHASE_TESTING = "testing"
+TRAIN_RETRIES = 3
+TRAIN_RETRY_DELAY = 5
+SHED_MODES = ["busy", "degraded"]
+
+# Logs written for every frame: sampled with --log-sample, formatted only when a record is emitted
+frame_log = logging.getLogger("gateway.frame")
+
+def decode_features(buf):
+    values = FEATURES.unpack_from(buf)
+    features = list(values[:11])
+    features.append(float(values[11]))
+    return features
+
+def recv_exact(sock, length):
+    buf = b''
+    while len(buf) < length:
+        chunk = sock.recv(length - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return buf
+
 class Server:
-    def __init__(self, name, algorithm, dimension, index, port, caddr, cport, ntrain, ntest):
+    def __init__(self, name, algorithm, dimension, index, port, caddr, cport, ntrain, ntest, max_inflight=16, queue_limit=8, shed_mode="busy", stats_interval=10,
+                 budget=1.0, fallback="ewma", alpha=0.3, season=7, buffer_limit=10000, train_timeout=600, record=None):
         logging.info("[*] Initializing the server module to receive data from the edge device")
         self.name = name
         self.algorithm = algorithm
@@ -21,9 +70,51 @@ class Server:
         self.index = index
         self.caddr = caddr
         self.cport = cport
+        # The port of the frames' AI calls: the worker owning the model if the AI module runs pre-forked
+        # workers (see locate_worker()), the AI module itself otherwise
+        self.ai_port = cport
         self.ntrain = ntrain
         self.ntest = ntest
         self.data_counter = 0  # 데이터 카운터 초기화
+
+        # The counter, the phase and the number of training requests in flight are protected by phase_lock
+        self.phase = PHASE_TRAINING
+        self.outstanding = 0
+        self.phase_lock = threading.Condition()
+        self.buffered = deque(maxlen=buffer_limit)
+        self.stats_dropped = 0
+        self.train_timeout = train_timeout
+
+        # Load shedding: requests beyond the in-flight budget or the per-connection queue limit
+        # are answered right away with 0xFF "busy" (shed_mode "busy") or the fallback's prediction ("degraded")
+        self.max_inflight = max_inflight
+        self.inflight = threading.BoundedSemaphore(max_inflight)
+        self.queue_limit = queue_limit
+        self.shed_mode = shed_mode
+        # The AI calls of a connection run one at a time and in order (see handler()); this executor
+        # serializes the calls of process() made outside any connection
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        # Latency budget of the AI module; late or failed predictions are answered by the fallback
+        self.budget = budget
+        self.fallback = make_fallback(fallback, alpha, season)
+
+        self.stats = {"processed": 0, "errors": 0, "timeouts": 0, "degraded": 0, "shed_inflight": 0, "shed_queue": 0}
+        self.stats_lock = threading.Lock()
+
+        # Every AI call carries a request id; the stage timings of the gateway and the ones reported by
+        # the AI module (Server-Timing, prefixed with "ai.") are aggregated per stage
+        self.request_ids = RequestIds()
+        self.stage_stats = StageStats()
+        if stats_interval > 0:
+            threading.Thread(target=self.report_stats, args=(stats_interval,), daemon=True).start()
+
+        # Optional capture of every received frame for the replay tool (server/replay.py)
+        self.capture = None
+        if record:
+            self.capture = CaptureWriter(record)
+            atexit.register(self.capture.close)
+            logging.info("[*] Recording the received frames into {}".format(record))
         success = self.connecter()
 
         if success:
@@ -62,155 +153,360 @@ class Server:
             else:
                 assert response["opcode"] == "success"
                 logging.info("[*] Successfully connected to the AI module")
+                self.locate_worker()
         return success
 
+    # Send the frames to the worker owning the model, bypassing the router of the AI module
+    # (GET /workers is answered only by the router; a single-process AI module is used as is)
+    def locate_worker(self):
+        url = "http://{}:{}/workers".format(self.caddr, self.cport)
+        try:
+            response = requests.get(url, params={"model": self.name}, timeout=5)
+            info = response.json() if response.status_code == 200 else {}
+        except (requests.RequestException, ValueError) as e:
+            logging.error("[*] Failed to locate the worker of the model: {}".format(e))
+            info = {}
+        port = info.get("port", self.cport) if info.get("opcode") == "success" else self.cport
+        if port != self.ai_port:
+            logging.info("[*] Sending the frames to the worker {} of the AI module (port {})".format(info.get("owner"), port))
+        self.ai_port = port
+
+    def put_ai(self, path, features, headers):
+        ai_url = f"http://{self.caddr}:{self.ai_port}/{self.name}/{path}"
+        try:
+            return requests.put(ai_url, json={"value": features}, headers=headers, timeout=5)
+        except requests.ConnectionError:
+            # The worker may have been restarted on another port
+            if self.ai_port != self.cport:
+                self.locate_worker()
+            raise
+
     def listener(self):
         logging.info("[*] Server is listening on 0.0.0.0:{}".format(self.port))
 
+        conn_id = 0
         while True:
             client, info = self.socket.accept()
             logging.info("[*] Server accept the connection from {}:{}".format(info[0], info[1]))
-            client_handle = threading.Thread(target=self.handler, args=(client,))
+            conn_id += 1
+            client_handle = threading.Thread(target=self.handler, args=(client, conn_id))
             client_handle.start()
 
-    def handler(self, client):
+    def handler(self, client, conn_id=0):
         logging.info("[*] Server starts to process the client's request")
 
+        # The reader enqueues the frames and the worker answers them in order; frames beyond the
+        # queue limit are shed so a slow AI module does not grow the gateway's memory: their payload
+        # is not kept, and a placeholder (msg_type None) lets the worker send the shed reply in frame order
+        frames = queue.Queue()
+        slots = threading.BoundedSemaphore(self.queue_limit)
+        send_lock = threading.Lock()
+        # A single thread makes the AI calls of the connection, so a call still running after its budget
+        # ran out is followed, not overtaken, by the call of the next frame
+        calls = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-call-{}".format(conn_id))
+        worker = threading.Thread(target=self.worker, args=(client, frames, slots, send_lock, calls))
+        worker.start()
+
         try:
             while True:
-                header_buf = client.recv(3)
+                header_buf = recv_exact(client, 3)
                 if len(header_buf) != 3:
                     logging.error("[*] Failed to receive complete header")
                     break
 
                 msg_type = header_buf[0]
                 payload_length = struct.unpack('!H', header_buf[1:3])[0]
-                logging.info(f"[*] Received header - msg_type: 0x{msg_type:02x}, payload_length: {payload_length}")
+                frame_log.info("[*] Received header - msg_type: 0x%02x, payload_length: %d", msg_type, payload_length)
 
-                if payload_length > 0:
-                    payload_buf = client.recv(payload_length)
-                    if len(payload_buf) != payload_length:
-                        logging.error(f"[*] Failed to receive complete payload (expected: {payload_length}, got: {len(payload_buf)})")
-                        break
-                else:
-                    payload_buf = b''
+                payload_buf = recv_exact(client, payload_length)
+                if len(payload_buf) != payload_length:
+                    logging.error(f"[*] Failed to receive complete payload (expected: {payload_length}, got: {len(payload_buf)})")
+                    break
 
-                if msg_type == 0x01:
-                    logging.info("[*] Processing aggregated data from edge device")
-
-                    try:
-                        if payload_length >= 45:
-                            temp_avg, temp_min, temp_max = struct.unpack('!fff', payload_buf[0:12])
-                            humid_avg, humid_min, humid_max = struct.unpack('!fff', payload_buf[12:24])
-                            power_avg, power_min, power_max, power_p25, power_p75 = struct.unpack('!fffff', payload_buf[24:44])
-                            month = payload_buf[44]
-
-                            features = [temp_avg, temp_min, temp_max, humid_avg, humid_min, humid_max, 
-                                       power_avg, power_min, power_max, power_p25, power_p75, float(month)]
-
-                            logging.info(f"[*] Parsed features: {features}")
-
-                            self.data_counter += 1
-                            is_training = self.data_counter <= self.ntrain
-
-                            if is_training:
-                                # 훈련 데이터 추가
-                                ai_url = f"http://{self.caddr}:{self.cport}/{self.name}/training"
-                                ai_request = {"value": features}
-                                logging.info(f"[*] Adding training data ({self.data_counter}/{self.ntrain}) to {ai_url}")
-                                ai_response = requests.put(ai_url, json=ai_request, timeout=5)
-                                
-                                if ai_response.status_code == 200:
-                                    logging.info(f"[*] Training data {self.data_counter} added successfully")
-                                    
-                                    # 마지막 훈련 데이터를 추가했다면 학습 시작
-                                    if self.data_counter == self.ntrain:
-                                        logging.info("[*] All training data collected. Starting model training...")
-                                        train_start_url = f"http://{self.caddr}:{self.cport}/{self.name}/training"
-                                        train_response = requests.post(train_start_url, timeout=60)  # 학습 시간 고려하여 타임아웃 증가
-                                        
-                                        if train_response.status_code == 200:
-                                            train_result = train_response.json()
-                                            if train_result.get("opcode") == "success":
-                                                logging.info("[*] ✅ Model training completed successfully!")
-                                            else:
-                                                logging.error(f"[*] ❌ Model training failed: {train_result}")
-                                        else:
-                                            logging.error(f"[*] ❌ Model training request failed with status {train_response.status_code}")
-                                    
-                                    # 훈련 단계에서는 예측값 -1 반환
-                                    prediction = -1.0
-                                else:
-                                    logging.error(f"[*] Failed to add training data: {ai_response.status_code}")
-                                    prediction = -1.0
-                            else:
-                                # 테스트 데이터로 예측 수행
-                                ai_url = f"http://{self.caddr}:{self.cport}/{self.name}/testing"
-                                ai_request = {"value": features}
-                                logging.info(f"[*] Sending prediction request to {ai_url}")
-                                ai_response = requests.put(ai_url, json=ai_request, timeout=5)
-
-                                if ai_response.status_code == 200:
-                                    ai_result = ai_response.json()
-                                    if "prediction" in ai_result:
-                                        prediction = float(ai_result["prediction"])
-                                        logging.info(f"[*] 🎯 AI prediction result: {prediction}")
-                                    else:
-                                        logging.warning("[*] No prediction field in AI response")
-                                        prediction = -1.0
-                                else:
-                                    logging.error(f"[*] Prediction request failed with status {ai_response.status_code}")
-                                    prediction = -1.0
-
-                            # 클라이언트에 결과 전송
-                            ai_bytes = struct.pack('!f', prediction)
-                            resp_header = bytes([0x81]) + struct.pack('!H', 4)
-                            client.sendall(resp_header + ai_bytes)
-                            
-                            if prediction != -1.0:
-                                logging.info("[*] ✅ AI prediction result sent successfully")
-                            else:
-                                logging.info("[*] ⚠️ Sent default prediction (-1.0)")
-
-                        else:
-                            raise ValueError(f"Payload too short: expected 45 bytes, got {payload_length}")
-
-                    except Exception as e:
-                        logging.error(f"[*] Error processing AI request: {str(e)}")
-                        error_msg = f"AI processing error: {str(e)}"
-                        error_bytes = error_msg.encode('utf-8')
-                        error_header = bytes([0xFF]) + struct.pack('!H', len(error_bytes))
-                        try:
-                            client.sendall(error_header + error_bytes)
-                            logging.info("[*] Error response sent")
-                        except:
-                            logging.error("[*] Failed to send error response")
-
-                elif msg_type == 0x02:
-                    logging.info("[*] Mode change or other command received")
-                    ack_header = bytes([0x82]) + struct.pack('!H', 0)
-                    client.sendall(ack_header)
-                    logging.info("[*] ACK response sent")
+                if self.capture:
+                    self.capture.write(time.time(), conn_id, msg_type, payload_buf)
+
+                if slots.acquire(blocking=False):
+                    frames.put((msg_type, payload_buf, time.perf_counter()))
                 else:
-                    logging.warning(f"[*] Unknown message type: 0x{msg_type:02x}")
-                    error_msg = f"Unknown message type: 0x{msg_type:02x}"
-                    error_bytes = error_msg.encode('utf-8')
-                    error_header = bytes([0xFF]) + struct.pack('!H', len(error_bytes))
-                    client.sendall(error_header + error_bytes)
-
-        except requests.Timeout:
-            logging.error("[*] Timeout occurred while communicating with AI module")
-        except requests.RequestException as e:
-            logging.error(f"[*] Request error: {str(e)}")
+                    frame_log.warning("[*] Connection queue is full (%d frames); shedding the request", self.queue_limit)
+                    self.count("shed_queue")
+                    frames.put((None, None, None))
+
         except Exception as e:
             logging.error(f"[*] Unexpected error in handler: {str(e)}")
         finally:
+            frames.put(None)
+            worker.join()
+            calls.shutdown(wait=False)
+            if self.capture:
+                self.capture.flush()
             try:
                 client.close()
                 logging.info("[*] Client connection closed")
             except:
                 pass
 
+    def worker(self, client, frames, slots, send_lock, calls):
+        while True:
+            frame = frames.get()
+            if frame is None:
+                break
+            msg_type, payload_buf, received = frame
+            if msg_type is None:
+                reply = self.shed_reply()
+            else:
+                slots.release()
+                reply = self.process(msg_type, payload_buf, received, calls)
+                if msg_type == 0x01:
+                    self.stage_stats.add({"total": (time.perf_counter() - received) * 1000})
+            try:
+                self.send(client, send_lock, reply)
+            except OSError as e:
+                logging.error(f"[*] Failed to send the response: {str(e)}")
+
+    def send(self, client, send_lock, reply):
+        with send_lock:
+            client.sendall(reply)
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        with self.phase_lock:
+            stats["phase"] = self.phase
+            stats["buffered"] = len(self.buffered)
+            stats["dropped"] = self.stats_dropped
+        stats["stages"] = self.stage_stats.summary()
+        return stats
+
+    def report_stats(self, interval):
+        last = None
+        while True:
+            time.sleep(interval)
+            stats = self.get_stats()
+            if stats != last:
+                logging.info("[*] Gateway stats: {}".format(stats))
+                last = stats
+
+    def result_reply(self, prediction, degraded=False):
+        return bytes([0x81]) + struct.pack('!H', RESULT.size) + RESULT.pack(prediction, 1 if degraded else 0)
+
+    # The answer from the fallback predictor, flagged as degraded
+    def degraded_reply(self):
+        prediction = self.fallback.predict()
+        if prediction is None:
+            prediction = -1.0
+        self.count("degraded")
+        frame_log.info("[*] ⚠️ Sent degraded prediction from the fallback (%s)", prediction)
+        return self.result_reply(prediction, True)
+
+    # The answer to a request that is not forwarded to the AI module
+    def shed_reply(self):
+        if self.shed_mode == "degraded":
+            return self.degraded_reply()
+        return bytes([0xFF]) + struct.pack('!H', len(BUSY)) + BUSY
+
+    # Forward one frame to the AI module as training or testing data; returns the prediction (-1.0 for training data,
+    # or as answered by the AI module while the model cannot predict yet). A failed call raises RuntimeError
+    # submitted: when the call was handed to the executor, to time the wait for a free thread
+    def call_ai(self, kind, counter, features, submitted=None):
+        request_id = self.request_ids.next()
+        headers = {REQUEST_ID_HEADER: request_id}
+        if kind == "training":
+            # 훈련 데이터 추가
+            try:
+                frame_log.info("[*] Adding training data (%s/%d) to port %d (request %s)", counter, self.ntrain, self.ai_port, request_id)
+                ai_response = self.put_ai("training", features, headers)
+
+                if ai_response.status_code == 200:
+                    frame_log.info("[*] Training data %s added successfully", counter)
+                else:
+                    logging.error(f"[*] Failed to add training data: {ai_response.status_code}")
+            finally:
+                with self.phase_lock:
+                    self.outstanding -= 1
+                    self.phase_lock.notify_all()
+
+            # 훈련 단계에서는 예측값 -1 반환
+            return -1.0
+
+        # 테스트 데이터로 예측 수행
+        frame_log.info("[*] Sending prediction request %s to port %d", request_id, self.ai_port)
+        start = time.perf_counter()
+        ai_response = self.put_ai("testing", features, headers)
+
+        # http: the whole call as seen by the gateway; network: the part not spent inside the AI module
+        timings = {"http": (time.perf_counter() - start) * 1000}
+        if submitted is not None:
+            timings["wait"] = (start - submitted) * 1000
+        for stage, ms in parse_server_timing(ai_response.headers.get("Server-Timing")).items():
+            timings["ai." + stage] = ms
+        if "ai.total" in timings:
+            timings["network"] = max(timings["http"] - timings["ai.total"], 0.0)
+        self.stage_stats.add(timings)
+        frame_log.debug("[*] Stage timings of request %s: %s", request_id, timings)
+
+        if ai_response.status_code != 200:
+            raise RuntimeError(f"the prediction request failed with status {ai_response.status_code}")
+        ai_result = ai_response.json()
+        if "prediction" not in ai_result:
+            raise RuntimeError("no prediction field in the AI response ({})".format(ai_result.get("reason")))
+        prediction = float(ai_result["prediction"])
+        frame_log.info("[*] 🎯 AI prediction result: %s", prediction)
+        return prediction
+
+    # Keep a frame received while the model is being trained; called with phase_lock held
+    def buffer_frame(self, features):
+        if len(self.buffered) == self.buffered.maxlen:
+            self.stats_dropped += 1
+        self.buffered.append(features)
+
+    # Train the model in the background once every training instance reached the AI module, then
+    # send the frames buffered meanwhile as testing data and switch to the testing phase
+    def trainer(self):
+        with self.phase_lock:
+            while self.outstanding > 0:
+                self.phase_lock.wait()
+
+        logging.info("[*] All training data collected. Starting model training...")
+        train_start_url = f"http://{self.caddr}:{self.cport}/{self.name}/training"
+        for attempt in range(1, TRAIN_RETRIES + 1):
+            try:
+                train_response = requests.post(train_start_url, timeout=self.train_timeout)
+                if train_response.status_code == 200:
+                    train_result = train_response.json()
+                    if train_result.get("opcode") == "success":
+                        logging.info("[*] ✅ Model training completed successfully!")
+                        break
+                    logging.error(f"[*] ❌ Model training failed: {train_result}")
+                else:
+                    logging.error(f"[*] ❌ Model training request failed with status {train_response.status_code}")
+            except requests.RequestException as e:
+                logging.error(f"[*] ❌ Model training request failed: {str(e)}")
+            if attempt < TRAIN_RETRIES:
+                time.sleep(TRAIN_RETRY_DELAY)
+        else:
+            logging.error("[*] Giving up training after {} attempts; predictions come from the fallback".format(TRAIN_RETRIES))
+
+        # Frames keep being buffered while the buffer is flushed; the phase switches once it is empty
+        while True:
+            with self.phase_lock:
+                if not self.buffered:
+                    self.phase = PHASE_TESTING
+                    break
+                frames = list(self.buffered)
+                self.buffered.clear()
+                self.data_counter += len(frames)
+
+            logging.info("[*] Sending {} frames buffered during training".format(len(frames)))
+            for features in frames:
+                try:
+                    with self.inflight:
+                        self.call_ai("testing", None, features)
+                except Exception as e:
+                    logging.error(f"[*] Failed to send a buffered frame: {str(e)}")
+                    self.count("errors")
+
+        logging.info("[*] Switched to the testing phase")
+
+    # Process one frame; returns the response to be sent to the client
+    # received: when the frame was read from the connection, to time its wait in the connection queue
+    # calls: the single-thread executor making the AI calls in frame order (self.executor if not given)
+    def process(self, msg_type, payload_buf, received=None, calls=None):
+        payload_length = len(payload_buf)
+
+        if msg_type == 0x01:
+            frame_log.info("[*] Processing aggregated data from edge device")
+            start = time.perf_counter()
+            if received is not None:
+                self.stage_stats.add({"queue": (start - received) * 1000})
+
+            try:
+                if payload_length < 45:
+                    raise ValueError(f"Payload too short: expected 45 bytes, got {payload_length}")
+                features = decode_features(payload_buf)
+                self.stage_stats.add({"decode": (time.perf_counter() - start) * 1000})
+                frame_log.info("[*] Parsed features: %s", features)
+            except Exception as e:
+                logging.error(f"[*] Error processing AI request: {str(e)}")
+                self.count("errors")
+                error_msg = f"AI processing error: {str(e)}"
+                error_bytes = error_msg.encode('utf-8')
+                error_header = bytes([0xFF]) + struct.pack('!H', len(error_bytes))
+                return error_header + error_bytes
+
+            # Every frame updates the fallback, including the ones not forwarded to the AI module
+            self.fallback.update(features[self.index])
+
+            # While the model is being trained, the frames are buffered and answered by the fallback
+            with self.phase_lock:
+                learning = self.phase == PHASE_LEARNING
+                if learning:
+                    self.buffer_frame(features)
+            if learning:
+                return self.degraded_reply()
+
+            # Bounded number of outstanding requests toward the AI module
+            if not self.inflight.acquire(blocking=False):
+                frame_log.warning("[*] %d requests in flight to the AI module; shedding the request", self.max_inflight)
+                self.count("shed_inflight")
+                return self.shed_reply()
+
+            with self.phase_lock:
+                if self.phase == PHASE_LEARNING:
+                    self.buffer_frame(features)
+                    kind = None
+                else:
+                    self.data_counter += 1
+                    counter = self.data_counter
+                    kind = "training" if self.phase == PHASE_TRAINING else "testing"
+                    if kind == "training":
+                        self.outstanding += 1
+                        if counter == self.ntrain:
+                            self.phase = PHASE_LEARNING
+                            threading.Thread(target=self.trainer, daemon=True).start()
+            if kind is None:
+                self.inflight.release()
+                return self.degraded_reply()
+
+            # The slot is released when the AI module answers, not when the budget runs out; on a timeout
+            # only the reply is given up, the call still reaches the AI module before the next one
+            future = (calls or self.executor).submit(self.call_ai, kind, counter, features, time.perf_counter())
+            future.add_done_callback(lambda f: self.inflight.release())
+            try:
+                prediction = future.result(timeout=self.budget)
+            except concurrent.futures.TimeoutError:
+                frame_log.warning("[*] The AI module did not answer within %s s", self.budget)
+                self.count("timeouts")
+                return self.degraded_reply()
+            except Exception as e:
+                logging.error(f"[*] Error processing AI request: {str(e)}")
+                self.count("errors")
+                return self.degraded_reply()
+
+            # -1.0 is a regular answer (training phase, or a model without a full window yet); only
+            # timeouts, errors and shed requests are answered by the fallback
+            # 클라이언트에 결과 전송
+            self.count("processed")
+            frame_log.info("[*] ✅ AI prediction result sent successfully")
+            return self.result_reply(prediction)
+
+        elif msg_type == 0x02:
+            logging.info("[*] Mode change or other command received")
+            ack_header = bytes([0x82]) + struct.pack('!H', 0)
+            logging.info("[*] ACK response sent")
+            return ack_header
+        else:
+            logging.warning(f"[*] Unknown message type: 0x{msg_type:02x}")
+            error_msg = f"Unknown message type: 0x{msg_type:02x}"
+            error_bytes = error_msg.encode('utf-8')
+            error_header = bytes([0xFF]) + struct.pack('!H', len(error_bytes))
+            return error_header + error_bytes
+
 def command_line_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-a", "--algorithm", type=str, required=True)
@@ -223,17 +519,35 @@ def command_line_args():
     parser.add_argument("-y", "--ntest", type=int, default=365)
     parser.add_argument("-z", "--index", type=int, default=0)
     parser.add_argument("-l", "--log", type=str, default="INFO")
+    parser.add_argument("--max-inflight", type=int, default=16, help="Maximum number of outstanding requests to the AI module")
+    parser.add_argument("--queue-limit", type=int, default=8, help="Maximum number of queued frames per connection")
+    parser.add_argument("--shed-mode", type=str, choices=SHED_MODES, default="busy", help="Reply to a shed request: 0xFF busy or a degraded prediction from the fallback")
+    parser.add_argument("--stats-interval", type=float, default=10, help="Seconds between the stats logs (0: never)")
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds to wait for the AI module before answering from the fallback")
+    parser.add_argument("--fallback", type=str, choices=sorted(FALLBACKS), default="ewma", help="Fallback predictor of the power value")
+    parser.add_argument("--alpha", type=float, default=0.3, help="Smoothing factor of the ewma fallback")
+    parser.add_argument("--season", type=int, default=7, help="Season length (frames) of the seasonal fallback")
+    parser.add_argument("--buffer-limit", type=int, default=10000, help="Maximum number of frames buffered during training (oldest dropped)")
+    parser.add_argument("--train-timeout", type=float, default=600, help="Seconds to wait for the AI module to train the model")
+    parser.add_argument("--record", type=str, default=None, help="Capture file to record the received frames into")
+    parser.add_argument("--log-sample", type=int, default=1, help="Emit one out of every N per-frame log records")
     return parser.parse_args()
 
 def main():
     args = command_line_args()
-    logging.basicConfig(level=args.log)
+    setup_logging(args.log, args.log_sample, ["gateway.frame"])
 
     if args.ntrain <= 0 or args.ntest <= 0:
         logging.error("Number of instances for training or testing should be larger than 0")
         sys.exit(1)
 
-    Server(args.name, args.algorithm, args.dimension, args.index, args.lport, args.caddr, args.cport, args.ntrain, args.ntest)
+    if args.max_inflight <= 0 or args.queue_limit <= 0:
+        logging.error("The in-flight budget and the queue limit should be larger than 0")
+        sys.exit(1)
+
+    Server(args.name, args.algorithm, args.dimension, args.index, args.lport, args.caddr, args.cport, args.ntrain, args.ntest,
+           args.max_inflight, args.queue_limit, args.shed_mode, args.stats_interval,
+           args.budget, args.fallback, args.alpha, args.season, args.buffer_limit, args.train_timeout, args.record)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
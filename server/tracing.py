@@ -0,0 +1,66 @@
+import os
+import itertools
+import threading
+from collections import deque
+
+REQUEST_ID_HEADER = "X-Request-ID"
+STAGE_WINDOW = 1024
+
+class RequestIds:
+    """Request ids of the AI calls: <gateway id>-<sequence>, unique across gateway processes in practice"""
+
+    def __init__(self):
+        self.prefix = os.urandom(4).hex()
+        self.seq = itertools.count(1)
+
+    def next(self):
+        return "{}-{}".format(self.prefix, next(self.seq))
+
+# {stage: milliseconds} of a Server-Timing header value; entries without a duration are skipped
+def parse_server_timing(value):
+    ret = {}
+    for entry in (value or "").split(","):
+        parts = [p.strip() for p in entry.split(";")]
+        for param in parts[1:]:
+            if param.startswith("dur="):
+                try:
+                    ret[parts[0]] = ret.get(parts[0], 0.0) + float(param[len("dur="):])
+                except ValueError:
+                    pass
+    return ret
+
+class StageStats:
+    """Latency of each stage of the requests: exact count and mean, percentiles over the last window samples"""
+
+    def __init__(self, window=STAGE_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    # timings: {stage: milliseconds}
+    def add(self, timings):
+        with self.lock:
+            for stage, ms in timings.items():
+                if stage not in self.samples:
+                    self.samples[stage] = deque(maxlen=self.window)
+                    self.counts[stage] = 0
+                    self.totals[stage] = 0.0
+                self.samples[stage].append(ms)
+                self.counts[stage] += 1
+                self.totals[stage] += ms
+
+    def summary(self):
+        ret = {}
+        with self.lock:
+            for stage, samples in self.samples.items():
+                values = sorted(samples)
+                ret[stage] = {
+                    "count": self.counts[stage],
+                    "mean_ms": round(self.totals[stage] / self.counts[stage], 3),
+                    "p50_ms": round(values[(len(values) - 1) // 2], 3),
+                    "p99_ms": round(values[min(len(values) - 1, int(0.99 * len(values)))], 3),
+                    "max_ms": round(values[-1], 3),
+                }
+        return ret
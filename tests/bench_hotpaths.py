@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ai-module"))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+from ai import AIModule
+from modules.data_manager import DataManager
+from modules.evaluator import ModelEvaluator
+from server import decode_features, FEATURES
+
+DIMENSION = 12
+INDEX = 6
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+def synthetic(n, seed=0):
+    rng = np.random.default_rng(seed)
+    day = np.arange(n) % 365
+    power = 250.0 + 80.0 * np.cos(2 * np.pi * day / 365) + rng.normal(0, 10, n)
+    rows = np.repeat(power[:, None], DIMENSION, axis=1).astype(np.float32)
+    rows[:, 11] = day * 12 // 365 + 1
+    return rows
+
+# The stub algorithm in the echo mode predicts the current value (persistence), which isolates
+# the AIModule bookkeeping from the ML library; it needs no ML library to run
+def make_module():
+    os.environ["STUB_MODE"] = "echo"
+    os.environ["STUB_LATENCY_MS"] = "0"
+    ai = AIModule()
+    if not ai.add_model("bench", "stub", DIMENSION, INDEX):
+        raise RuntimeError("the stub algorithm is unavailable")
+    return ai
+
+def bench_add_data(rows):
+    values = rows.tolist()
+    def run():
+        dm = DataManager()
+        for v in values:
+            dm.add_data(v)
+    return run
+
+def bench_add_data_log(rows):
+    values = rows.tolist()
+    def run():
+        dname = tempfile.mkdtemp()
+        try:
+            dm = DataManager(os.path.join(dname, "bench.log"), DIMENSION)
+            for v in values:
+                dm.add_data(v)
+            dm.close()
+        finally:
+            shutil.rmtree(dname)
+    return run
+
+def bench_prediction(rows):
+    values = rows.tolist()
+    def run():
+        ai = make_module()
+        for v in values:
+            ai.add_testing_data("bench", v)
+            ai.prediction("bench", v)
+    return run
+
+def bench_get_result(rows):
+    ai = make_module()
+    for v in rows.tolist():
+        ai.add_testing_data("bench", v)
+        ai.prediction("bench", v)
+    def run():
+        ai.get_result("bench")
+    return run
+
+def bench_calculate_metrics(rows):
+    sequence = rows.tolist()
+    prediction = [-1] + rows[:-1, INDEX].tolist()
+    evaluator = ModelEvaluator()
+    def run():
+        evaluator.calculate_metrics(sequence, prediction, INDEX)
+    return run
+
+def bench_decode_features(rows):
+    frames = [FEATURES.pack(*r[:11].tolist(), int(r[11])) for r in rows]
+    def run():
+        for f in frames:
+            decode_features(f)
+    return run
+
+BENCHMARKS = {
+    "data_manager.add_data": bench_add_data,
+    "data_manager.add_data_log": bench_add_data_log,
+    "ai.prediction": bench_prediction,
+    "ai.get_result": bench_get_result,
+    "evaluator.calculate_metrics": bench_calculate_metrics,
+    "server.decode_features": bench_decode_features,
+}
+
+def measure(run, repeat):
+    # Time without tracing (best of repeat), then peak memory in a separate traced run
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def check(results, baseline, threshold):
+    failures = []
+    for key, result in results.items():
+        if key not in baseline:
+            failures.append("{}: not in the baseline (store it with --update)".format(key))
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            old = baseline[key][metric]
+            new = result[metric]
+            if old > 0 and new > old * (1 + threshold):
+                failures.append("{} {}: {:.6g} -> {:.6g} (+{:.1f}%)".format(key, metric, old, new, (new - old) / old * 100))
+    return failures
+
+def command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", metavar="<sizes>", help="Comma-separated dataset sizes", type=str, default="1000,10000,100000,1000000")
+    parser.add_argument("-b", "--benchmarks", metavar="<names>", help="Comma-separated benchmarks (default: all of {})".format(", ".join(BENCHMARKS)), type=str, default=None)
+    parser.add_argument("-r", "--repeat", metavar="<repeat>", help="Number of timed runs (the best one is reported)", type=int, default=3)
+    parser.add_argument("-f", "--baseline", metavar="<baseline file>", help="Stored baseline to compare with", type=str, default=BASELINE)
+    parser.add_argument("-t", "--threshold", metavar="<ratio>", help="Allowed relative regression versus the baseline", type=float, default=0.25)
+    parser.add_argument("-u", "--update", help="Store the results as the new baseline", action="store_true")
+    parser.add_argument("-n", "--no-check", help="Only measure, without comparing with a baseline", action="store_true")
+    parser.add_argument("-l", "--log", metavar="<log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)>", help="Log level (DEBUG/INFO/WARNING/ERROR/CRITICAL)", type=str, default="WARNING")
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = command_line_args()
+    logging.basicConfig(level=args.log)
+
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    names = args.benchmarks.split(",") if args.benchmarks else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print("Unknown benchmark: {}".format(name))
+            sys.exit(1)
+
+    results = {}
+    for n in sizes:
+        rows = synthetic(n)
+        for name in names:
+            seconds, peak = measure(BENCHMARKS[name](rows), args.repeat)
+            key = "{}[{}]".format(name, n)
+            results[key] = {"seconds": seconds, "peak_bytes": peak}
+            print("{:<40} {:>12.6f} s {:>14,d} B".format(key, seconds, peak))
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Baseline stored in {}".format(args.baseline))
+        return
+
+    if args.no_check:
+        return
+
+    # The timings depend on the machine, so the baseline is stored on the machine running the check
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}; store one with --update on this machine (or measure only with --no-check)".format(args.baseline))
+        sys.exit(1)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failures = check(results, baseline, args.threshold)
+    if failures:
+        print("Regressions beyond {:.0f}%:".format(args.threshold * 100))
+        for failure in failures:
+            print("  {}".format(failure))
+        sys.exit(1)
+    print("No regression beyond {:.0f}% versus {}".format(args.threshold * 100, args.baseline))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import socket
+import struct
+import threading
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ai-module"))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+# load_generator.py and dataset_generator.py (after the modules: ROOT also has the server/ directory)
+sys.path.append(ROOT)
+
+# The stub algorithm predicts the current value (echo) without an ML library
+os.environ["STUB_MODE"] = "echo"
+os.environ["STUB_LATENCY_MS"] = "0"
+
+# create_app(**options): the test client of an AI module serving its models from tmp_path/data
+# (ai.ai is its AIModule); it is closed at the end of the test
+@pytest.fixture
+def create_app(tmp_path):
+    import ai
+    threshold = ai.THRESHOLD
+    modules = []
+
+    def create(**options):
+        app = ai.create_app(str(tmp_path / "data"), **options)
+        modules.append(ai.ai)
+        return app.test_client()
+
+    yield create
+    for module in modules:
+        module.close()
+    ai.THRESHOLD = threshold
+
+@pytest.fixture
+def client(create_app):
+    return create_app()
+
+# Create a model with the stub algorithm and train it with the values
+def make_model(client, name, values=(1.0, 2.0, 3.0), **params):
+    args = dict({"algorithm": "stub"}, **params)
+    assert client.post("/{}".format(name), json=args).get_json()["opcode"] == "success"
+    for v in values:
+        assert client.put("/{}/training".format(name), json={"value": [v] * args.get("dimension", 1)}).get_json()["opcode"] == "success"
+    assert client.post("/{}/training".format(name)).get_json()["opcode"] == "success"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class FakeAI:
+    """HTTP server standing in for the AI module of the gateway
+
+    PUT /<model>/testing answers the first feature as the prediction (or the value of
+    predictions for it) after the delay set for it; the order of the calls is recorded.
+    GET /workers answers the worker list of the router if workers is set (404 otherwise).
+    """
+
+    def __init__(self):
+        from flask import Flask, request, jsonify
+        from werkzeug.serving import make_server
+
+        self.delays = {}
+        self.predictions = {}
+        self.training = []
+        self.testing = []
+        self.trained = threading.Event()
+        self.train_delay = 0.0
+        self.workers = None
+
+        app = Flask("fake_ai")
+
+        @app.route("/workers", methods=["GET"])
+        def workers():
+            if self.workers is None:
+                return jsonify(opcode="failure"), 404
+            return jsonify(self.workers)
+
+        @app.route("/<name>", methods=["POST"])
+        def create(name):
+            return jsonify(opcode="success")
+
+        @app.route("/<name>/training", methods=["PUT"])
+        def add_training(name):
+            self.training.append(request.get_json()["value"][0])
+            return jsonify(opcode="success")
+
+        @app.route("/<name>/training", methods=["POST"])
+        def train(name):
+            time.sleep(self.train_delay)
+            self.trained.set()
+            return jsonify(opcode="success")
+
+        @app.route("/<name>/testing", methods=["PUT"])
+        def add_testing(name):
+            v = request.get_json()["value"][0]
+            time.sleep(self.delays.get(v, 0.0))
+            self.testing.append(v)
+            return jsonify(opcode="success", prediction=self.predictions.get(v, v))
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+@pytest.fixture
+def fake_ai():
+    fake = FakeAI()
+    yield fake
+    fake.close()
+
+class Device:
+    """Edge device connected to a gateway: sends 0x01 frames, reads (msg_type, body) replies"""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+
+    def send(self, value):
+        import server
+        payload = server.FEATURES.pack(value, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1)
+        self.sock.sendall(bytes([0x01]) + struct.pack("!H", len(payload)) + payload)
+
+    def recv(self):
+        import server
+        header = server.recv_exact(self.sock, 3)
+        return header[0], server.recv_exact(self.sock, struct.unpack("!H", header[1:])[0])
+
+    def close(self):
+        self.sock.close()
+
+# start_gateway(ai_port, ntrain=..., **options): a gateway on model "m" (index 0) in a background thread
+@pytest.fixture
+def start_gateway():
+    import server
+    devices = []
+
+    def start(ai_port, ntrain=1, **options):
+        port = free_port()
+        options.setdefault("stats_interval", 0)
+        gateway = server.Server.__new__(server.Server)
+        threading.Thread(target=gateway.__init__, args=("m", "stub", 12, 0, port, "127.0.0.1", ai_port, ntrain, 100),
+                         kwargs=options, daemon=True).start()
+        deadline = time.time() + 10
+        while True:
+            try:
+                device = Device(port)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+        devices.append(device)
+        return gateway, device
+
+    yield start
+    for device in devices:
+        device.close()
+
+# (prediction, degraded flag) of a 0x81 reply
+def result(reply):
+    import server
+    msg_type, body = reply
+    assert msg_type == 0x81 and len(body) == server.RESULT.size
+    return server.RESULT.unpack(body)
+
+# Send the training frame of a gateway started with ntrain=1 and wait for the end of the training
+def trained(gateway, device, fake):
+    import server
+    device.send(0)
+    assert result(device.recv()) == (-1.0, 0)
+    assert fake.trained.wait(5)
+    assert wait_until(lambda: gateway.phase == server.PHASE_TESTING)
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
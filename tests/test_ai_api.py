@@ -0,0 +1,147 @@
+import io
+import gzip
+import json
+import numpy as np
+import pytest
+import ai
+from tracing import parse_server_timing
+from conftest import make_model
+
+def add_testing(client, name, values):
+    for v in values:
+        assert client.put("/{}/testing".format(name), json={"value": [v]}).get_json()["opcode"] == "success"
+
+def test_stub_echoes_the_current_value(client):
+    make_model(client, "m")
+    assert client.put("/m/testing", json={"value": [42.0]}).get_json()["prediction"] == 42.0
+
+def test_stub_constant_mode(client, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "constant")
+    monkeypatch.setenv("STUB_CONSTANT", "7.5")
+    make_model(client, "m")
+    assert client.put("/m/testing", json={"value": [42.0]}).get_json()["prediction"] == 7.5
+
+def test_result_etag_and_not_modified(client):
+    make_model(client, "m")
+    add_testing(client, "m", [1.0, 2.0, 3.0])
+
+    first = client.get("/m/result")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+    assert client.get("/m/result", headers={"If-None-Match": etag}).status_code == 304
+
+    # New data, a new threshold: the former ETag is stale
+    add_testing(client, "m", [4.0])
+    second = client.get("/m/result", headers={"If-None-Match": etag})
+    assert second.status_code == 200 and second.headers["ETag"] != etag
+    assert second.get_json()["num"] == 3
+    etag = second.headers["ETag"]
+    assert client.put("/config/threshold", json={"threshold": 0.5}).get_json()["opcode"] == "success"
+    assert client.get("/m/result", headers={"If-None-Match": etag}).status_code == 200
+
+def test_recreated_model_gets_a_new_etag(client):
+    make_model(client, "m")
+    add_testing(client, "m", [1.0, 2.0, 3.0])
+    old = client.get("/m/result")
+
+    # Same number of changes after the re-creation, different data
+    assert client.delete("/m").get_json()["opcode"] == "success"
+    make_model(client, "m")
+    add_testing(client, "m", [10.0, 30.0, 60.0])
+    new = client.get("/m/result", headers={"If-None-Match": old.headers["ETag"]})
+    assert new.status_code == 200
+    assert new.get_json()["sequence"] != old.get_json()["sequence"]
+
+def test_result_as_npz(client):
+    make_model(client, "m")
+    add_testing(client, "m", [1.0, 2.0, 4.0])
+
+    response = client.get("/m/result?format=npz")
+    assert response.mimetype == "application/x-npz"
+    with np.load(io.BytesIO(response.data)) as arrays:
+        # The last prediction is about the next instance
+        assert arrays["prediction"].tolist() == [1.0, 2.0, 4.0]
+        assert arrays["sequence"][:, 0].tolist() == [2.0, 4.0]
+        assert int(arrays["num"]) == 2
+
+    # Each representation has its own ETag
+    assert response.headers["ETag"] != client.get("/m/result").headers["ETag"]
+
+def test_large_result_is_gzipped(client):
+    make_model(client, "m")
+    add_testing(client, "m", [float(v) for v in range(1, 200)])
+
+    plain = client.get("/m/result")
+    compressed = client.get("/m/result", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+def test_forecast_leaves_the_model_unchanged(client):
+    make_model(client, "m")
+    add_testing(client, "m", [5.0, 6.0])
+
+    ret = client.get("/m/forecast?horizon=3").get_json()
+    assert ret["opcode"] == "success" and ret["prediction"] == [6.0, 6.0, 6.0]
+    assert client.get("/m/testing").get_json()["num"] == 2
+    assert client.put("/m/testing", json={"value": [7.0]}).get_json()["prediction"] == 7.0
+
+    ret = client.post("/forecast", json={"requests": [{"model": "m", "horizon": 2}, {"model": "m", "horizon": 1, "window": [[1.0], [9.0]]}]}).get_json()
+    assert [f["prediction"] for f in ret["forecasts"]] == [[7.0, 7.0], [9.0]]
+
+    assert client.get("/m/forecast?horizon=0").get_json()["opcode"] == "failure"
+    assert client.get("/nothing/forecast").get_json()["opcode"] == "failure"
+
+def test_versions_and_rollback(client):
+    make_model(client, "m")
+    assert client.post("/m/rollback").get_json()["opcode"] == "failure"
+
+    assert client.post("/m/training").get_json()["opcode"] == "success"
+    versions = client.get("/m/versions").get_json()
+    assert versions["current"] == 2
+    assert [v["version"] for v in versions["versions"]] == [1, 2]
+    assert all(v["on_disk"] for v in versions["versions"])
+
+    ret = client.post("/m/rollback").get_json()
+    assert ret["opcode"] == "success" and ret["version"] == 1
+    assert client.get("/m/versions").get_json()["current"] == 1
+    assert client.get("/m").get_json()["version"] == 1
+    assert client.post("/m/rollback", json={"version": 1}).get_json()["opcode"] == "failure"
+    assert client.post("/m/rollback", json={"version": 2}).get_json()["version"] == 2
+
+def test_old_versions_are_pruned(client, monkeypatch):
+    monkeypatch.setattr(ai.ai, "keep_versions", 1)
+    make_model(client, "m")
+    for _ in range(3):
+        client.post("/m/training")
+    versions = client.get("/m/versions").get_json()
+    assert versions["current"] == 4
+    assert [v["version"] for v in versions["versions"]] == [3, 4]
+
+def test_request_id_and_server_timing(client):
+    make_model(client, "m")
+    response = client.put("/m/testing", json={"value": [1.0]}, headers={"X-Request-ID": "abc-1"})
+    assert response.headers["X-Request-ID"] == "abc-1"
+    timings = parse_server_timing(response.headers["Server-Timing"])
+    assert {"routing", "parse", "predict", "total"} <= set(timings)
+    assert timings["total"] >= timings["predict"]
+
+    assert client.get("/").headers["X-Request-ID"]
+
+@pytest.mark.parametrize("windows", [[0], [-5], "100", [1.5], [True]])
+def test_invalid_windows_are_refused(client, windows):
+    ret = client.post("/m", json={"algorithm": "stub", "windows": windows}).get_json()
+    assert ret["opcode"] == "failure" and "windows" in ret["reason"]
+    ret = client.post("/m", json={"algorithm": "stub", "time_windows": windows}).get_json()
+    assert ret["opcode"] == "failure" and "time_windows" in ret["reason"]
+    assert not ai.ai.has_model("m")
+
+def test_rolling_evaluation(client):
+    make_model(client, "m", windows=[2], time_windows=[60])
+    add_testing(client, "m", [100.0, 110.0, 200.0, 220.0])
+
+    windows = client.get("/m/rolling_evaluation").get_json()["windows"]
+    # Resolved: (110, 100), (200, 110), (220, 200); the last 2 of them
+    assert windows["last_2"]["num_samples"] == 2
+    assert windows["last_2"]["mae"] == pytest.approx((90.0 + 20.0) / 2)
+    assert windows["last_60s"]["num_samples"] == 3
@@ -0,0 +1,57 @@
+import time
+import load_generator
+import bench_hotpaths
+from conftest import trained
+
+def test_benchmark_check_reports_regressions_and_missing_keys():
+    baseline = {"a": {"seconds": 1.0, "peak_bytes": 100}, "b": {"seconds": 1.0, "peak_bytes": 0}}
+    results = {"a": {"seconds": 1.05, "peak_bytes": 100}, "b": {"seconds": 0.5, "peak_bytes": 50}}
+    assert bench_hotpaths.check(results, baseline, 0.1) == []
+
+    results["a"]["peak_bytes"] = 200
+    results["c"] = {"seconds": 1.0, "peak_bytes": 1}
+    failures = bench_hotpaths.check(results, baseline, 0.1)
+    assert len(failures) == 2
+    assert failures[0].startswith("a peak_bytes") and failures[1].startswith("c: not in the baseline")
+
+def test_benchmarks_run_on_the_stub():
+    rows = bench_hotpaths.synthetic(50)
+    for run in bench_hotpaths.BENCHMARKS.values():
+        seconds, peak = bench_hotpaths.measure(run(rows), 1)
+        assert seconds > 0 and peak >= 0
+
+def test_summarize_skips_the_warmup_and_counts_the_outcomes():
+    samples = [(0.0, 0.5, "prediction"), (10.0, 0.010, "prediction"), (11.0, 0.020, "degraded"),
+               (12.0, 0.030, "default"), (13.0, None, "timeout")]
+    report = load_generator.summarize(samples, 2.0, warmup_until=5.0)
+    assert report["frames"] == 4
+    assert report["throughput"] == 1.5
+    assert report["outcomes"] == {"prediction": 1, "degraded": 1, "default": 1, "timeout": 1}
+    assert report["error_rate"] == 0.25
+    assert report["latency_ms"]["count"] == 3 and report["latency_ms"]["max"] == 30.0
+    assert report["prediction_latency_ms"] == load_generator.latency_stats([0.010])
+    assert load_generator.latency_stats([]) == {"count": 0}
+
+def test_compare_flags_regressions_beyond_the_tolerance():
+    def report(throughput, p99, errors=0.0):
+        return {"gateway": {"throughput": throughput, "error_rate": errors, "latency_ms": {"p50": 1.0, "p95": 2.0, "p99": p99}}}
+
+    baseline = report(100.0, 10.0)
+    assert load_generator.compare(report(95.0, 10.5), baseline, 0.1)
+    assert not load_generator.compare(report(80.0, 10.0), baseline, 0.1)
+    assert not load_generator.compare(report(100.0, 12.0), baseline, 0.1)
+    assert not load_generator.compare(report(100.0, 10.0, errors=0.05), baseline, 0.1)
+
+def test_device_reads_the_result_and_the_degraded_flag(fake_ai, start_gateway):
+    gateway, device = start_gateway(fake_ai.port, budget=0.2)
+    trained(gateway, device, fake_ai)
+
+    sim = load_generator.Device(0, "127.0.0.1", gateway.port, 0, 3, time.time() + 10, 5)
+    sim.run()
+    assert [s[2] for s in sim.samples] == ["prediction"] * 3
+
+    # Late answers of the AI module are replaced by the fallback's and flagged
+    fake_ai.delays.update({v: 0.5 for v in fake_ai.testing})
+    sim = load_generator.Device(0, "127.0.0.1", gateway.port, 0, 1, time.time() + 10, 5)
+    sim.run()
+    assert [s[2] for s in sim.samples] == ["degraded"]
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import pytest
+import dataset_generator
+from modules.dataset_log import DatasetLog, HEADER_SIZE
+from modules.dataset_loader import load_dataset, RECORD_DIMENSION
+from modules.data_manager import DataManager, RowBuffer, window_view
+from conftest import make_model
+
+def test_dataset_log_is_replayed_after_reopening(tmp_path):
+    path = str(tmp_path / "m.training.log")
+    log = DatasetLog(path, 2, sync_every=2)
+    log.append([1.0, 2.0])
+    log.extend([[3.0, 4.0], [5.0, 6.0]])
+    assert log.rows().tolist() == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    log.close()
+
+    log = DatasetLog(path, 2)
+    assert len(log) == 3 and log.rows()[-1].tolist() == [5.0, 6.0]
+    log.close()
+    with pytest.raises(ValueError):
+        DatasetLog(path, 3)
+
+def test_dataset_log_drops_a_partial_row(tmp_path):
+    path = str(tmp_path / "m.testing.log")
+    log = DatasetLog(path, 2)
+    log.extend([[1.0, 2.0], [3.0, 4.0]])
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    log = DatasetLog(path, 2)
+    assert len(log) == 2
+    assert os.path.getsize(path) == HEADER_SIZE + 2 * 2 * 4
+    log.append([5.0, 6.0])
+    assert log.rows().tolist() == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    log.close()
+
+def test_dataset_log_trim_keeps_earlier_views(tmp_path):
+    log = DatasetLog(str(tmp_path / "m.log"), 1)
+    log.extend(np.arange(5, dtype=np.float32).reshape(-1, 1))
+    before = log.rows()
+    assert log.trim(2).ravel().tolist() == [0.0, 1.0]
+    assert log.rows().ravel().tolist() == [2.0, 3.0, 4.0]
+    assert before.ravel().tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    log.close()
+
+def test_models_are_restored_from_the_dataset_logs(create_app):
+    import ai
+    client = create_app()
+    make_model(client, "m")
+    for v in (4.0, 5.0):
+        client.put("/m/testing", json={"value": [v]})
+    ai.ai.close()
+
+    client = create_app()
+    assert client.get("/m/training").get_json()["num"] == 3
+    assert client.get("/m/testing").get_json()["num"] == 2
+    # The model continues from its window and serves the restored version
+    assert client.get("/m").get_json()["version"] == 1
+    assert client.put("/m/testing", json={"value": [6.0]}).get_json()["prediction"] == 6.0
+    assert client.get("/m/result").get_json()["num"] == 2
+
+def test_training_files_are_loaded_from_the_dataset_root(create_app, tmp_path):
+    root = tmp_path / "datasets"
+    root.mkdir()
+    np.save(str(root / "d.npy"), np.arange(10, dtype=np.float32).reshape(-1, 1))
+    (root / "d.csv").write_text("power\n1\n2\n3\n")
+    outside = tmp_path / "secret.npy"
+    np.save(str(outside), np.zeros((3, 1), dtype=np.float32))
+    os.symlink(str(outside), str(root / "link.npy"))
+
+    client = create_app(dataset_root=str(root))
+    assert client.post("/m", json={"algorithm": "stub"}).get_json()["opcode"] == "success"
+    assert client.post("/m/training", json={"path": "d.npy"}).get_json()["opcode"] == "success"
+    assert client.post("/m/training", json={"path": "d.csv", "append": True}).get_json()["opcode"] == "success"
+    assert client.get("/m/training").get_json()["num"] == 3
+
+    # Missing files and files outside the root get the same answer
+    reasons = set()
+    for path in ("missing.npy", "../secret.npy", str(outside), "link.npy", "."):
+        ret = client.post("/m/training", json={"path": path}).get_json()
+        assert ret["opcode"] == "failure"
+        reasons.add(ret["reason"].replace(path, "<path>"))
+    assert reasons == {"the dataset <path> is not available"}
+
+def test_training_files_are_refused_without_a_dataset_root(client, tmp_path):
+    path = str(tmp_path / "d.npy")
+    np.save(path, np.ones((3, 1), dtype=np.float32))
+    client.post("/m", json={"algorithm": "stub"})
+    ret = client.post("/m/training", json={"path": path}).get_json()
+    assert ret["opcode"] == "failure" and "--dataset-root" in ret["reason"]
+
+def test_generator_is_deterministic_and_writes_the_edge_records(tmp_path):
+    npy, raw = str(tmp_path / "a.npy"), str(tmp_path / "a.bin")
+    dataset_generator.generate([npy, raw], 100, "2024-01-01", 24, 10, seed=3, chunk_rows=32)
+    again = str(tmp_path / "b.npy")
+    dataset_generator.generate([again], 100, "2024-01-01", 24, 10, seed=3, chunk_rows=32)
+
+    rows = load_dataset(npy, RECORD_DIMENSION)
+    assert rows.shape == (100, RECORD_DIMENSION)
+    assert np.array_equal(rows, load_dataset(again, RECORD_DIMENSION))
+    assert np.array_equal(rows, load_dataset(raw, RECORD_DIMENSION))
+
+    # avg is within [min, max], the quartiles are ordered, months are 1..12
+    assert np.all((rows[:, 1] <= rows[:, 0]) & (rows[:, 0] <= rows[:, 2]))
+    assert np.all((rows[:, 7] <= rows[:, 9]) & (rows[:, 9] <= rows[:, 10]) & (rows[:, 10] <= rows[:, 8]))
+    assert set(np.unique(rows[:, 11])) <= set(range(1, 13))
+
+    other = str(tmp_path / "c.npy")
+    dataset_generator.generate([other], 100, "2024-01-01", 24, 10, seed=4, chunk_rows=32)
+    assert not np.array_equal(rows, load_dataset(other, RECORD_DIMENSION))
+
+def test_generator_refuses_unknown_formats(tmp_path):
+    with pytest.raises(ValueError):
+        dataset_generator.generate([str(tmp_path / "a.csv")], 10, "2024-01-01", 24, 10, 0)
+
+def test_window_view_shares_the_rows():
+    rows = np.arange(20, dtype=np.float32).reshape(10, 2)
+    windows, labels = window_view(rows, 3)
+    assert windows.shape == (6, 3, 2) and labels.shape == (6, 2)
+    assert np.shares_memory(windows, rows) and np.shares_memory(labels, rows)
+    for i in range(6):
+        assert np.array_equal(windows[i], rows[i:i + 3])
+        assert np.array_equal(labels[i], rows[i + 4])
+
+    windows, labels = window_view(rows[:4], 3)
+    assert windows.shape == (0, 3, 2) and labels.shape == (0, 2)
+
+def test_row_buffer_grows_and_keeps_the_dtype():
+    buf = RowBuffer(1, capacity=2, dtype=np.float64)
+    for v in (0.1, 0.2, 0.3):
+        buf.append([v])
+    buf.extend([[0.4], [0.5]])
+    assert buf.rows().dtype == np.float64
+    assert buf.rows().ravel().tolist() == [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert buf.trim(2).ravel().tolist() == [0.1, 0.2]
+    assert buf.rows().ravel().tolist() == [0.3, 0.4, 0.5]
+
+    # The testing values and the predictions keep their precision in memory
+    testing = DataManager(None, 1, contiguous=True, dtype=np.float64)
+    testing.add_data([1234567.891])
+    assert testing.get_data()[0, 0] == 1234567.891
+
+def test_lstm_batches_cover_every_window():
+    pytest.importorskip("keras")
+    pytest.importorskip("sklearn")
+    from algorithms.lstm import WindowBatches
+
+    rows = np.arange(100, dtype=np.float32).reshape(-1, 1)
+    batches = WindowBatches(rows, 5, lambda x: np.asarray(x, dtype=np.float32) / 100, batch_size=16)
+    labels = np.concatenate([batches[i][1] for i in range(len(batches))])
+    assert len(batches) == 6
+    assert np.allclose(np.sort(labels.ravel()), np.arange(6, 100) / 100)
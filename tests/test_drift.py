@@ -0,0 +1,60 @@
+import functools
+import pytest
+import ai
+from modules import drift
+from modules.drift import PageHinkley, ErrorRatio, make_detector
+from conftest import make_model, wait_until
+
+def logged(init):
+    @functools.wraps(init)
+    def wrapper(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+    return wrapper
+
+class WrappedRatio(ErrorRatio):
+    @logged
+    def __init__(self, window=100, ratio=2.0):
+        super().__init__(window, ratio)
+
+def test_make_detector_takes_only_the_parameters(monkeypatch):
+    assert make_detector(None) is None
+    assert make_detector({"method": "none"}) is None
+    with pytest.raises(ValueError):
+        make_detector({"method": "unknown"})
+
+    detector = make_detector({"method": "page_hinkley", "threshold": 5.0, "cooldown": 0, "retrain_window": 10})
+    assert isinstance(detector, PageHinkley) and detector.threshold == 5.0 and detector.delta == 0.01
+
+    # The parameters are read from the signature, also through a decorated __init__
+    monkeypatch.setitem(drift.DETECTORS, "wrapped", WrappedRatio)
+    detector = make_detector({"method": "wrapped", "window": 3, "cooldown": 0})
+    assert detector.window == 3 and detector.ratio == 2.0
+
+def test_error_ratio_detects_an_increase():
+    detector = ErrorRatio(window=3, ratio=2.0)
+    assert not any(detector.update(e) for e in [0.1, 0.1, 0.1, 0.1, 0.2, 0.2])
+    assert detector.update(0.4)
+
+def test_page_hinkley_detects_a_shift():
+    detector = PageHinkley(delta=0.01, threshold=0.5, min_samples=10)
+    assert not any(detector.update(0.05) for _ in range(50))
+    assert any(detector.update(0.5) for _ in range(10))
+
+def test_drift_retrains_the_model(client):
+    config = {"method": "error_ratio", "window": 2, "ratio": 1.5, "cooldown": 0, "retrain_window": 10}
+    make_model(client, "m", drift=config)
+    assert client.get("/m").get_json()["drift"] == config
+
+    for v in (100.0, 100.0, 100.0, 200.0, 100.0):
+        client.put("/m/testing", json={"value": [v]})
+    assert wait_until(lambda: client.get("/m").get_json()["retrains"] == 1)
+
+    info = client.get("/m").get_json()
+    assert info["version"] == 2 and not info["retraining"]
+    assert [v["source"] for v in client.get("/m/versions").get_json()["versions"]] == ["training", "drift"]
+    # The detector starts again after a detection
+    assert ai.ai.drift["m"].num_reference == 0
+
+def test_invalid_drift_method_is_refused(client):
+    ret = client.post("/m", json={"algorithm": "stub", "drift": {"method": "unknown"}}).get_json()
+    assert ret["opcode"] == "failure"
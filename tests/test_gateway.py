@@ -0,0 +1,113 @@
+import time
+import server
+from capture import CaptureWriter, read_capture
+from conftest import FakeAI, result, trained, wait_until
+
+BUSY = (0xFF, server.BUSY)
+
+def test_result_reply_is_prediction_and_flag(fake_ai, start_gateway):
+    gateway, device = start_gateway(fake_ai.port)
+    trained(gateway, device, fake_ai)
+
+    device.send(7)
+    assert result(device.recv()) == (7.0, 0)
+
+    # -1.0 from the AI module (e.g., a window not full yet) is a regular answer, not a degraded one
+    fake_ai.predictions[8] = -1.0
+    device.send(8)
+    assert result(device.recv()) == (-1.0, 0)
+    assert gateway.get_stats()["degraded"] == 0
+
+def test_timeout_answers_from_fallback_and_keeps_call_order(fake_ai, start_gateway):
+    gateway, device = start_gateway(fake_ai.port, budget=0.2, fallback="last")
+    trained(gateway, device, fake_ai)
+
+    fake_ai.delays[1] = 1.0
+    replies = []
+    for v in range(1, 6):
+        device.send(v)
+        replies.append(result(device.recv()))
+
+    # The late call only loses its reply (answered with the last value seen); the next calls wait for it
+    assert replies[0] == (1.0, 1)
+    assert wait_until(lambda: len(fake_ai.testing) == 5)
+    assert fake_ai.testing == [1, 2, 3, 4, 5]
+    assert gateway.get_stats()["timeouts"] >= 1
+
+def test_shed_replies_keep_frame_order(fake_ai, start_gateway):
+    gateway, device = start_gateway(fake_ai.port, queue_limit=2, budget=5)
+    trained(gateway, device, fake_ai)
+
+    for v in range(1, 8):
+        fake_ai.delays[v] = 0.3
+    device.send(1)
+    time.sleep(0.1)
+    for v in range(2, 8):
+        device.send(v)
+
+    replies = [device.recv() for _ in range(7)]
+    assert [result(r) for r in replies[:3]] == [(1.0, 0), (2.0, 0), (3.0, 0)]
+    assert replies[3:] == [BUSY] * 4
+    assert gateway.get_stats()["shed_queue"] == 4
+
+def test_frames_during_training_are_buffered(fake_ai, start_gateway):
+    fake_ai.train_delay = 0.5
+    gateway, device = start_gateway(fake_ai.port, ntrain=2, fallback="last")
+
+    for v in (10, 11):
+        device.send(v)
+        assert result(device.recv()) == (-1.0, 0)
+
+    # Answered right away by the fallback while the AI module trains the model
+    device.send(12)
+    assert result(device.recv()) == (12.0, 1)
+    device.send(13)
+    assert result(device.recv()) == (13.0, 1)
+
+    assert wait_until(lambda: gateway.phase == server.PHASE_TESTING)
+    assert fake_ai.training == [10, 11]
+    assert fake_ai.testing == [12, 13]
+
+    device.send(14)
+    assert result(device.recv()) == (14.0, 0)
+
+def test_calls_go_to_the_published_worker(fake_ai, start_gateway):
+    worker = FakeAI()
+    try:
+        fake_ai.workers = {"opcode": "success", "workers": [worker.port], "affinity": "crc32", "owner": 0, "port": worker.port}
+        gateway, device = start_gateway(fake_ai.port)
+        assert gateway.ai_port == worker.port
+        trained(gateway, device, fake_ai)
+
+        device.send(5)
+        assert result(device.recv()) == (5.0, 0)
+        assert worker.training == [0] and worker.testing == [5]
+        assert fake_ai.testing == []
+    finally:
+        worker.close()
+
+def test_capture_records_the_frames(fake_ai, start_gateway, tmp_path):
+    path = str(tmp_path / "frames.cap")
+    gateway, device = start_gateway(fake_ai.port, record=path)
+    trained(gateway, device, fake_ai)
+    device.send(3)
+    device.recv()
+    device.close()
+    assert wait_until(lambda: gateway.capture.num == 2)
+    gateway.capture.close()
+
+    records = list(read_capture(path))
+    assert [r[2] for r in records] == [0x01, 0x01]
+    assert [server.decode_features(r[3])[0] for r in records] == [0.0, 3.0]
+    assert records[0][1] == records[1][1]
+
+def test_capture_ignores_a_truncated_record(tmp_path):
+    path = str(tmp_path / "frames.cap")
+    writer = CaptureWriter(path)
+    writer.write(1.0, 1, 0x01, b"abc")
+    writer.write(2.0, 2, 0x02, b"")
+    writer.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 5)
+
+    assert list(read_capture(path)) == [(1.0, 1, 0x01, b"abc"), (2.0, 2, 0x02, b"")]
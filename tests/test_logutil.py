@@ -0,0 +1,50 @@
+import sys
+import queue
+import logging
+from putils import logutil
+from putils.logutil import DeferredQueueHandler, SampleFilter, file_logger
+
+def record(msg, *args, exc_info=None):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+
+def test_sample_filter_counts_per_message_template():
+    sample = SampleFilter(3)
+    passed = [sample.filter(record("frame %d", i)) for i in range(7)]
+    assert passed == [True, False, False, True, False, False, True]
+    assert sample.filter(record("other %s", "x"))
+    assert all(SampleFilter(1).filter(record("frame %d", i)) for i in range(3))
+
+def test_queue_handler_defers_formatting_and_drops_when_full():
+    q = queue.Queue(2)
+    handler = DeferredQueueHandler(q)
+    values = [1, 2]
+    handler.handle(record("state %s", values))
+    # The message is not formatted by the caller
+    entry = q.get_nowait()
+    assert entry.msg == "state %s" and entry.args[0] is values
+
+    for i in range(4):
+        handler.handle(record("frame %d", i))
+    assert q.qsize() == 2 and handler.dropped == 2
+
+def test_queue_handler_renders_the_traceback():
+    q = queue.Queue()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        DeferredQueueHandler(q).handle(record("failed", exc_info=sys.exc_info()))
+    entry = q.get_nowait()
+    assert entry.exc_info is None and "ValueError: boom" in entry.exc_text
+
+def test_file_logger_writes_the_bare_messages(tmp_path):
+    path = tmp_path / "trace.log"
+    logger = file_logger("test.trace", str(path))
+    logger.info('{"id": %d}', 1)
+
+    # Stopping the listener drains its queue into the file
+    handler = logger.handlers.pop()
+    channel = next(c for c in logutil._channels if c[0] is handler)
+    channel[2].stop()
+    channel[2] = None
+    channel[1][0].close()
+    assert path.read_text() == '{"id": 1}\n'
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from modules.rolling import RollingMetrics, check_windows
+from modules.evaluator import ModelEvaluator
+from modules.scaler import IncrementalScaler
+
+def brute_force(pairs, threshold):
+    actual = np.array([a for a, _ in pairs])
+    predicted = np.array([p for _, p in pairs])
+    ape = np.abs((predicted - actual) / actual)
+    return {
+        "num_samples": len(pairs),
+        "accuracy": round(np.count_nonzero(ape <= threshold) / len(pairs) * 100, 2),
+        "mae": np.mean(np.abs(predicted - actual)),
+        "rmse": np.sqrt(np.mean((predicted - actual) ** 2)),
+        "mape": np.mean(ape) * 100,
+        "bias": np.mean(predicted - actual),
+    }
+
+def test_rolling_windows_match_a_full_recomputation():
+    rng = np.random.default_rng(0)
+    metrics = RollingMetrics([7, 50], [30])
+    pairs = []
+    for i in range(123):
+        actual, predicted = float(rng.uniform(50, 150)), float(rng.uniform(50, 150))
+        pairs.append((actual, predicted))
+        metrics.add(actual, predicted, 0.2, ts=1000.0 + i)
+
+    report = metrics.report(now=1122.5)
+    # The time window keeps the entries of the last 30 seconds: ts in (1092.5, 1122.5]
+    for name, recent in (("last_7", pairs[-7:]), ("last_50", pairs[-50:]), ("last_30s", pairs[-30:])):
+        expected = brute_force(recent, 0.2)
+        assert report[name]["num_samples"] == expected["num_samples"]
+        assert report[name]["accuracy"] == expected["accuracy"]
+        for key in ("mae", "rmse", "mape", "bias"):
+            assert report[name][key] == pytest.approx(expected[key])
+
+    assert metrics.report(now=2000.0)["last_30s"] == {"num_samples": 0}
+    assert metrics.get_max_count() == 50
+
+def test_rolling_replayed_entries_skip_the_time_windows():
+    metrics = RollingMetrics([10], [60])
+    metrics.add(100.0, 90.0, 0.2)
+    report = metrics.report()
+    assert report["last_10"]["num_samples"] == 1
+    assert report["last_60s"]["num_samples"] == 0
+
+def test_window_sizes_are_checked():
+    check_windows(None, None)
+    check_windows([1, 100], [3600])
+    for sizes in ([0], [-1], [2.5], [True], "10", 10):
+        with pytest.raises(ValueError):
+            check_windows(sizes, None)
+        with pytest.raises(ValueError):
+            check_windows(None, sizes)
+
+def test_accuracy_curve_matches_the_threshold_counts():
+    rng = np.random.default_rng(1)
+    actual = rng.uniform(50, 150, 200)
+    sequence = actual.reshape(-1, 1)
+    prediction = actual * rng.uniform(0.5, 1.5, 200)
+    prediction[:5] = -1          # no prediction yet
+    sequence[10, 0] = 0.0        # relative error undefined: never correct
+
+    with np.errstate(divide="ignore"):
+        errors = np.abs((prediction[5:] - sequence[5:, 0]) / sequence[5:, 0])
+    evaluator = ModelEvaluator()
+    thresholds = [0.0, 0.05, 0.2, 0.37, 1.0]
+    curve = evaluator.accuracy_curve(sequence, prediction, 0, thresholds)
+    assert curve["num_samples"] == 195
+    for t, accuracy in zip(thresholds, curve["accuracy"]):
+        assert accuracy == round(np.count_nonzero(errors <= t) / 195 * 100, 2)
+
+    # Without thresholds: the accuracy CDF at up to points of the sorted errors
+    cdf = evaluator.accuracy_curve(sequence, prediction, 0, points=20)
+    assert len(cdf["thresholds"]) == 20
+    assert np.all(np.diff(cdf["thresholds"]) >= 0) and np.all(np.diff(cdf["accuracy"]) >= 0)
+
+    assert "error" in evaluator.accuracy_curve([], [], 0)
+
+def test_accuracy_curve_agrees_with_the_metrics():
+    sequence = np.array([[100.0], [100.0], [100.0], [100.0]])
+    prediction = np.array([110.0, 130.0, 80.0, 100.0])
+    evaluator = ModelEvaluator(threshold=0.2)
+    metrics = evaluator.calculate_metrics(sequence, prediction, 0)
+    curve = evaluator.accuracy_curve(sequence, prediction, 0, [0.2])
+    assert curve["accuracy"][0] == metrics["accuracy"] == 75.0
+
+def test_scaler_matches_numpy():
+    rng = np.random.default_rng(2)
+    rows = rng.normal(10, 3, (1000, 3))
+    rows[:, 2] = 5.0
+
+    one_by_one = IncrementalScaler()
+    for row in rows[:400]:
+        one_by_one.add(row)
+    one_by_one.add_batch(rows[400:])
+    batched = IncrementalScaler.of(rows)
+
+    for scaler in (one_by_one, batched):
+        mean, scale = scaler.snapshot()
+        assert scaler.count == 1000
+        assert np.allclose(mean, rows.mean(axis=0), rtol=1e-6)
+        assert np.allclose(scale[:2], rows[:, :2].std(axis=0), rtol=1e-5)
+        # A constant column is only centered
+        assert scale[2] == 1.0
+
+    assert IncrementalScaler().snapshot() is None
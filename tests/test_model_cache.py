@@ -0,0 +1,52 @@
+import os
+import ai
+from conftest import make_model, wait_until
+
+def test_least_recently_used_model_is_evicted_and_reloaded(create_app):
+    client = create_app(max_models=2)
+    for name in ("a", "b", "c"):
+        make_model(client, name)
+        client.put("/{}/testing".format(name), json={"value": [5.0]})
+
+    assert list(ai.ai.resident) == ["b", "c"]
+    assert "a" not in ai.ai.models and "a" in ai.ai.catalog
+    assert sorted(ai.ai.get_model_names()) == ["a", "b", "c"]
+
+    # Loaded again on use (evicting b), with its datasets, version and window
+    assert client.put("/a/testing", json={"value": [6.0]}).get_json()["prediction"] == 6.0
+    assert list(ai.ai.resident) == ["c", "a"]
+    assert client.get("/a/testing").get_json()["num"] == 2
+    assert client.get("/a").get_json()["version"] == 1
+    assert client.get("/a/result").get_json()["prediction"] == [5.0, 6.0]
+
+def test_shadow_models_are_evicted_with_their_primary(create_app):
+    client = create_app(max_models=1)
+    make_model(client, "a")
+    client.post("/a/shadows", json={"name": "s", "algorithm": "stub"})
+    assert wait_until(lambda: not ai.ai.is_busy("a"))
+    make_model(client, "b")
+
+    assert "a" in ai.ai.catalog and "a@s" in ai.ai.catalog
+    assert set(client.get("/a/shadows").get_json()["models"]) == {"primary", "s"}
+    assert "b" in ai.ai.catalog
+
+def test_model_in_use_is_not_deleted(client):
+    make_model(client, "m")
+    ai.ai.pin("m")
+    try:
+        ret = client.delete("/m").get_json()
+        assert ret["opcode"] == "failure" and "in use" in ret["reason"]
+        assert ai.ai.has_model("m")
+    finally:
+        ai.ai.unpin("m")
+    assert client.delete("/m").get_json()["opcode"] == "success"
+    assert client.delete("/m").get_json()["opcode"] == "failure"
+
+def test_evicted_model_is_deleted_from_the_disk(create_app):
+    client = create_app(max_models=1)
+    make_model(client, "a")
+    make_model(client, "b")
+    assert "a" in ai.ai.catalog
+    assert client.delete("/a").get_json()["opcode"] == "success"
+    assert not any(f.startswith("a.") for f in os.listdir(ai.ai.datadir))
+    assert client.get("/a").get_json()["name"] == "a is not a generated model"
@@ -0,0 +1,56 @@
+import json
+import threading
+import zlib
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+from werkzeug.test import Client
+from putils.prefork import Router, affinity
+
+def test_affinity_keeps_shadow_models_with_their_primary():
+    for workers in (1, 2, 5):
+        for name in ("m", "house-1", "power"):
+            assert affinity(name, workers) == zlib.crc32(name.encode("utf-8")) % workers
+            assert affinity(name + "@shadow", workers) == affinity(name, workers)
+
+# Workers answering with their index, and the router in front of them
+@pytest.fixture
+def router():
+    servers = []
+    for index in range(3):
+        app = Flask("worker{}".format(index))
+
+        @app.route("/<path:path>", methods=["GET", "POST", "PUT", "DELETE"])
+        def echo(path, index=index):
+            return jsonify(worker=index, path=path, method=request.method, body=request.get_data(as_text=True))
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+    yield Client(Router([s.server_port for s in servers]))
+    for server in servers:
+        server.shutdown()
+
+def test_workers_publishes_the_ports_and_the_owner(router):
+    ret = json.loads(router.get("/workers").data)
+    assert ret["opcode"] == "success" and ret["affinity"] == "crc32" and len(ret["workers"]) == 3
+    assert "owner" not in ret
+
+    ret = json.loads(router.get("/workers?model=house-7@s").data)
+    assert ret["owner"] == affinity("house-7", 3)
+    assert ret["port"] == ret["workers"][ret["owner"]]
+
+def test_requests_are_proxied_to_the_owner(router):
+    for name in ("a", "b", "c", "d", "a@s"):
+        response = router.put("/{}/testing".format(name), data='{"value": [1]}')
+        ret = json.loads(response.data)
+        assert ret["worker"] == affinity(name, 3)
+        assert ret["path"] == "{}/testing".format(name) and ret["body"] == '{"value": [1]}'
+        assert "proxy;dur=" in response.headers["Server-Timing"]
+
+def test_unavailable_worker_is_a_bad_gateway():
+    router = Client(Router([1]))
+    response = router.get("/m")
+    assert response.status_code == 502
+    assert json.loads(response.data)["opcode"] == "failure"
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+import ai
+from modules.retention import make_policy, Retainer, History, MIN_SLACK
+from modules.dataset_log import DatasetLog
+from modules.data_manager import DataManager
+from conftest import make_model
+
+VALUES = [100.0 + (v % 7) * 10 for v in range(200)]
+
+def feed(client, name, values):
+    for v in values:
+        assert client.put("/{}/testing".format(name), json={"value": [v]}).get_json()["opcode"] == "success"
+
+def test_make_policy():
+    assert make_policy(None) is None
+    assert make_policy({"spill": True}) is None
+    assert make_policy({"rows": 10}).to_dict() == {"rows": 10, "seconds": None, "spill": False}
+    for config in ({"rows": 10, "days": 1}, {"rows": -1}, {"seconds": -5}):
+        with pytest.raises(ValueError):
+            make_policy(config)
+
+def test_retained_rows_are_bounded_and_metrics_cover_the_history(client):
+    make_model(client, "all")
+    make_model(client, "kept", retention={"rows": 10})
+    feed(client, "all", VALUES)
+    feed(client, "kept", VALUES)
+
+    history = client.get("/kept/history").get_json()
+    assert history["retention"] == {"rows": 10}
+    assert history["retained"] <= 10 + MIN_SLACK
+    assert history["evicted"] + history["retained"] == len(VALUES)
+    assert sum(b["num"] for b in history["aggregates"]) == history["evicted"]
+    assert len(ai.ai.testing["kept"]) == history["retained"]
+    assert len(ai.ai.results["kept"]) == history["retained"] + 1
+
+    # The scalar metrics are the ones of the whole stream
+    full = client.get("/all/detailed_evaluation").get_json()["metrics"]
+    bounded = client.get("/kept/detailed_evaluation").get_json()["metrics"]
+    for key in ("num_samples", "accuracy", "correct_predictions"):
+        assert bounded[key] == full[key]
+    for key in ("mae", "rmse", "mape", "mean_error"):
+        assert bounded[key] == pytest.approx(full[key])
+    assert client.get("/kept/result").get_json()["accuracy"] == client.get("/all/result").get_json()["accuracy"]
+    assert client.get("/kept/accuracy_curve?thresholds=0.1,0.2").get_json()["accuracy"] == \
+        client.get("/all/accuracy_curve?thresholds=0.1,0.2").get_json()["accuracy"]
+    assert client.get("/kept/testing").get_json()["evicted"] == history["evicted"]
+
+def test_evicted_rows_are_spilled(client):
+    make_model(client, "m", retention={"rows": 10, "spill": True})
+    feed(client, "m", VALUES)
+
+    history = client.get("/m/history").get_json()
+    assert history["segments"] == ["m.spill.0.log"]
+    segment = DatasetLog(os.path.join(ai.ai.datadir, "m.spill.0.log"), 2)
+    rows = segment.rows()
+    # Each row: the testing instance, then the prediction about it (-1 for the first one)
+    assert len(rows) == history["evicted"]
+    assert rows[:, 0].tolist() == VALUES[:len(rows)]
+    assert rows[0, 1] == -1 and rows[1:, 1].tolist() == VALUES[:len(rows) - 1]
+    segment.close()
+
+    assert client.delete("/m").get_json()["opcode"] == "success"
+    assert not os.path.exists(os.path.join(ai.ai.datadir, "m.spill.0.log"))
+
+def test_time_retention(tmp_path):
+    retainer = Retainer(make_policy({"seconds": 10}), History())
+    testing, results = DataManager(None, 1), DataManager()
+    for i in range(200):
+        testing.add_data([float(i)])
+        results.add_data(float(i))
+        retainer.observe(now=1000.0 + i)
+        retainer.trim(testing, results, 0, now=1000.0 + i)
+
+    # Trimmed by at least the slack at a time, so up to MIN_SLACK older rows are still there
+    assert len(testing) == len(results)
+    assert 10 <= len(testing) <= 10 + MIN_SLACK
+    assert retainer.history.evicted + len(testing) == 200
+    assert testing.get_data()[-1] == [199.0]
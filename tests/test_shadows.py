@@ -0,0 +1,50 @@
+import ai
+from conftest import make_model, wait_until
+
+def test_shadow_gets_the_testing_instances(client):
+    make_model(client, "m")
+    ret = client.post("/m/shadows", json={"name": "b", "algorithm": "stub"}).get_json()
+    assert ret == {"opcode": "success", "model": "m@b"}
+    assert wait_until(lambda: ai.ai.models["m@b"].is_trained())
+
+    for v in (1.0, 2.0, 4.0):
+        # The predictions of the shadow model are not returned
+        assert client.put("/m/testing", json={"value": [v]}).get_json()["prediction"] == v
+    assert wait_until(lambda: len(ai.ai.testing["m@b"]) == 3)
+
+    report = client.get("/m/shadows").get_json()["models"]
+    assert set(report) == {"primary", "b"}
+    assert report["primary"]["model"] == "m"
+    assert report["b"]["model"] == "m@b" and report["b"]["trained"]
+    assert report["b"]["dropped"] == 0
+    assert report["b"]["metrics"]["num_samples"] == report["primary"]["metrics"]["num_samples"]
+
+def test_full_backlog_drops_the_oldest_instances(client, monkeypatch):
+    monkeypatch.setattr(ai, "SHADOW_BACKLOG", 2)
+    make_model(client, "m")
+    assert client.post("/m/shadows", json={"name": "b", "algorithm": "stub"}).get_json()["opcode"] == "success"
+
+    # Keep the shadow model busy so its backlog fills up
+    with ai.ai.shadow_locks["m@b"]:
+        for v in range(1, 6):
+            ai.ai.feed_shadows("m", [float(v)])
+        assert list(ai.ai.shadow_queues["m@b"]) == [[4.0], [5.0]]
+    assert ai.ai.get_shadow_report("m")["b"]["dropped"] == 3
+
+def test_at_sign_is_reserved_for_the_shadow_models(client):
+    ret = client.post("/a@b", json={"algorithm": "stub"}).get_json()
+    assert ret["opcode"] == "failure" and "@" in ret["reason"]
+
+    make_model(client, "m")
+    assert client.post("/m/shadows", json={"name": "x@y", "algorithm": "stub"}).get_json()["opcode"] == "failure"
+    assert client.post("/m/shadows", json={"name": "b", "algorithm": "stub"}).get_json()["opcode"] == "success"
+    assert client.post("/m/shadows", json={"name": "b", "algorithm": "stub"}).get_json()["opcode"] == "failure"
+    assert client.post("/m@b/shadows", json={"name": "c", "algorithm": "stub"}).get_json()["opcode"] == "failure"
+
+def test_shadow_is_deleted_with_its_primary(client):
+    make_model(client, "m")
+    client.post("/m/shadows", json={"name": "b", "algorithm": "stub"})
+    assert wait_until(lambda: not ai.ai.is_busy("m"))
+    assert client.delete("/m").get_json()["opcode"] == "success"
+    assert "m@b" not in ai.ai.models
+    assert ai.ai.get_model_names() == []